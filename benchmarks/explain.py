@@ -0,0 +1,190 @@
+"""
+Query plan checks: runs every crud access path, EXPLAINs each statement it sent, and flags full scans.
+"""
+import random
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from sql_app import crud, models, schemas
+
+from .seed import FIRST_NAMES, LAST_NAMES
+
+# Statements worth explaining, inserts and transaction control have no access path
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+def _is_table(name: str):
+    """
+    Scans of subquery results (anon_1, <derived2>) are fine, scans of tables and their aliases (plans_1) are not.
+    """
+    return re.sub(r"_\d+$", "", name) in models.Base.metadata.tables
+
+
+def _checks(rng: random.Random, plans: int, members: int):
+    """
+    name: (callable, reason a full scan is expected, or None). Writes undo themselves or rewrite the same values.
+    """
+
+    def update_member(db: Session):
+        member_id = rng.randint(1, members)
+        member = crud.get_member(db, member_id)
+        crud.update_member(db, schemas.MemberUpdate(first_name=member.first_name, last_name=member.last_name,
+                                                    email=member.email, plan_id=member.plan_id), member_id)
+
+    def patch_member(db: Session):
+        member_id = rng.randint(1, members)
+        version = crud.get_member_version(db, member_id)
+        crud.patch_member(db, schemas.MemberPatch(plan_id=crud.get_member(db, member_id).plan_id), member_id, [version])
+
+    def create_and_delete_member(db: Session):
+        member = crud.create_member(db, schemas.MemberCreate(email=f"explain{rng.random()}@bench.example",
+                                                             plan_id=rng.randint(1, plans)))
+        crud.delete_member(db, member.ID)
+
+    def upsert_member(db: Session):
+        member = crud.get_member(db, rng.randint(1, members))
+        crud.upsert_member(db, schemas.MemberCreate(first_name=member.first_name, last_name=member.last_name,
+                                                    email=member.email, plan_id=member.plan_id))
+
+    def upsert_members(db: Session):
+        rows = crud.get_members_by_ids(db, [rng.randint(1, members) for _ in range(100)])
+        crud.upsert_members(db, [schemas.MemberCreate(first_name=member.first_name, last_name=member.last_name,
+                                                      email=member.email, plan_id=member.plan_id) for member in rows])
+
+    def update_plan(db: Session):
+        plan_id = rng.randint(1, plans)
+        plan = crud.get_plan(db, plan_id)
+        crud.update_plan(db, schemas.PlanUpdate(name=plan.name, value=plan.value, description=plan.description), plan_id)
+
+    def patch_plan(db: Session):
+        plan_id = rng.randint(1, plans)
+        version = crud.get_table_version(db, models.Plan.__tablename__)
+        crud.patch_plan(db, schemas.PlanPatch(value=crud.get_plan(db, plan_id).value), plan_id, [version])
+
+    def create_and_delete_plan(db: Session):
+        plan = crud.create_plan(db, schemas.PlanCreate(name=f"Explain {rng.randint(0, 10**6)}", value=10.0))
+        crud.delete_plan(db, plan.ID)
+
+    first_page = "the first page reads the primary key in order and stops at the limit"
+    return {
+        "get_table_version": (lambda db: crud.get_table_version(db, models.Member.__tablename__), None),
+        "get_last_change_seq": (crud.get_last_change_seq, None),
+        "get_changes": (lambda db: crud.get_changes(db, rng.randint(0, members), 100), None),
+        "get_member_version": (lambda db: crud.get_member_version(db, rng.randint(1, members)), None),
+        "get_member": (lambda db: crud.get_member(db, rng.randint(1, members)), None),
+        "get_member+plan": (lambda db: crud.get_member(db, rng.randint(1, members), expand_plan=True), None),
+        "get_member_by_name": (lambda db: crud.get_member_by_name(db, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)), None),
+        "search_members": (lambda db: crud.search_members(db, rng.choice(LAST_NAMES)[:3], limit=11), None),
+        "search_members+after": (lambda db: crud.search_members(db, rng.choice(FIRST_NAMES)[:3], rng.randint(1, members), 11), None),
+        "get_members": (lambda db: crud.get_members(db, None, 51), first_page),
+        "get_members+after": (lambda db: crud.get_members(db, rng.randint(1, members), 51), None),
+        "get_members+plan": (lambda db: crud.get_members(db, rng.randint(1, members), 51, expand_plan=True), None),
+        "get_member_rows": (lambda db: crud.get_member_rows(db, rng.randint(1, members), 51), None),
+        "get_members_by_ids": (lambda db: crud.get_members_by_ids(db, [rng.randint(1, members) for _ in range(100)]), None),
+        "get_existing_emails": (lambda db: crud.get_existing_emails(
+            db, [f"member{rng.randint(1, members)}@bench.example" for _ in range(100)]), None),
+        "stream_members": (lambda db: sum(1 for _ in crud.stream_members(db)), "exports read every member"),
+        "update_member": (update_member, None),
+        "patch_member": (patch_member, None),
+        "create_member+delete_member": (create_and_delete_member, None),
+        "upsert_member": (upsert_member, None),
+        "upsert_members": (upsert_members, None),
+        "get_plans": (lambda db: crud.get_plans(db, None, 101), first_page),
+        "get_plans+after": (lambda db: crud.get_plans(db, rng.randint(1, plans), 101), None),
+        "get_all_plans": (crud.get_all_plans, "the plan catalog loads every plan"),
+        "stream_plans": (lambda db: sum(1 for _ in crud.stream_plans(db)), "exports read every plan"),
+        "get_plan": (lambda db: crud.get_plan(db, rng.randint(1, plans)), None),
+        "get_plan_by_name": (lambda db: crud.get_plan_by_name(db, f"Plan {rng.randint(1, plans)}"), None),
+        "get_plan_members": (lambda db: crud.get_plan_members(db, rng.randint(1, plans), None, 51), None),
+        "get_plan_members+after": (lambda db: crud.get_plan_members(db, rng.randint(1, plans), rng.randint(1, members), 51), None),
+        "get_plan_member_rows": (lambda db: crud.get_plan_member_rows(db, rng.randint(1, plans), None, 51), None),
+        "has_members": (lambda db: crud.has_members(db, rng.randint(1, plans)), None),
+        "get_member_charges": (lambda db: crud.get_member_charges(db, rng.randint(1, members), rng.randint(1, members) + 1000), None),
+        "get_billed_chunks": (lambda db: crud.get_billed_chunks(db, "2026-10"), None),
+        "get_billing_progress": (lambda db: crud.get_billing_progress(db, "2026-10"), None),
+        "get_plan_stats": (crud.get_plan_stats, "the dashboard reads every plan's counter"),
+        "reconcile_plan_stats": (crud.reconcile_plan_stats, "rebuilding the counters counts every member"),
+        "update_plan": (update_plan, None),
+        "patch_plan": (patch_plan, None),
+        "create_plan+delete_plan": (create_and_delete_plan, None),
+    }
+
+
+def _capture(engine: Engine, session_factory, fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(EXPLAINED):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with session_factory() as db:
+            fn(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def _sqlite_plan(connection, statement, parameters):
+    """
+    EXPLAIN QUERY PLAN details. "SCAN t" reads the whole table, or a whole index with "USING ... INDEX".
+    """
+    details = [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    scans = [detail.split()[1] for detail in details if detail.startswith("SCAN ")]
+    return details, [table for table in scans if _is_table(table)]
+
+
+def _mysql_plan(connection, statement, parameters):
+    """
+    EXPLAIN rows. Access type ALL reads the whole table, index reads a whole index.
+    """
+    rows = [row._mapping for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+    details = [f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}".rstrip()
+               for row in rows]
+    scans = [row["table"] for row in rows if row["type"] in ("ALL", "index") and row["table"]]
+    return details, [table for table in scans if _is_table(table)]
+
+
+def run(engine: Engine, session_factory, plans: int, members: int, seed: int = 0):
+    """
+    One entry per check: its statements' plans, the tables it scans, and whether that is a regression.
+    """
+    explain = _mysql_plan if engine.dialect.name == "mysql" else _sqlite_plan
+    rng = random.Random(seed)
+    report = {}
+    for name, (fn, expected_scan) in _checks(rng, plans, members).items():
+        statements = _capture(engine, session_factory, fn)
+        details, scans = [], []
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                statement_details, statement_scans = explain(connection, statement, parameters)
+                details.append({"statement": " ".join(statement.split()), "plan": statement_details})
+                scans.extend(statement_scans)
+        report[name] = {
+            "statements": details,
+            "scans": sorted(set(scans)),
+            "expected_scan": expected_scan,
+            "regression": bool(scans) and expected_scan is None,
+        }
+    return report
+
+
+def format_report(report: dict, verbose: bool = False):
+    lines = []
+    for name, check in report.items():
+        if check["regression"]:
+            verdict = f"FULL SCAN of {', '.join(check['scans'])}"
+        elif check["scans"]:
+            verdict = f"scan expected: {check['expected_scan']}"
+        else:
+            verdict = "ok"
+        lines.append(f"{name:<30} {verdict}")
+        if verbose or check["regression"]:
+            for statement in check["statements"]:
+                lines.append(f"    {statement['statement']}")
+                lines.extend(f"      {detail}" for detail in statement["plan"])
+    return "\n".join(lines)
@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import random
+import time
+
+import httpx
+
+from sql_app import pagination
+
+from . import results
+from .seed import FIRST_NAMES, LAST_NAMES
+
+
+class LoadState:
+    """
+    What the driver knows about the seeded data, plus the rows it created itself.
+    """
+
+    def __init__(self, plans: int, members: int, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.plans = plans
+        self.members = members
+        self.created_members = []
+        self.created_plans = []
+        self.counter = itertools.count()
+
+    def member_id(self):
+        return self.rng.randint(1, self.members)
+
+    def plan_id(self):
+        return self.rng.randint(1, self.plans)
+
+    def upsert_email(self):
+        # A small pool, so upserts both create members and update the ones an earlier upsert created
+        return f"upsert{self.rng.randint(1, 500)}@bench.example"
+
+    def new_member(self):
+        return {
+            "first_name": self.rng.choice(FIRST_NAMES),
+            "last_name": self.rng.choice(LAST_NAMES),
+            "email": f"load{next(self.counter)}@bench.example",
+            "plan_id": self.plan_id(),
+        }
+
+
+async def list_members(client, state):
+    return await client.get("/members", params={"limit": 50})
+
+async def list_members_with_plans(client, state):
+    return await client.get("/members", params={"limit": 50, "expand": "plan"})
+
+async def list_members_deep(client, state):
+    return await client.get("/members", params={"limit": 50, "cursor": pagination.encode_cursor(state.member_id())})
+
+async def get_member(client, state):
+    return await client.get(f"/members/{state.member_id()}")
+
+async def batch_get_members(client, state):
+    return await client.post("/members/batch-get", json={"ids": [state.member_id() for _ in range(100)]})
+
+async def get_member_by_name(client, state):
+    return await client.get(f"/membersByName/{state.rng.choice(FIRST_NAMES)}/{state.rng.choice(LAST_NAMES)}")
+
+async def search_members(client, state):
+    return await client.get("/members/search", params={"q": state.rng.choice(LAST_NAMES)[:3]})
+
+async def export_members(client, state):
+    return await client.get("/members/export")
+
+async def list_plans(client, state):
+    return await client.get("/plans")
+
+async def get_plan(client, state):
+    return await client.get(f"/plans/{state.plan_id()}")
+
+async def get_plan_by_name(client, state):
+    return await client.get(f"/plansByName/Plan {state.plan_id()}")
+
+async def plan_stats(client, state):
+    return await client.get("/plans/stats")
+
+async def plan_members(client, state):
+    return await client.get(f"/plans/{state.plan_id()}/members", params={"limit": 50})
+
+async def export_plans(client, state):
+    return await client.get("/plans/export")
+
+async def get_metrics(client, state):
+    return await client.get("/metrics")
+
+async def create_member(client, state):
+    response = await client.post("/members", json=state.new_member())
+    if response.status_code == 201:
+        state.created_members.append(response.json()["ID"])
+    return response
+
+async def create_members_bulk(client, state):
+    return await client.post("/members/bulk", json=[state.new_member() for _ in range(50)])
+
+async def upsert_member(client, state):
+    member = state.new_member()
+    del member["email"]
+    return await client.put(f"/members/by-email/{state.upsert_email()}", json=member)
+
+async def upsert_members_bulk(client, state):
+    members = [dict(state.new_member(), email=state.upsert_email()) for _ in range(50)]
+    return await client.put("/members/by-email", json=members)
+
+async def update_member(client, state):
+    member_id = state.rng.choice(state.created_members) if state.created_members else state.member_id()
+    return await client.put(f"/members/{member_id}", json=state.new_member())
+
+async def patch_member(client, state):
+    member_id = state.rng.choice(state.created_members) if state.created_members else state.member_id()
+    return await client.patch(f"/members/{member_id}", json={"first_name": state.rng.choice(FIRST_NAMES)})
+
+async def delete_member(client, state):
+    if state.created_members:
+        return await client.delete(f"/members/{state.created_members.pop()}")
+    return await client.delete(f"/members/{state.member_id()}")
+
+async def update_plan(client, state):
+    plan_id = state.plan_id()
+    return await client.put(f"/plans/{plan_id}", json={"name": f"Plan {plan_id}", "value": round(state.rng.uniform(50, 300), 2),
+                                                       "description": f"Benchmark plan {plan_id}"})
+
+async def patch_plan(client, state):
+    return await client.patch(f"/plans/{state.plan_id()}", json={"value": round(state.rng.uniform(50, 300), 2)})
+
+async def create_plan(client, state):
+    response = await client.post("/plans", json={"name": f"Load {next(state.counter)}", "value": 99.9, "description": "load"})
+    if response.status_code == 201:
+        state.created_plans.append(response.json()["ID"])
+    return response
+
+async def delete_plan(client, state):
+    plan_id = state.created_plans.pop() if state.created_plans else state.plan_id()
+    return await client.delete(f"/plans/{plan_id}")
+
+
+# (weight, operation): roughly nine reads for each write, like the front desk and kiosk traffic
+OPERATIONS = [
+    (10, list_members),
+    (3, list_members_with_plans),
+    (5, list_members_deep),
+    (20, get_member),
+    (2, batch_get_members),
+    (5, get_member_by_name),
+    (8, search_members),
+    (1, export_members),
+    (8, list_plans),
+    (10, get_plan),
+    (4, get_plan_by_name),
+    (8, plan_members),
+    (2, plan_stats),
+    (1, export_plans),
+    (1, get_metrics),
+    (5, create_member),
+    (1, create_members_bulk),
+    (2, upsert_member),
+    (1, upsert_members_bulk),
+    (4, update_member),
+    (2, patch_member),
+    (2, delete_member),
+    (1, update_plan),
+    (1, patch_plan),
+    (1, create_plan),
+    (1, delete_plan),
+]
+
+
+async def run(app, state: LoadState, requests: int, concurrency: int):
+    """
+    Sends requests to the ASGI app in-process, concurrency at a time, and summarizes latencies per operation.
+    """
+    weights = [weight for weight, _ in OPERATIONS]
+    operations = [operation for _, operation in OPERATIONS]
+    plan = state.rng.choices(operations, weights=weights, k=requests)
+    queue = iter(plan)
+    latencies = {operation.__name__: [] for operation in operations}
+    errors = {operation.__name__: 0 for operation in operations}
+
+    async def worker(client):
+        for operation in queue:
+            started_at = time.perf_counter()
+            try:
+                response = await operation(client, state)
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies[operation.__name__].append(time.perf_counter() - started_at)
+            errors[operation.__name__] += failed
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+
+    summary = {name: results.summarize(values, elapsed, errors[name]) for name, values in latencies.items() if values}
+    summary["total"] = results.summarize([value for values in latencies.values() for value in values],
+                                         elapsed, sum(errors.values()))
+    return summary
@@ -0,0 +1,90 @@
+import itertools
+import random
+import time
+
+from sqlalchemy.orm import Session
+
+from sql_app import crud, models, schemas
+
+from . import results
+from .seed import FIRST_NAMES, LAST_NAMES
+
+
+def _benchmarks(rng: random.Random, plans: int, members: int):
+    """
+    One callable per crud function. Writes undo themselves, so every iteration sees the same data.
+    """
+    counter = itertools.count()
+
+    def new_member():
+        return schemas.MemberCreate(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                                    email=f"micro{next(counter)}@bench.example", plan_id=rng.randint(1, plans))
+
+    def create_and_delete_member(db: Session):
+        member = crud.create_member(db, new_member())
+        crud.delete_member(db, member.ID)
+
+    def create_members(db: Session):
+        ids = crud.create_members(db, [new_member() for _ in range(50)])
+        # Through crud, so the plan member counters go back down with the rows
+        for member_id in ids.values():
+            crud.delete_member(db, member_id)
+
+    def update_member(db: Session):
+        member_id = rng.randint(1, members)
+        member = crud.get_member(db, member_id)
+        crud.update_member(db, schemas.MemberUpdate(first_name=member.first_name, last_name=member.last_name,
+                                                    email=member.email, plan_id=member.plan_id), member_id)
+
+    def create_and_delete_plan(db: Session):
+        plan = crud.create_plan(db, schemas.PlanCreate(name=f"Micro {next(counter)}", value=10.0, description="micro"))
+        crud.delete_plan(db, plan.ID)
+
+    def update_plan(db: Session):
+        plan_id = rng.randint(1, plans)
+        plan = crud.get_plan(db, plan_id)
+        crud.update_plan(db, schemas.PlanUpdate(name=plan.name, value=plan.value, description=plan.description), plan_id)
+
+    return {
+        "get_table_version": lambda db: crud.get_table_version(db, models.Plan.__tablename__),
+        "get_member": lambda db: crud.get_member(db, rng.randint(1, members)),
+        "get_member_by_name": lambda db: crud.get_member_by_name(db, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+        "search_members": lambda db: crud.search_members(db, rng.choice(LAST_NAMES)[:3], limit=11),
+        "get_members": lambda db: crud.get_members(db, rng.randint(1, members), 51),
+        "get_members+plan": lambda db: crud.get_members(db, rng.randint(1, members), 51, expand_plan=True),
+        "get_members_by_ids": lambda db: crud.get_members_by_ids(db, [rng.randint(1, members) for _ in range(100)]),
+        "stream_members": lambda db: sum(1 for _ in crud.stream_members(db)),
+        "get_existing_emails": lambda db: crud.get_existing_emails(
+            db, [f"member{rng.randint(1, members)}@bench.example" for _ in range(100)]),
+        "create_member+delete_member": create_and_delete_member,
+        "create_members": create_members,
+        "update_member": update_member,
+        "get_plans": lambda db: crud.get_plans(db, None, 101),
+        "get_all_plans": crud.get_all_plans,
+        "stream_plans": lambda db: sum(1 for _ in crud.stream_plans(db)),
+        "get_plan": lambda db: crud.get_plan(db, rng.randint(1, plans)),
+        "get_plan_by_name": lambda db: crud.get_plan_by_name(db, f"Plan {rng.randint(1, plans)}"),
+        "get_plan_members": lambda db: crud.get_plan_members(db, rng.randint(1, plans), None, 51),
+        "has_members": lambda db: crud.has_members(db, rng.randint(1, plans)),
+        "create_plan+delete_plan": create_and_delete_plan,
+        "update_plan": update_plan,
+    }
+
+
+def run(session_factory, plans: int, members: int, iterations: int, seed: int = 0):
+    """
+    Times each crud function on its own session, so identity map hits do not hide the queries.
+    """
+    rng = random.Random(seed)
+    summary = {}
+    for name, benchmark in _benchmarks(rng, plans, members).items():
+        iterations_for = max(iterations // 20, 1) if name.startswith("stream_members") else iterations
+        latencies = []
+        started_at = time.perf_counter()
+        for _ in range(iterations_for):
+            with session_factory() as db:
+                call_started_at = time.perf_counter()
+                benchmark(db)
+                latencies.append(time.perf_counter() - call_started_at)
+        summary[name] = results.summarize(latencies, time.perf_counter() - started_at)
+    return summary
@@ -0,0 +1,79 @@
+import json
+import math
+
+
+def percentile(sorted_values: list[float], fraction: float):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int = 0):
+    """
+    Latencies and elapsed are in seconds, the summary is in milliseconds and requests per second.
+    """
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "rps": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def write(path: str, results: dict):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def read(path: str):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _sections(results: dict):
+    for section in ("load", "micro", "serialization", "writes"):
+        for name, summary in results.get(section, {}).items():
+            yield f"{section}:{name}", summary
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = 0.10):
+    """
+    Returns one row per benchmark present in both runs. A row is a regression when p95 latency
+    grew, or throughput dropped, by more than threshold (a fraction of the baseline).
+    """
+    candidate_sections = dict(_sections(candidate))
+    rows = []
+    for name, old in _sections(baseline):
+        new = candidate_sections.get(name)
+        if new is None:
+            continue
+        p95_change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        rps_change = (new["rps"] - old["rps"]) / old["rps"] if old["rps"] else 0.0
+        rows.append({
+            "name": name,
+            "old_p95_ms": old["p95_ms"],
+            "new_p95_ms": new["p95_ms"],
+            "p95_change": p95_change,
+            "old_rps": old["rps"],
+            "new_rps": new["rps"],
+            "rps_change": rps_change,
+            "regression": p95_change > threshold or rps_change < -threshold,
+        })
+    return rows
+
+
+def format_comparison(rows: list[dict]):
+    lines = [f"{'benchmark':<45} {'p95 ms':>21} {'change':>8} {'req/s':>21} {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['name']:<45} {row['old_p95_ms']:>9.3f} -> {row['new_p95_ms']:>8.3f} {row['p95_change']:>+8.1%} "
+                     f"{row['old_rps']:>9.1f} -> {row['new_rps']:>8.1f} {row['rps_change']:>+8.1%}{flag}")
+    return "\n".join(lines)
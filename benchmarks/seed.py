@@ -0,0 +1,45 @@
+import random
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from sql_app import crud, migrate, models
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+               "Larissa", "Marcio", "Maciel", "Natalia", "Otavio", "Paula", "Rafael", "Sofia", "Thiago", "Vitoria"]
+LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+              "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa"]
+
+
+def member_row(rng: random.Random, index: int, plan_count: int):
+    return {
+        "first_name": rng.choice(FIRST_NAMES),
+        "last_name": rng.choice(LAST_NAMES),
+        "email": f"member{index}@bench.example",
+        "plan_id": rng.randint(1, plan_count),
+    }
+
+
+def seed(engine: Engine, plans: int, members: int, chunk_size: int = 10000, seed: int = 0):
+    """
+    Inserts plans 1..plans and members 1..members with reproducible data.
+    The tables must be empty, so the generated IDs are known to the load driver.
+    """
+    rng = random.Random(seed)
+    migrate.upgrade(engine)
+    with engine.begin() as connection:
+        for table in (models.Plan, models.Member):
+            if connection.scalar(select(func.count()).select_from(table)):
+                raise RuntimeError(f"Table {table.__tablename__} is not empty, benchmarks need a dedicated database")
+        connection.execute(insert(models.Plan), [
+            {"name": f"Plan {i}", "value": round(rng.uniform(50, 300), 2), "description": f"Benchmark plan {i}"}
+            for i in range(1, plans + 1)
+        ])
+        for start in range(1, members + 1, chunk_size):
+            connection.execute(insert(models.Member), [
+                member_row(rng, i, plans) for i in range(start, min(start + chunk_size, members + 1))
+            ])
+    # Inserted around crud, so the plan counters are built once at the end
+    with Session(engine) as db:
+        crud.reconcile_plan_stats(db)
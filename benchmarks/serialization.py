@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from sql_app import crud, schemas, serialization
+
+from . import results
+
+SIZES = (1000, 10000)
+
+
+def _response_model_body(db, size: int, field):
+    """
+    What a list endpoint did before: ORM objects validated through the response_model, then JSON-encoded.
+    """
+    members = crud.get_members(db, None, size)
+    content = asyncio.run(serialize_response(field=field, response_content={"items": members, "next_cursor": None},
+                                             exclude_unset=True))
+    return JSONResponse(content).body
+
+
+def _fast_body(db, size: int):
+    rows = crud.get_member_rows(db, None, size)
+    return serialization.page_response(serialization.to_dicts(crud.MEMBER_FIELDS, rows), None, JSONResponse(None)).body
+
+
+def run(session_factory, members: int, iterations: int, sizes=SIZES):
+    """
+    Times a page of members from query to JSON bytes, through the response_model and through the fast path.
+    """
+    field = create_response_field("page", schemas.MemberPage)
+    summary = {}
+    for size in (size for size in sizes if size <= members):
+        paths = {"response_model": lambda db: _response_model_body(db, size, field), "fast": lambda db: _fast_body(db, size)}
+        with session_factory() as db:
+            bodies = [json.loads(body(db)) for body in paths.values()]
+            if bodies[0] != bodies[1]:
+                raise AssertionError(f"Fast path output differs from the response_model output at {size} rows")
+        for name, body in paths.items():
+            latencies = []
+            started_at = time.perf_counter()
+            for _ in range(iterations):
+                with session_factory() as db:
+                    call_started_at = time.perf_counter()
+                    body(db)
+                    latencies.append(time.perf_counter() - call_started_at)
+            summary[f"members_{size}:{name}"] = results.summarize(latencies, time.perf_counter() - started_at)
+    return summary
+
+
+def speedups(summary: dict):
+    """
+    Mean latency of the response_model path divided by the fast path's, per page size.
+    """
+    return {
+        name.split(":")[0]: round(slow["mean_ms"] / summary[name.replace(":response_model", ":fast")]["mean_ms"], 2)
+        for name, slow in summary.items() if name.endswith(":response_model")
+    }
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import httpx
+
+from sql_app import group_commit
+
+from . import load, results
+
+# Member creates and updates only, the writes group commit batches
+OPERATIONS = [load.create_member, load.update_member]
+
+
+async def _burst(app, state: load.LoadState, requests: int, concurrency: int):
+    """
+    Sends the writes concurrency at a time, so many of them reach the database together.
+    """
+    plan = [state.rng.choice(OPERATIONS) for _ in range(requests)]
+    queue = iter(plan)
+    latencies = []
+    errors = 0
+
+    async def worker(client):
+        nonlocal errors
+        for operation in queue:
+            started_at = time.perf_counter()
+            try:
+                response = await operation(client, state)
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started_at)
+            errors += failed
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+    # Stops the writer task in this event loop, the next burst starts its own
+    await group_commit.committer.close()
+    return results.summarize(latencies, elapsed, errors)
+
+
+async def run(app, state: load.LoadState, requests: int, concurrency: int):
+    """
+    The same write burst with group commit off, then on.
+    """
+    enabled = group_commit.GROUP_COMMIT
+    summary = {}
+    try:
+        for name, group in (("single", False), ("group_commit", True)):
+            group_commit.GROUP_COMMIT = group
+            summary[f"member_writes:{name}"] = await _burst(app, state, requests, concurrency)
+    finally:
+        group_commit.GROUP_COMMIT = enabled
+    return summary
+
+
+async def run_import(app, state: load.LoadState, rows: int):
+    """
+    Imports rows new members by looping over POST /members, one request at a time, then with one
+    POST /members/bulk. Each summary's rows_per_s is what the bulk endpoint is measured by.
+    """
+    enabled = group_commit.GROUP_COMMIT
+    group_commit.GROUP_COMMIT = False
+    summary = {}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            latencies, errors = [], 0
+            started_at = time.perf_counter()
+            for member in [state.new_member() for _ in range(rows)]:
+                call_started_at = time.perf_counter()
+                response = await client.post("/members", json=member)
+                latencies.append(time.perf_counter() - call_started_at)
+                errors += response.status_code != 201
+            elapsed = time.perf_counter() - started_at
+            summary["member_import:single"] = dict(results.summarize(latencies, elapsed, errors),
+                                                   rows_per_s=round(rows / elapsed, 1))
+
+            members = [state.new_member() for _ in range(rows)]
+            started_at = time.perf_counter()
+            response = await client.post("/members/bulk", json=members)
+            elapsed = time.perf_counter() - started_at
+            created = response.json()["created"] if response.status_code == 200 else 0
+            summary["member_import:bulk"] = dict(results.summarize([elapsed], elapsed, int(created != rows)),
+                                                 rows_per_s=round(created / elapsed, 1))
+    finally:
+        group_commit.GROUP_COMMIT = enabled
+    return summary
+
+
+def speedup(summary: dict):
+    """
+    Write throughput with group commit divided by the throughput without it.
+    """
+    single = summary["member_writes:single"]["rps"]
+    return round(summary["member_writes:group_commit"]["rps"] / single, 2) if single else None
+
+
+def import_speedup(summary: dict):
+    """
+    Rows imported per second by POST /members/bulk divided by those of the single-create loop.
+    """
+    single = summary["member_import:single"]["rows_per_s"]
+    return round(summary["member_import:bulk"]["rows_per_s"] / single, 1) if single else None
@@ -0,0 +1,4 @@
+import time
+
+# When the worker started importing the app, startup reports the time from here until it is ready
+IMPORTED_AT = time.perf_counter()
@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import os
+from contextvars import ContextVar
+
+from fastapi import HTTPException, status
+
+from . import database, metrics
+
+# Requests of a group allowed to use the database at once, per worker process. 0 disables the limit.
+# The defaults match the pool size plus max overflow, so admitted requests rarely wait on the pool.
+ADMISSION_READ_LIMIT = int(os.environ.get("ADMISSION_READ_LIMIT", database.DATABASE_POOL_SIZE + database.DATABASE_MAX_OVERFLOW))
+ADMISSION_WRITE_LIMIT = int(os.environ.get("ADMISSION_WRITE_LIMIT", database.DATABASE_POOL_SIZE + database.DATABASE_MAX_OVERFLOW))
+# Requests of a group allowed to wait for a slot, beyond that they are shed at once
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "100"))
+# Seconds a request may wait for a slot before it is shed. Keep it below the clients' own timeouts.
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+# Sent as Retry-After on shed requests
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+# Threads running the sync handlers and queries, Starlette's default is 40
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", "40"))
+
+metrics.registry.describe("admission_in_flight", "gauge", "Requests holding an admission slot, by group.")
+metrics.registry.describe("admission_queue_depth", "gauge", "Requests waiting for an admission slot, by group.")
+metrics.registry.describe("admission_shed_total", "counter", "Requests answered 503 without being served, by group and reason.")
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Gate:
+    """
+    Lets at most limit requests of a group through at once, queues up to queue_size more for at most
+    timeout seconds, and sheds the rest, so an overloaded database costs clients a fast 503 instead of
+    a pile of requests that all time out.
+    """
+
+    def __init__(self, group: str, limit: int, queue_size: int, timeout: float):
+        self.group = group
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        # Asyncio primitives belong to one event loop, a new one (another test or benchmark run) gets its own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+            self.in_flight = self.waiting = 0
+        return self._semaphore
+
+    def _report(self):
+        labels = (("group", self.group),)
+        metrics.registry.set("admission_in_flight", labels, self.in_flight)
+        metrics.registry.set("admission_queue_depth", labels, self.waiting)
+
+    def _shed(self, reason: str, detail: str):
+        metrics.registry.inc("admission_shed_total", (("group", self.group), ("reason", reason)))
+        raise Overloaded(detail)
+
+    async def acquire(self):
+        if self.limit <= 0:
+            return
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self._shed("queue_full", f"Too many {self.group} requests waiting, retry later")
+            self.waiting += 1
+            self._report()
+            try:
+                acquired = await self._wait_for_permit(semaphore)
+            finally:
+                self.waiting -= 1
+            if not acquired:
+                self._shed("timeout", f"Timed out waiting to serve the {self.group} request, retry later")
+        else:
+            await semaphore.acquire()
+        self.in_flight += 1
+        self._report()
+
+    async def _wait_for_permit(self, semaphore: asyncio.Semaphore):
+        """
+        Whether semaphore.acquire() got a permit within timeout. wait_for can report a timeout for an acquire
+        that got its permit at the same moment, leaving the gate one permit short for good; here an acquire
+        given up on, on timeout or when the request is cancelled, is cancelled, or its permit given back.
+        """
+        acquiring = asyncio.ensure_future(semaphore.acquire())
+        try:
+            await asyncio.wait({acquiring}, timeout=self.timeout)
+        except BaseException:
+            _abandon(acquiring, semaphore)
+            raise
+        if acquiring.done():
+            return True
+        _abandon(acquiring, semaphore)
+        return False
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        self._semaphore.release()
+        self.in_flight -= 1
+        self._report()
+
+
+def _abandon(acquiring: asyncio.Future, semaphore: asyncio.Semaphore):
+    if not acquiring.done():
+        # A cancelled acquire whose permit was already handed over gives it back itself
+        acquiring.cancel()
+    elif not acquiring.cancelled():
+        semaphore.release()
+
+
+reads = Gate("read", ADMISSION_READ_LIMIT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+writes = Gate("write", ADMISSION_WRITE_LIMIT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+
+
+class Slot:
+    """
+    A request's place in a gate, given back when the request ends or, once, earlier with release().
+    """
+
+    def __init__(self, gate: Gate):
+        self.gate = gate
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.gate.release()
+
+
+current_slot: ContextVar[Slot | None] = ContextVar("current_slot", default=None)
+
+
+@contextlib.asynccontextmanager
+async def admitted(gate: Gate):
+    try:
+        await gate.acquire()
+    except Overloaded as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+        )
+    slot = Slot(gate)
+    current_slot.set(slot)
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+def release_slot():
+    """
+    Gives back the current request's slot before the request ends, when what is left of it does not use the
+    database on its own behalf, like waiting for the group commit writer.
+    """
+    slot = current_slot.get()
+    if slot is not None:
+        slot.release()
+
+
+async def admit_read():
+    """
+    Dependencies of the session dependencies, so a slot is held until the request's session is closed.
+    """
+    async with admitted(reads):
+        yield
+
+
+async def admit_write():
+    async with admitted(writes):
+        yield
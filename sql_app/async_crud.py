@@ -0,0 +1,167 @@
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import bulk, changes, crud, database, plan_cache
+from .profiling import run_in_threadpool
+
+
+async def run(fn, db: Session | AsyncSession, *args, **kwargs):
+    """
+    Runs a function written against a sync Session without blocking the event loop.
+
+    On an AsyncSession it runs through run_sync, so the queries are awaited on the async driver.
+    On a sync Session it runs in the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def _run_on_new_session(new_session, fn, *args, **kwargs):
+    with new_session() as db:
+        return fn(db, *args, **kwargs)
+
+
+async def run_on_session(fn, *args, read_only: bool = False, **kwargs):
+    """
+    Runs fn on a session of its own, closed right after, for callers that outlive a request's session
+    like streams and the group-commit writer.
+    """
+    if database.DATABASE_MODE == "async":
+        new_session = database.new_async_read_session if read_only else database.new_async_session
+        async with new_session() as db:
+            return await db.run_sync(fn, *args, **kwargs)
+    new_session = database.new_read_session if read_only else database.new_session
+    return await run_in_threadpool(_run_on_new_session, new_session, fn, *args, **kwargs)
+
+
+async def run_on_read_session(fn, *args, **kwargs):
+    return await run_on_session(fn, *args, read_only=True, **kwargs)
+
+
+def _awaitable(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: Session | AsyncSession, *args, **kwargs):
+        return await run(fn, db, *args, **kwargs)
+    return wrapper
+
+
+def _notifies_change_feed(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: Session | AsyncSession, *args, **kwargs):
+        try:
+            return await fn(db, *args, **kwargs)
+        finally:
+            changes.feed.notify()
+    return wrapper
+
+
+release = _awaitable(crud.release)
+get_table_version = _awaitable(crud.get_table_version)
+get_changes = _awaitable(crud.get_changes)
+
+get_member_version = _awaitable(crud.get_member_version)
+get_member = _awaitable(crud.get_member)
+get_member_by_name = _awaitable(crud.get_member_by_name)
+get_members = _awaitable(crud.get_members)
+get_members_by_ids = _awaitable(crud.get_members_by_ids)
+get_member_rows = _awaitable(crud.get_member_rows)
+search_members = _awaitable(crud.search_members)
+create_member = _notifies_change_feed(_awaitable(crud.create_member))
+get_existing_emails = _awaitable(crud.get_existing_emails)
+create_members = _notifies_change_feed(_awaitable(crud.create_members))
+upsert_member = _notifies_change_feed(_awaitable(crud.upsert_member))
+update_member = _notifies_change_feed(_awaitable(crud.update_member))
+patch_member = _notifies_change_feed(_awaitable(crud.patch_member))
+delete_member = _notifies_change_feed(_awaitable(crud.delete_member))
+
+get_plan_members = _awaitable(crud.get_plan_members)
+get_plan_member_rows = _awaitable(crud.get_plan_member_rows)
+has_members = _awaitable(crud.has_members)
+get_plan_stats = _awaitable(crud.get_plan_stats)
+
+
+async def get_plan_catalog(db: Session | AsyncSession):
+    """
+    Plan reads are served by plan_cache.catalog, which only touches the database when its copy may be stale.
+    """
+    if not plan_cache.catalog.is_fresh():
+        await run(plan_cache.catalog.refresh, db)
+    return plan_cache.catalog
+
+
+async def get_plans(db: Session | AsyncSession, after_id: int | None = None, limit: int = 100):
+    return (await get_plan_catalog(db)).page(after_id, limit)
+
+
+async def get_plan(db: Session | AsyncSession, _id: int):
+    """
+    A miss re-reads the plans version first, so a plan just created by another worker is never reported missing.
+    """
+    catalog = plan_cache.catalog
+    refreshed = not catalog.is_fresh()
+    if refreshed:
+        await run(catalog.refresh, db)
+    plan = catalog.get(_id)
+    if plan is None and not refreshed:
+        await run(catalog.refresh, db)
+        plan = catalog.get(_id)
+    return plan
+
+
+async def get_plans_by_ids(db: Session | AsyncSession, ids: list[int]):
+    """
+    Like get_plan, any miss re-reads the plans version once for the whole batch.
+    """
+    catalog = plan_cache.catalog
+    refreshed = not catalog.is_fresh()
+    if refreshed:
+        await run(catalog.refresh, db)
+    plans = [catalog.get(_id) for _id in ids]
+    if None in plans and not refreshed:
+        await run(catalog.refresh, db)
+        plans = [catalog.get(_id) for _id in ids]
+    return [plan for plan in plans if plan is not None]
+
+
+async def get_plan_by_name(db: Session | AsyncSession, name: str):
+    return (await get_plan_catalog(db)).get_by_name(name)
+
+
+def _invalidates_plan_catalog(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: Session | AsyncSession, *args, **kwargs):
+        try:
+            return await run(fn, db, *args, **kwargs)
+        finally:
+            plan_cache.catalog.invalidate()
+            if database.DATABASE_READER_URLS:
+                # The next refresh may read a lagging replica, so load the new version from the primary now
+                await run(plan_cache.catalog.refresh, db)
+    return wrapper
+
+
+create_plan = _notifies_change_feed(_invalidates_plan_catalog(crud.create_plan))
+update_plan = _notifies_change_feed(_invalidates_plan_catalog(crud.update_plan))
+patch_plan = _notifies_change_feed(_invalidates_plan_catalog(crud.patch_plan))
+delete_plan = _notifies_change_feed(_invalidates_plan_catalog(crud.delete_plan))
+
+import_members = _notifies_change_feed(_awaitable(bulk.import_members))
+upsert_members = _notifies_change_feed(_awaitable(bulk.upsert_members))
+
+
+async def stream_members(db: Session | AsyncSession, chunk_size: int = 1000):
+    """
+    Returns an AsyncResult on an AsyncSession, so rows are streamed without holding a worker thread.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.stream(crud.members_export_query(chunk_size))
+    return await run_in_threadpool(crud.stream_members, db, chunk_size)
+
+
+async def stream_plans(db: Session | AsyncSession, chunk_size: int = 1000):
+    if isinstance(db, AsyncSession):
+        return await db.stream(crud.plans_export_query(chunk_size))
+    return await run_in_threadpool(crud.stream_plans, db, chunk_size)
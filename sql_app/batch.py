@@ -0,0 +1,38 @@
+BATCH_CHUNK_SIZE = 1000
+# IDs accepted in the query string; longer lists go in the body of POST .../batch-get
+MAX_QUERY_IDS = 1000
+
+
+class InvalidIds(ValueError):
+    pass
+
+
+def parse_ids(text: str):
+    try:
+        ids = [int(part) for part in text.split(",") if part.strip()]
+    except ValueError as exc:
+        raise InvalidIds("ids must be a comma separated list of integers") from exc
+    if not ids:
+        raise InvalidIds("ids must not be empty")
+    if len(ids) > MAX_QUERY_IDS:
+        raise InvalidIds(f"At most {MAX_QUERY_IDS} ids in the query string, use batch-get for more")
+    return ids
+
+
+def unique(ids: list[int]):
+    """
+    Drops repeated IDs, keeping the first occurrence, so each row is fetched and returned once.
+    """
+    return list(dict.fromkeys(ids))
+
+
+def in_request_order(ids: list[int], rows):
+    """
+    Returns the rows ordered like ids, and the ids no row matched.
+    """
+    by_id = {row.ID: row for row in rows}
+    ids = unique(ids)
+    return {
+        "items": [by_id[_id] for _id in ids if _id in by_id],
+        "missing": [_id for _id in ids if _id not in by_id],
+    }
@@ -0,0 +1,208 @@
+"""
+Monthly billing run: one invoice per member at their plan's value.
+
+    python -m sql_app.billing 2026-10 --workers 8
+
+Members are billed in chunks of consecutive IDs, each read, priced and inserted by one process of a pool,
+in its own transaction. Running the same period again resumes it, skipping the chunks already committed.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from . import crud, database, models, schemas
+
+BILLING_CHUNK_SIZE = int(os.environ.get("BILLING_CHUNK_SIZE", "10000"))
+# Processes billing chunks at once. 0 picks one per CPU, or a single one on SQLite, which writes one transaction
+# at a time, so more processes only add their startup.
+BILLING_WORKERS = int(os.environ.get("BILLING_WORKERS", "0"))
+
+# Periods being billed by this process, so the endpoint does not start one twice
+_running = set()
+_running_lock = threading.Lock()
+
+
+class AlreadyRunning(Exception):
+    pass
+
+
+def utcnow():
+    # Naive UTC, like the other DateTime columns
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def default_workers():
+    if BILLING_WORKERS:
+        return BILLING_WORKERS
+    return 1 if database.get_engine().dialect.name == "sqlite" else os.cpu_count() or 1
+
+
+def chunk_ranges(run: models.BillingRun):
+    """
+    (first_id, end_id) of each chunk, end excluded.
+    """
+    return [(first_id, min(first_id + run.chunk_size, run.last_id + 1))
+            for first_id in range(run.first_id, run.last_id + 1, run.chunk_size)]
+
+
+def charge(period: str, member_id: int, plan_id: int, value: float):
+    return {"period": period, "member_id": member_id, "plan_id": plan_id, "amount": round(value, 2)}
+
+
+def bill_chunk(period: str, first_id: int, end_id: int):
+    """
+    Runs in a pool process, on that process' own engine. Returns the chunk's first ID and invoice count.
+    A chunk another worker or server committed first breaks the invoices' unique key and is skipped.
+    """
+    started_at = time.perf_counter()
+    with database.new_session() as db:
+        invoices = [charge(period, *row) for row in crud.get_member_charges(db, first_id, end_id)]
+        try:
+            crud.save_billing_chunk(db, period, first_id, invoices, time.perf_counter() - started_at)
+        except IntegrityError:
+            db.rollback()
+            return first_id, 0
+    return first_id, len(invoices)
+
+
+def execute(period: str, workers: int, progress=None):
+    """
+    Bills the chunks of a started run that are not committed yet, then marks the run completed, or failed
+    if a chunk raised. progress(chunks_done, chunks, rows, seconds) is called as chunks commit.
+    """
+    with database.new_session() as db:
+        run = crud.get_billing_run(db, period)
+        billed = crud.get_billed_chunks(db, period)
+    ranges = chunk_ranges(run)
+    pending = [(first_id, end_id) for first_id, end_id in ranges if first_id not in billed]
+    done, rows = len(ranges) - len(pending), 0
+    started_at = time.perf_counter()
+    status = schemas.BillingStatus.failed
+    try:
+        if workers == 1 or len(pending) <= 1:
+            results = (bill_chunk(period, first_id, end_id) for first_id, end_id in pending)
+            for _, chunk_rows in results:
+                done, rows = done + 1, rows + chunk_rows
+                if progress:
+                    progress(done, len(ranges), rows, time.perf_counter() - started_at)
+        else:
+            # Spawned, not forked: the parent may be a server with threads and open connections
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                        mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(bill_chunk, period, first_id, end_id) for first_id, end_id in pending]
+                for future in concurrent.futures.as_completed(futures):
+                    _, chunk_rows = future.result()
+                    done, rows = done + 1, rows + chunk_rows
+                    if progress:
+                        progress(done, len(ranges), rows, time.perf_counter() - started_at)
+        status = schemas.BillingStatus.completed
+    finally:
+        with database.new_session() as db:
+            crud.finish_billing_run(db, period, status, utcnow())
+
+
+def start(period: str, chunk_size: int | None = None):
+    """
+    Creates the run, or picks up an unfinished one. Raises AlreadyRunning if this process is billing it.
+    """
+    with _running_lock:
+        if period in _running:
+            raise AlreadyRunning(f"Billing for {period} is already running")
+        _running.add(period)
+    try:
+        with database.new_session() as db:
+            return crud.start_billing_run(db, period, chunk_size or BILLING_CHUNK_SIZE, utcnow())
+    except BaseException:
+        _running.discard(period)
+        raise
+
+
+def _execute_and_release(period: str, workers: int):
+    try:
+        execute(period, workers)
+    finally:
+        _running.discard(period)
+
+
+def start_in_background(period: str, chunk_size: int | None = None, workers: int | None = None):
+    """
+    For the endpoint: starts the run and bills it from a thread, returning at once.
+    """
+    run = start(period, chunk_size)
+    if run.status == schemas.BillingStatus.completed.value:
+        _running.discard(period)
+        return run
+    threading.Thread(target=_execute_and_release, args=(period, workers or default_workers()),
+                     name=f"billing-{period}", daemon=True).start()
+    return run
+
+
+def describe(db, run: models.BillingRun):
+    """
+    The run with its progress, for the status endpoint.
+    """
+    chunks_completed, rows = crud.get_billing_progress(db, run.period)
+    seconds = run.seconds
+    if run.status == schemas.BillingStatus.running.value:
+        seconds += (utcnow() - run.started_at).total_seconds()
+    return {
+        "period": run.period,
+        "status": run.status,
+        "chunk_size": run.chunk_size,
+        "first_id": run.first_id,
+        "last_id": run.last_id,
+        "chunks": len(chunk_ranges(run)),
+        "chunks_completed": chunks_completed,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+    }
+
+
+def get_status(period: str):
+    """
+    describe() on its own session, None when the period was never billed.
+    """
+    with database.new_session() as db:
+        run = crud.get_billing_run(db, period)
+        return describe(db, run) if run is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sql_app.billing", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("period", help="billed month, YYYY-MM")
+    parser.add_argument("--chunk-size", type=int, default=BILLING_CHUNK_SIZE, help="member IDs per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="processes billing chunks in parallel, defaults to BILLING_WORKERS")
+    args = parser.parse_args(argv)
+    try:
+        schemas.BillingRunCreate(period=args.period, chunk_size=args.chunk_size, workers=args.workers)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    run = start(args.period, args.chunk_size)
+    if run.status == schemas.BillingStatus.completed.value:
+        print(f"Billing for {args.period} is already completed", file=sys.stderr)
+        return 0
+
+    def progress(done, chunks, rows, seconds):
+        print(f"{done}/{chunks} chunks, {rows} new invoices, {rows / seconds if seconds else 0:.0f} rows/s", file=sys.stderr)
+
+    execute(args.period, args.workers or default_workers(), progress)
+    summary = get_status(args.period)
+    print(f"Billed {summary['rows']} members for {args.period} in {summary['seconds']} s, "
+          f"{summary['rows_per_second']} rows/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import json
+
+from pydantic import ValidationError
+
+from . import crud, plan_cache, schemas
+
+BULK_CHUNK_SIZE = 1000
+MAX_BULK_ROWS = 50000
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class InvalidBulkBody(ValueError):
+    pass
+
+
+def parse_body(body: bytes, content_type: str | None):
+    """
+    Returns one raw item per row, or the exception raised while decoding that row.
+    A JSON array is decoded at once, NDJSON is decoded line by line so a bad line only rejects itself.
+    """
+    if content_type is not None and content_type.split(";")[0].strip() == NDJSON_MEDIA_TYPE:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                items.append(exc)
+        return items
+    try:
+        items = json.loads(body)
+    except ValueError as exc:
+        raise InvalidBulkBody("Body is not valid JSON") from exc
+    if not isinstance(items, list):
+        raise InvalidBulkBody("Body must be a JSON array of members")
+    return items
+
+
+def _error_detail(exc: Exception):
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in exc.errors())
+    return f"Invalid JSON: {exc}"
+
+
+def validate_rows(items: list):
+    """
+    Splits raw items into valid members and per-row results for the rejected ones.
+    """
+    members = []
+    results = []
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append(schemas.MemberBulkResult(index=index, status=schemas.BulkStatus.rejected,
+                                                    detail=_error_detail(item)))
+            continue
+        try:
+            members.append((index, schemas.MemberCreate.model_validate(item)))
+        except ValidationError as exc:
+            results.append(schemas.MemberBulkResult(index=index, status=schemas.BulkStatus.rejected,
+                                                    detail=_error_detail(exc)))
+    return members, results
+
+
+def import_members(db, items: list):
+    """
+    Validates plans against the plan catalog and duplicate emails for the whole batch with set-based queries,
+    then inserts the accepted members in one transaction.
+    """
+    members, results = validate_rows(items)
+    catalog = plan_cache.catalog.ensure_fresh(db)
+    taken_emails = crud.get_existing_emails(db, list({member.email for _, member in members}), BULK_CHUNK_SIZE)
+
+    accepted = []
+    for index, member in members:
+        if catalog.get(member.plan_id) is None:
+            detail = "Member's plan does not exist"
+        elif member.email in taken_emails:
+            detail = "Member already exists"
+        else:
+            taken_emails.add(member.email)
+            accepted.append((index, member))
+            continue
+        results.append(schemas.MemberBulkResult(index=index, status=schemas.BulkStatus.rejected, detail=detail))
+
+    ids = crud.create_members(db, [member for _, member in accepted], BULK_CHUNK_SIZE) if accepted else {}
+    for index, member in accepted:
+        results.append(schemas.MemberBulkResult(index=index, status=schemas.BulkStatus.created, ID=ids.get(member.email)))
+
+    results.sort(key=lambda result: result.index)
+    return schemas.MemberBulkReport(created=len(accepted), rejected=len(results) - len(accepted), results=results)
+
+
+def upsert_members(db, items: list):
+    """
+    Like import_members, but a member whose email is taken is updated instead of rejected.
+    An email repeated in the body is rejected after its first row, which one statement cannot apply in order.
+    """
+    members, results = validate_rows(items)
+    catalog = plan_cache.catalog.ensure_fresh(db)
+
+    accepted = []
+    seen_emails = set()
+    for index, member in members:
+        if catalog.get(member.plan_id) is None:
+            detail = "Member's plan does not exist"
+        elif member.email in seen_emails:
+            detail = "Email repeated in the body"
+        else:
+            seen_emails.add(member.email)
+            accepted.append((index, member))
+            continue
+        results.append(schemas.MemberBulkResult(index=index, status=schemas.BulkStatus.rejected, detail=detail))
+
+    written = crud.upsert_members(db, [member for _, member in accepted], BULK_CHUNK_SIZE) if accepted else {}
+    for index, member in accepted:
+        _id, created = written[member.email]
+        status = schemas.BulkStatus.created if created else schemas.BulkStatus.updated
+        results.append(schemas.MemberBulkResult(index=index, status=status, ID=_id))
+
+    results.sort(key=lambda result: result.index)
+    created = sum(was_created for _, was_created in written.values())
+    return schemas.MemberUpsertReport(created=created, updated=len(accepted) - created,
+                                      rejected=len(results) - len(accepted), results=results)
@@ -0,0 +1,68 @@
+import os
+
+from fastapi import HTTPException, Request, Response, status
+
+# Seconds a client or proxy may reuse a response without revalidating it
+CACHE_MAX_AGE_PLANS = int(os.environ.get("CACHE_MAX_AGE_PLANS", "60"))
+CACHE_MAX_AGE_MEMBERS = int(os.environ.get("CACHE_MAX_AGE_MEMBERS", "5"))
+# Seconds a shared cache (proxy, CDN) may reuse a plan response. Member responses hold personal data and are
+# only ever cached by the client.
+CACHE_SHARED_MAX_AGE_PLANS = int(os.environ.get("CACHE_SHARED_MAX_AGE_PLANS", str(CACHE_MAX_AGE_PLANS)))
+
+
+def make_etag(*parts):
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str):
+    """
+    If-None-Match uses the weak comparison, so W/ prefixes are ignored. It may list several tags or be "*".
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def if_match_versions(if_match: str | None, *parts):
+    """
+    Versions named by If-Match for a resource tagged make_etag(*parts, version, ...), None without the header
+    or with "*". If-Match uses the strong comparison, so W/ tags never match. Tags of other resources are
+    dropped, an empty list is a precondition no version meets.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    prefix = make_etag(*parts)[:-1] + "-"
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if tag.startswith(prefix) and tag.endswith('"'):
+            version = tag[len(prefix):-1].split("-")[0]
+            if version.isdigit():
+                versions.append(int(version))
+    return versions
+
+
+def cache_headers(etag: str, max_age: int, shared_max_age: int | None = None):
+    """
+    With shared_max_age the response is public, so shared caches may store it and revalidate it with the ETag.
+    Without it only the client may, for responses carrying personal data.
+    """
+    if shared_max_age is None:
+        return {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+    return {"ETag": etag, "Cache-Control": f"public, max-age={max_age}, s-maxage={shared_max_age}"}
+
+
+def check_etag(request: Request, response: Response, etag: str, max_age: int, shared_max_age: int | None = None):
+    """
+    Answers 304 Not Modified when the client already holds this version, otherwise tags the response.
+    Call it before the expensive part of the handler whenever the version is known up front.
+    """
+    headers = cache_headers(etag, max_age, shared_max_age)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=headers,
+        )
+    response.headers.update(headers)
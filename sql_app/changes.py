@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+
+from . import schemas
+
+# How often an open stream looks for changes written by other workers, in seconds
+CHANGE_FEED_POLL_INTERVAL = float(os.environ.get("CHANGE_FEED_POLL_INTERVAL", "1.0"))
+# Idle streams send a comment this often, so proxies do not close them
+CHANGE_FEED_HEARTBEAT = 15.0
+CHANGE_FEED_PAGE_SIZE = 500
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+class ChangeFeed:
+    """
+    Wakes this worker's open streams as soon as one of its writes commits.
+    Writes from other workers are picked up by the streams' polling.
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self):
+        self._event.set()
+        self._event = asyncio.Event()
+
+    def waiter(self):
+        """
+        Take it before reading the log, so a write committing in between still wakes the stream.
+        """
+        return self._event
+
+
+feed = ChangeFeed()
+
+
+def format_event(change: schemas.Change):
+    return f"id: {change.seq}\nevent: change\ndata: {change.model_dump_json()}\n\n".encode()
+
+
+async def stream(read_changes, since: int, poll_interval: float = CHANGE_FEED_POLL_INTERVAL):
+    """
+    Yields Server-Sent Events for every change after since, then waits for new ones.
+
+    read_changes(since, limit) opens its own short session on each call, so an idle stream holds no connection.
+    """
+    last_seq = since
+    sent_at = time.monotonic()
+    while True:
+        waiter = feed.waiter()
+        changes = await read_changes(last_seq, CHANGE_FEED_PAGE_SIZE)
+        for change in changes:
+            yield format_event(schemas.Change.model_validate(change))
+            last_seq = change.seq
+            sent_at = time.monotonic()
+        if len(changes) == CHANGE_FEED_PAGE_SIZE:
+            continue
+        if time.monotonic() - sent_at >= CHANGE_FEED_HEARTBEAT:
+            yield b": keep-alive\n\n"
+            sent_at = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
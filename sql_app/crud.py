@@ -1,22 +1,202 @@
-from sqlalchemy.orm import Session
+import collections
+
+from sqlalchemy import delete, exists, func, insert, select, union, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 
 from . import models, schemas
 
 
-def get_member(db: Session, member_id: int):
-    member = db.query(models.Member).filter(models.Member.ID == member_id).first()
+# Columns selected by the fast list paths, in the order of the response schemas' fields
+MEMBER_FIELDS = tuple(schemas.Member.model_fields)
+PLAN_FIELDS = tuple(schemas.Plan.model_fields)
+
+def commit(db: Session):
+    """
+    Commits, rolling back when a constraint is violated so the caller can map the IntegrityError to a response.
+    """
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+
+def flush(db: Session):
+    """
+    Like commit, for writes whose generated IDs are needed before the transaction ends.
+    """
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise
+
+def release(db: Session):
+    """
+    Ends the session's transaction, so its connection goes back to the pool while the session stays usable.
+    """
+    db.rollback()
+
+class VersionMismatch(Exception):
+    """
+    Raised by the patch functions when the row, or table, is no longer at a version the client named in If-Match.
+    """
+
+def is_foreign_key_violation(exc: IntegrityError):
+    return "foreign key" in str(exc.orig).lower()
+
+
+def get_table_version(db: Session, table_name: str):
+    version = db.scalar(select(models.TableVersion.version).where(models.TableVersion.table_name == table_name))
+    return version or 0
+
+def _increment(db: Session, model, key: dict, column: str, delta: int):
+    """
+    Adds delta to a counter row, or inserts the row at delta, in one statement: two first writes cannot both
+    find it missing and insert it, and the row is written at once instead of on the next flush.
+    """
+    values = {**key, column: delta}
+    increment = {column: getattr(model, column) + delta}
+    if db.get_bind().dialect.name == "mysql":
+        db.execute(mysql.insert(model).values(values).on_duplicate_key_update(increment))
+    else:
+        db.execute(sqlite.insert(model).values(values).on_conflict_do_update(index_elements=list(key), set_=increment))
+
+def bump_table_version(db: Session, table_name: str):
+    """
+    Must run in the same transaction as the write it versions.
+    """
+    _increment(db, models.TableVersion, {"table_name": table_name}, "version", 1)
+
+def log_changes(db: Session, table_name: str, operation: schemas.ChangeOperation, ids):
+    """
+    Appends to the change log, in the write's transaction and after its own version bump.
+
+    Bumping the changes version first makes concurrent writers take their seqs one at a time, in commit order,
+    so a reader resuming after seq N never misses a change that commits later with a smaller seq.
+    """
+    bump_table_version(db, models.Change.__tablename__)
+    db.execute(insert(models.Change), [
+        {"table_name": table_name, "row_id": _id, "operation": operation.value} for _id in ids
+    ])
+
+def get_last_change_seq(db: Session):
+    return db.scalar(select(func.max(models.Change.seq))) or 0
+
+def get_changes(db: Session, since: int = 0, limit: int = 100):
+    return db.scalars(select(models.Change).where(models.Change.seq > since).order_by(models.Change.seq).limit(limit)).all()
+
+
+def count_members(db: Session, plan_counts: dict[int, int]):
+    """
+    Adds to the plans' member counters, in the caller's transaction. A plan without a counter row gets one.
+    """
+    for plan_id, delta in plan_counts.items():
+        if delta != 0:
+            _increment(db, models.PlanStats, {"plan_id": plan_id}, "member_count", delta)
+
+def move_member(db: Session, member_id: int, plan_id: int):
+    """
+    Moves the member to plan_id's counter. Runs before the UPDATE that sets plan_id, so the statement itself reads
+    the old plan; a member staying on its plan, or missing, touches no counter.
+    """
+    return _move_member(db, models.Member.ID == member_id, plan_id)
+
+def _move_member(db: Session, member_filter, plan_id: int):
+    old_plan_id = (select(models.Member.plan_id)
+                   .where(member_filter, models.Member.plan_id != plan_id)
+                   .scalar_subquery())
+    result = db.execute(update(models.PlanStats).where(models.PlanStats.plan_id == old_plan_id)
+                        .values(member_count=models.PlanStats.member_count - 1))
+    if result.rowcount:
+        count_members(db, {plan_id: 1})
+    return bool(result.rowcount)
+
+def get_member_version(db: Session, member_id: int):
+    return db.scalar(select(models.Member.version).where(models.Member.ID == member_id))
+
+def _with_plan(query, expand_plan: bool):
+    """
+    Loads each member's plan in the same query, through an inner join since plan_id is never null.
+    """
+    return query.options(joinedload(models.Member.plan, innerjoin=True)) if expand_plan else query
+
+def get_member(db: Session, member_id: int, expand_plan: bool = False):
+    member = _with_plan(db.query(models.Member), expand_plan).filter(models.Member.ID == member_id).first()
     return member
 
 
 def get_member_by_name(db: Session, first_name: str,last_name: str):
-    member = db.query(models.Member).filter((models.Member.first_name == first_name) and (models.Member.last_name == last_name)).first()
+    member = db.query(models.Member).filter(models.Member.last_name == last_name, models.Member.first_name == first_name).first()
     return member
 
-def get_members(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Member).offset(skip).limit(limit).all()
+def _starts_with(db: Session, column, prefix: str):
+    """
+    Prefix match that is an index range scan on every backend. MySQL gets LIKE 'x%', which it scans as a range
+    under the column's collation, so case and accents are matched the way the index sorts them. SQLite does not
+    use an index for LIKE, there the prefix is written as a range, right under its binary collation.
+    """
+    if db.get_bind().dialect.name == "mysql":
+        escaped = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        return column.like(escaped + "%", escape="/")
+    return (column >= prefix) & (column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
 
+def search_members(db: Session, prefix: str, after_id: int | None = None, limit: int = 100):
+    """
+    One index range per searched column, unioned, rather than an OR of the three: without statistics
+    planners read an OR with ORDER BY ID LIMIT as a scan in ID order, through the whole table on a miss.
+    """
+    matches = []
+    for column in (models.Member.last_name, models.Member.first_name, models.Member.email):
+        match = select(models.Member.ID).where(_starts_with(db, column, prefix))
+        if after_id is not None:
+            match = match.where(models.Member.ID > after_id)
+        matches.append(match)
+    ids = union(*matches).subquery()
+    return db.query(models.Member).join(ids, models.Member.ID == ids.c.ID).order_by(models.Member.ID).limit(limit).all()
 
-def create_member(db: Session, member: schemas.MemberCreate):
+def get_members(db: Session, after_id: int | None = None, limit: int = 100, expand_plan: bool = False):
+    query = _with_plan(db.query(models.Member), expand_plan)
+    if after_id is not None:
+        query = query.filter(models.Member.ID > after_id)
+    return query.order_by(models.Member.ID).limit(limit).all()
+
+def _member_rows_query(after_id: int | None, limit: int):
+    query = select(*(getattr(models.Member, field) for field in MEMBER_FIELDS))
+    if after_id is not None:
+        query = query.where(models.Member.ID > after_id)
+    return query.order_by(models.Member.ID).limit(limit)
+
+def get_member_rows(db: Session, after_id: int | None = None, limit: int = 100):
+    """
+    Same page as get_members, as row tuples in MEMBER_FIELDS order instead of ORM objects.
+    """
+    return db.execute(_member_rows_query(after_id, limit)).all()
+
+def get_members_by_ids(db: Session, ids: list[int], chunk_size: int = 1000, expand_plan: bool = False):
+    """
+    One IN query per chunk of IDs, rows come back in no particular order.
+    """
+    members = []
+    for start in range(0, len(ids), chunk_size):
+        query = _with_plan(select(models.Member), expand_plan).where(models.Member.ID.in_(ids[start:start + chunk_size]))
+        members.extend(db.scalars(query))
+    return members
+
+def members_export_query(chunk_size: int = 1000):
+    """
+    Server-side cursor over plain row tuples, fetched chunk_size rows at a time.
+    """
+    query = select(models.Member.ID, models.Member.first_name, models.Member.last_name,
+                   models.Member.email, models.Member.plan_id).order_by(models.Member.ID)
+    return query.execution_options(yield_per=chunk_size)
+
+def stream_members(db: Session, chunk_size: int = 1000):
+    return db.execute(members_export_query(chunk_size))
+
+
+def _add_member(db: Session, member: schemas.MemberCreate):
     db_member = models.Member(
         first_name = member.first_name,
         last_name = member.last_name,
@@ -24,37 +204,259 @@ def create_member(db: Session, member: schemas.MemberCreate):
         plan_id = member.plan_id
     )
     db.add(db_member)
-    db.commit()
-    db.refresh(db_member)
     return db_member
 
-def update_member(db: Session, member: schemas.MemberUpdate, member_id: int):
-    db_member = db.query(models.Member).filter(models.Member.ID == member_id).first()
-    db_member.first_name = member.first_name
-    db_member.last_name = member.last_name
-    db_member.email = member.email
-    db_member.plan_id = member.plan_id
-    db.commit()
-    db.refresh(db_member)
+def create_member(db: Session, member: schemas.MemberCreate):
+    db_member = _add_member(db, member)
+    flush(db)
+    count_members(db, {member.plan_id: 1})
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, schemas.ChangeOperation.created, [db_member.ID])
+    commit(db)
     return db_member
 
+def get_existing_emails(db: Session, emails: list[str], chunk_size: int = 1000):
+    existing = set()
+    for start in range(0, len(emails), chunk_size):
+        chunk = emails[start:start + chunk_size]
+        existing.update(db.scalars(select(models.Member.email).where(models.Member.email.in_(chunk))))
+    return existing
+
+def create_members(db: Session, members: list[schemas.MemberCreate], chunk_size: int = 1000):
+    """
+    Inserts every member with one executemany per chunk and a single commit.
+    Returns the new IDs keyed by email.
+    """
+    ids = {}
+    count_members(db, collections.Counter(member.plan_id for member in members))
+    for start in range(0, len(members), chunk_size):
+        chunk = [member.model_dump() for member in members[start:start + chunk_size]]
+        db.execute(insert(models.Member), chunk)
+        emails = [row["email"] for row in chunk]
+        ids.update((email, _id) for _id, email in db.execute(
+            select(models.Member.ID, models.Member.email).where(models.Member.email.in_(emails))))
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, schemas.ChangeOperation.created, ids.values())
+    commit(db)
+    return ids
+
+def _upsert_members_statement(db: Session, rows: list[dict]):
+    """
+    One INSERT of rows that, for an email already taken, updates that member's other fields and version instead:
+    ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT (email) DO UPDATE on SQLite.
+    """
+    if db.get_bind().dialect.name == "mysql":
+        statement = mysql.insert(models.Member).values(rows)
+        # LAST_INSERT_ID(ID) makes an updated row report its ID the way an inserted one does
+        return statement.on_duplicate_key_update(ID=func.last_insert_id(models.Member.ID),
+                                                 first_name=statement.inserted.first_name,
+                                                 last_name=statement.inserted.last_name,
+                                                 plan_id=statement.inserted.plan_id,
+                                                 version=models.Member.version + 1)
+    statement = sqlite.insert(models.Member).values(rows)
+    return statement.on_conflict_do_update(index_elements=[models.Member.email],
+                                           set_={"first_name": statement.excluded.first_name,
+                                                 "last_name": statement.excluded.last_name,
+                                                 "plan_id": statement.excluded.plan_id,
+                                                 "version": models.Member.version + 1})
+
+def upsert_member(db: Session, member: schemas.MemberCreate):
+    """
+    Creates the member, or updates the one with its email, in a single statement, so no other request can
+    insert the email between a check and the insert. Returns the member and whether it was created.
+    """
+    moved = _move_member(db, models.Member.email == member.email, member.plan_id)
+    statement = _upsert_members_statement(db, [member.model_dump()])
+    if db.get_bind().dialect.name == "mysql":
+        result = db.execute(statement)
+        # One affected row for an insert, two for an update
+        member_id, created = result.lastrowid, result.rowcount == 1
+    else:
+        member_id, version = db.execute(statement.returning(models.Member.ID, models.Member.version)).one()
+        created = version == 1
+    if created:
+        count_members(db, {member.plan_id: 1})
+    operation = schemas.ChangeOperation.created if created else schemas.ChangeOperation.updated
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, operation, [member_id])
+    commit(db)
+    return schemas.Member(ID=member_id, **member.model_dump()), created
+
+def _lock_members_by_email(db: Session, emails: list[str]):
+    """
+    (email, plan_id) of the members with these emails, locked until the commit. SQLite ignores FOR UPDATE, but
+    there a write session holds the database's write lock from its BEGIN IMMEDIATE.
+    """
+    return db.execute(select(models.Member.email, models.Member.plan_id)
+                      .where(models.Member.email.in_(emails)).with_for_update()).all()
+
+def upsert_members(db: Session, members: list[schemas.MemberCreate], chunk_size: int = 1000):
+    """
+    upsert_member for many members with distinct emails: one multi-row statement per chunk and a single commit.
+    The members already there are locked first, so their plans can be moved between counters.
+    Returns (ID, created) keyed by email.
+    """
+    old_plans = {}
+    written = {}
+    for start in range(0, len(members), chunk_size):
+        chunk = [member.model_dump() for member in members[start:start + chunk_size]]
+        emails = [row["email"] for row in chunk]
+        old_plans.update(_lock_members_by_email(db, emails))
+        db.execute(_upsert_members_statement(db, chunk))
+        written.update((email, (_id, email not in old_plans)) for _id, email in db.execute(
+            select(models.Member.ID, models.Member.email).where(models.Member.email.in_(emails))))
+    plan_counts = collections.Counter()
+    for member in members:
+        old_plan_id = old_plans.get(member.email)
+        if old_plan_id != member.plan_id:
+            plan_counts[member.plan_id] += 1
+            if old_plan_id is not None:
+                plan_counts[old_plan_id] -= 1
+    count_members(db, plan_counts)
+    bump_table_version(db, models.Member.__tablename__)
+    for operation, created in ((schemas.ChangeOperation.created, True), (schemas.ChangeOperation.updated, False)):
+        ids = [_id for _id, was_created in written.values() if was_created is created]
+        if ids:
+            log_changes(db, models.Member.__tablename__, operation, ids)
+    commit(db)
+    return written
+
+def update_member(db: Session, member: schemas.MemberUpdate, member_id: int):
+    """
+    One UPDATE plus the members version bump, the member is not read back.
+    Returns None when the member does not exist.
+    """
+    updated = _update_member_row(db, member, member_id)
+    if updated is None:
+        db.rollback()
+        return None
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, schemas.ChangeOperation.updated, [member_id])
+    commit(db)
+    return updated
+
+def patch_member(db: Session, member: schemas.MemberPatch, member_id: int, versions: list[int] | None = None):
+    """
+    One UPDATE of the fields sent, nothing read first. With versions, from If-Match, the UPDATE also requires
+    one of them, so a concurrent write raises VersionMismatch instead of being overwritten.
+    Returns the written fields and the member's new version, or None when the member does not exist.
+    """
+    values = member.model_dump(exclude_unset=True)
+    if "plan_id" in values:
+        move_member(db, member_id, values["plan_id"])
+    query = update(models.Member).where(models.Member.ID == member_id)
+    if versions is not None:
+        query = query.where(models.Member.version.in_(versions))
+    result = db.execute(query.values(**values, version=models.Member.version + 1))
+    if result.rowcount == 0:
+        db.rollback()
+        if versions is not None and get_member_version(db, member_id) is not None:
+            raise VersionMismatch(f"Member {member_id} was changed since the version in If-Match")
+        return None
+    # The row is locked by the UPDATE until the commit, so this is the version written
+    version = get_member_version(db, member_id)
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, schemas.ChangeOperation.updated, [member_id])
+    commit(db)
+    return schemas.PatchedMember(ID=member_id, **values), version
+
+def _update_member_row(db: Session, member: schemas.MemberUpdate, member_id: int):
+    values = member.model_dump()
+    move_member(db, member_id, member.plan_id)
+    result = db.execute(update(models.Member).where(models.Member.ID == member_id)
+                        .values(**values, version=models.Member.version + 1))
+    if result.rowcount == 0:
+        return None
+    return schemas.Member(ID=member_id, **values)
+
+def write_members(db: Session, writes: list[tuple[schemas.ChangeOperation, tuple]]):
+    """
+    Applies many member creates and updates in one transaction, for group commit.
+
+    Each write runs in a savepoint, so one that violates a constraint is undone alone. The members version
+    and the change log are written once for the whole batch. Returns, per write, what create_member or
+    update_member would have returned, or the IntegrityError it raised.
+    """
+    results = []
+    written = {schemas.ChangeOperation.created: [], schemas.ChangeOperation.updated: []}
+    for operation, args in writes:
+        try:
+            with db.begin_nested():
+                if operation is schemas.ChangeOperation.created:
+                    result = _add_member(db, *args)
+                    db.flush()
+                else:
+                    result = _update_member_row(db, *args)
+        except IntegrityError as exc:
+            result = exc
+        else:
+            if result is not None:
+                written[operation].append(result.ID)
+        results.append(result)
+    # Creates are counted once per plan for the batch, updates moved their member in their savepoint
+    count_members(db, collections.Counter(args[0].plan_id for (operation, args), result in zip(writes, results)
+                                          if operation is schemas.ChangeOperation.created
+                                          and not isinstance(result, IntegrityError)))
+    if any(written.values()):
+        bump_table_version(db, models.Member.__tablename__)
+        for operation, ids in written.items():
+            if ids:
+                log_changes(db, models.Member.__tablename__, operation, ids)
+    commit(db)
+    return results
+
 def delete_member(db: Session, member_id: int):
-    db_member = db.query(models.Member).filter(models.Member.ID == member_id).first()
-    db.delete(db_member)
-    db.commit()
+    """
+    Returns the member as loaded before the DELETE, or None when it does not exist or a concurrent request deleted it first.
+    """
+    db_member = db.get(models.Member, member_id)
+    if db_member is None:
+        return None
+    db.expunge(db_member)
+    # The counter follows the plan the member has when deleted, read by the statement itself
+    db.execute(update(models.PlanStats)
+               .where(models.PlanStats.plan_id == select(models.Member.plan_id)
+                      .where(models.Member.ID == member_id).scalar_subquery())
+               .values(member_count=models.PlanStats.member_count - 1))
+    result = db.execute(delete(models.Member).where(models.Member.ID == member_id))
+    if result.rowcount == 0:
+        db.rollback()
+        return None
+    bump_table_version(db, models.Member.__tablename__)
+    log_changes(db, models.Member.__tablename__, schemas.ChangeOperation.deleted, [member_id])
+    commit(db)
     return db_member
 
 
-def get_plans(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Plan).offset(skip).limit(limit).all()
+def get_plans(db: Session, after_id: int | None = None, limit: int = 100):
+    query = db.query(models.Plan)
+    if after_id is not None:
+        query = query.filter(models.Plan.ID > after_id)
+    return query.order_by(models.Plan.ID).limit(limit).all()
+
+def plans_export_query(chunk_size: int = 1000):
+    """
+    Server-side cursor over plain row tuples, fetched chunk_size rows at a time.
+    """
+    query = select(models.Plan.ID, models.Plan.name, models.Plan.value,
+                   models.Plan.description).order_by(models.Plan.ID)
+    return query.execution_options(yield_per=chunk_size)
+
+def stream_plans(db: Session, chunk_size: int = 1000):
+    return db.execute(plans_export_query(chunk_size))
+
 
+def get_all_plans(db: Session):
+    return db.query(models.Plan).order_by(models.Plan.ID).all()
 
 def create_plan(db: Session, plan: schemas.PlanCreate):
-    print 
     db_plan = models.Plan(name = plan.name, value = plan.value, description = plan.description)
     db.add(db_plan)
-    db.commit()
-    db.refresh(db_plan)
+    flush(db)
+    db.add(models.PlanStats(plan_id=db_plan.ID, member_count=0))
+    bump_table_version(db, models.Plan.__tablename__)
+    log_changes(db, models.Plan.__tablename__, schemas.ChangeOperation.created, [db_plan.ID])
+    commit(db)
     return db_plan
 
 def get_plan(db: Session, _id: int):
@@ -63,20 +465,159 @@ def get_plan(db: Session, _id: int):
 def get_plan_by_name(db: Session, name: str):
     return db.query(models.Plan).filter(models.Plan.name == name).first()
 
-def get_plan_members(db: Session, plan_id: int):
-    return db.query(models.Member).filter(models.Member.plan_id == plan_id).all()
+def get_plan_members(db: Session, plan_id: int, after_id: int | None = None, limit: int = 100,
+                     expand_plan: bool = False):
+    query = _with_plan(db.query(models.Member), expand_plan).filter(models.Member.plan_id == plan_id)
+    if after_id is not None:
+        query = query.filter(models.Member.ID > after_id)
+    return query.order_by(models.Member.ID).limit(limit).all()
 
-def update_plan(db: Session, plan: schemas.Plan, plan_id: int):
-    db_plan = db.query(models.Plan).filter(models.Plan.ID == plan_id).first()
-    db_plan.name = plan.name
-    db_plan.value = plan.value
-    db_plan.description = plan.description
-    db.commit()
-    db.refresh(db_plan)
-    return db_plan
+def get_plan_member_rows(db: Session, plan_id: int, after_id: int | None = None, limit: int = 100):
+    return db.execute(_member_rows_query(after_id, limit).where(models.Member.plan_id == plan_id)).all()
+
+def has_members(db: Session, plan_id: int):
+    return db.scalar(select(exists().where(models.Member.plan_id == plan_id)))
+
+def update_plan(db: Session, plan: schemas.PlanUpdate, plan_id: int):
+    """
+    One UPDATE plus the plans version bump, the plan is not read back. Returns None when the plan does not exist.
+    """
+    values = plan.model_dump()
+    result = db.execute(update(models.Plan).where(models.Plan.ID == plan_id).values(**values))
+    if result.rowcount == 0:
+        db.rollback()
+        return None
+    bump_table_version(db, models.Plan.__tablename__)
+    log_changes(db, models.Plan.__tablename__, schemas.ChangeOperation.updated, [plan_id])
+    commit(db)
+    return schemas.Plan(ID=plan_id, **values)
+
+def patch_plan(db: Session, plan: schemas.PlanPatch, plan_id: int, versions: list[int] | None = None):
+    """
+    One UPDATE of the fields sent. Plans are versioned as a table, so versions, from If-Match, are checked by
+    bumping the plans version only from one of them, which also serializes concurrent patches.
+    Returns the written fields and the new plans version, or None when the plan does not exist.
+    """
+    values = plan.model_dump(exclude_unset=True)
+    if versions is not None:
+        result = db.execute(update(models.TableVersion)
+                            .where(models.TableVersion.table_name == models.Plan.__tablename__,
+                                   models.TableVersion.version.in_(versions))
+                            .values(version=models.TableVersion.version + 1))
+        if result.rowcount == 0:
+            db.rollback()
+            raise VersionMismatch("Plans were changed since the version in If-Match")
+    result = db.execute(update(models.Plan).where(models.Plan.ID == plan_id).values(**values))
+    if result.rowcount == 0:
+        db.rollback()
+        return None
+    if versions is None:
+        bump_table_version(db, models.Plan.__tablename__)
+    version = get_table_version(db, models.Plan.__tablename__)
+    log_changes(db, models.Plan.__tablename__, schemas.ChangeOperation.updated, [plan_id])
+    commit(db)
+    return schemas.PatchedPlan(ID=plan_id, **values), version
 
 def delete_plan(db: Session, plan_id: int):
-    db_plan = db.query(models.Plan).filter(models.Plan.ID == plan_id).first()
-    db.delete(db_plan)
-    db.commit()
-    return db_plan
+    """
+    Deletes the plan only if no member is subscribed to it, in a single statement.
+    Returns whether the plan was deleted.
+    """
+    result = db.execute(delete(models.Plan).where(models.Plan.ID == plan_id,
+                                                  ~exists().where(models.Member.plan_id == plan_id)))
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+    db.execute(delete(models.PlanStats).where(models.PlanStats.plan_id == plan_id))
+    bump_table_version(db, models.Plan.__tablename__)
+    log_changes(db, models.Plan.__tablename__, schemas.ChangeOperation.deleted, [plan_id])
+    commit(db)
+    return True
+
+def get_plan_stats(db: Session):
+    """
+    One row per plan: its counter, and the revenue it brings at the plan's current value.
+    """
+    member_count = func.coalesce(models.PlanStats.member_count, 0)
+    return db.execute(select(models.Plan.ID.label("plan_id"), models.Plan.name, models.Plan.value,
+                             member_count.label("member_count"), (member_count * models.Plan.value).label("revenue"))
+                      .outerjoin(models.PlanStats, models.PlanStats.plan_id == models.Plan.ID)
+                      .order_by(models.Plan.ID)).all()
+
+def reconcile_plan_stats(db: Session):
+    """
+    Rebuilds every counter from one GROUP BY over members. The counters are locked first, so member writes
+    committing meanwhile wait and then count on top of the rebuilt values instead of being lost. SQLite has no
+    FOR UPDATE, there the transaction begins with BEGIN IMMEDIATE, which holds off every other writer; db must
+    not have run a statement yet.
+    Returns {plan_id: (counted, actual)} for the counters that were wrong.
+    """
+    db.connection(execution_options={"sqlite_begin": "immediate"})
+    counted = dict(db.execute(select(models.PlanStats.plan_id, models.PlanStats.member_count).with_for_update()).all())
+    actual = dict(db.execute(select(models.Member.plan_id, func.count()).group_by(models.Member.plan_id)).all())
+    plan_ids = db.scalars(select(models.Plan.ID)).all()
+    db.execute(delete(models.PlanStats))
+    if plan_ids:
+        db.execute(insert(models.PlanStats), [{"plan_id": plan_id, "member_count": actual.get(plan_id, 0)}
+                                              for plan_id in plan_ids])
+    commit(db)
+    return {plan_id: (counted.get(plan_id), actual.get(plan_id, 0)) for plan_id in plan_ids
+            if counted.get(plan_id) != actual.get(plan_id, 0)}
+
+
+def get_billing_run(db: Session, period: str):
+    return db.get(models.BillingRun, period)
+
+def start_billing_run(db: Session, period: str, chunk_size: int, started_at):
+    """
+    Creates the period's run over the members that exist now, or marks an unfinished one as running again.
+    A resumed run keeps its first chunk size and ID range, so its chunks line up with the ones already billed.
+    """
+    run = db.get(models.BillingRun, period)
+    if run is None:
+        first_id, last_id = db.execute(select(func.min(models.Member.ID), func.max(models.Member.ID))).one()
+        run = models.BillingRun(period=period, chunk_size=chunk_size, first_id=first_id or 1, last_id=last_id or 0,
+                                rows=0, seconds=0.0)
+        db.add(run)
+    if run.status != schemas.BillingStatus.completed.value:
+        run.status = schemas.BillingStatus.running.value
+        run.started_at = started_at
+        run.finished_at = None
+    commit(db)
+    return run
+
+def get_billed_chunks(db: Session, period: str):
+    return set(db.scalars(select(models.BillingChunk.first_id).where(models.BillingChunk.period == period)))
+
+def get_billing_progress(db: Session, period: str):
+    """
+    Chunks committed so far and the invoices they hold.
+    """
+    return db.execute(select(func.count(), func.coalesce(func.sum(models.BillingChunk.rows), 0))
+                      .where(models.BillingChunk.period == period)).one()
+
+def get_member_charges(db: Session, first_id: int, end_id: int):
+    """
+    Members with first_id <= ID < end_id and their plan's value, an index range on both primary keys.
+    """
+    return db.execute(select(models.Member.ID, models.Member.plan_id, models.Plan.value)
+                      .join(models.Plan, models.Plan.ID == models.Member.plan_id)
+                      .where(models.Member.ID >= first_id, models.Member.ID < end_id)).all()
+
+def save_billing_chunk(db: Session, period: str, first_id: int, invoices: list[dict], seconds: float):
+    """
+    The chunk's invoices and its completion mark, in one transaction.
+    """
+    if invoices:
+        db.execute(insert(models.Invoice), invoices)
+    db.add(models.BillingChunk(period=period, first_id=first_id, rows=len(invoices), seconds=seconds))
+    commit(db)
+
+def finish_billing_run(db: Session, period: str, status: schemas.BillingStatus, finished_at):
+    run = db.get(models.BillingRun, period)
+    run.status = status.value
+    run.rows = get_billing_progress(db, period)[1]
+    run.seconds += (finished_at - run.started_at).total_seconds()
+    run.finished_at = finished_at
+    commit(db)
+    return run
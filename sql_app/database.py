@@ -1,8 +1,13 @@
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+import itertools
 import os
+import threading
 
 DATABASE_USER = os.environ.get("DATABASE_USER")
 DATABASE_PASS = os.environ.get("DATABASE_PASS")
@@ -10,15 +15,188 @@ DATABASE_HOST = os.environ.get("DATABASE_HOST")
 DATABASE_PORT = os.environ.get("DATABASE_PORT", "3306")
 DATABASE_NAME = os.environ.get("DATABASE_NAME")
 
-print(DATABASE_USER)
-print(DATABASE_PASS)
-print(DATABASE_HOST)
-print(DATABASE_PORT)
-print(DATABASE_NAME)
+# "sync" runs the handlers' queries on blocking sessions in the threadpool, "async" awaits them on an async driver
+DATABASE_MODE = os.environ.get("DATABASE_MODE", "sync")
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+# Per worker process: size the pool so workers * (pool size + max overflow) stays under MySQL's max_connections
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.environ.get("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", "30"))
+# Keep below MySQL's wait_timeout, so the server never closes a connection the pool still holds
+DATABASE_POOL_RECYCLE = int(os.environ.get("DATABASE_POOL_RECYCLE", "3600"))
+DATABASE_POOL_PRE_PING = os.environ.get("DATABASE_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+SQLALCHEMY_DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"mysql+pymysql://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}",
+)
+
+# Optional comma separated replica URLs, read-only endpoints are spread over them round-robin
+DATABASE_READER_URLS = [url.strip() for url in os.environ.get("DATABASE_READER_URLS", "").split(",") if url.strip()]
+# Seconds a client keeps reading from the primary after a write, so it sees its own writes despite replication lag
+DATABASE_STICKY_SECONDS = float(os.environ.get("DATABASE_STICKY_SECONDS", "5"))
+
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def get_async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+def get_pool_options(url):
+    """
+    Sizing options only apply to queue pools; SQLite in memory and some async drivers use other pools.
+    """
+    url = make_url(url)
+    options = {"pool_recycle": DATABASE_POOL_RECYCLE, "pool_pre_ping": DATABASE_POOL_PRE_PING}
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        options.update(pool_size=DATABASE_POOL_SIZE, max_overflow=DATABASE_MAX_OVERFLOW, pool_timeout=DATABASE_POOL_TIMEOUT)
+    return options
+
+def configure_sqlite(engine):
+    """
+    Writes rely on the foreign keys being enforced, which SQLite only does when asked on each connection.
+
+    pysqlite (and aiosqlite) only send BEGIN before an INSERT/UPDATE/DELETE, so a SAVEPOINT opened first becomes
+    the outermost transaction and its RELEASE commits everything. The driver's own transaction handling is
+    turned off and BEGIN sent when SQLAlchemy begins, as SQLAlchemy documents, so a session is one transaction
+    and begin_nested() a real savepoint inside it. A connection begun with execution option
+    sqlite_begin="immediate" takes the write lock right away, instead of at its first write.
+    """
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            if connection.get_execution_options().get("sqlite_begin") == "immediate":
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            else:
+                connection.exec_driver_sql("BEGIN")
+
+# Engines are created on first use, so importing the app (e.g. in a gunicorn --preload master) opens nothing
+_engine = None
+_async_engine = None
+_reader_engines = None
+_async_reader_engines = None
+_engine_lock = threading.Lock()
+_engine_hooks = []
+_next_reader = itertools.count()
+
+def on_engine_created(hook):
+    """
+    Registers hook(sync_engine) to run on every engine, including the async engine's sync_engine.
+    """
+    _engine_hooks.append(hook)
+    for engine in get_engines():
+        hook(engine)
+
+def _created(engine):
+    configure_sqlite(engine)
+    for hook in _engine_hooks:
+        hook(engine)
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_pool_options(SQLALCHEMY_DATABASE_URL))
+                _created(engine)
+                _engine = engine
+    return _engine
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                url = get_async_url(SQLALCHEMY_DATABASE_URL)
+                engine = create_async_engine(url, **get_pool_options(url))
+                _created(engine.sync_engine)
+                _async_engine = engine
+    return _async_engine
+
+def get_reader_engines():
+    """
+    One engine per replica in DATABASE_READER_URLS, empty when there are none.
+    """
+    global _reader_engines
+    if _reader_engines is None:
+        with _engine_lock:
+            if _reader_engines is None:
+                engines = [create_engine(url, **get_pool_options(url)) for url in DATABASE_READER_URLS]
+                for engine in engines:
+                    _created(engine)
+                _reader_engines = engines
+    return _reader_engines
+
+def get_async_reader_engines():
+    global _async_reader_engines
+    if _async_reader_engines is None:
+        with _engine_lock:
+            if _async_reader_engines is None:
+                engines = [create_async_engine(url, **get_pool_options(url))
+                           for url in map(get_async_url, DATABASE_READER_URLS)]
+                for engine in engines:
+                    _created(engine.sync_engine)
+                _async_reader_engines = engines
+    return _async_reader_engines
+
+def _pick(engines):
+    return engines[next(_next_reader) % len(engines)]
+
+def get_engines():
+    """
+    Engines created so far in this process, primary first.
+    """
+    engines = [_engine, _async_engine.sync_engine if _async_engine is not None else None]
+    engines += _reader_engines or []
+    engines += [engine.sync_engine for engine in _async_reader_engines or []]
+    return [engine for engine in engines if engine is not None]
+
+def _dispose_after_fork():
+    """
+    A forked worker must not share the parent's pooled sockets. close=False leaves them open for the parent.
+    """
+    for engine in get_engines():
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+# Writes return the objects they just wrote, so they must stay readable after commit without a refresh
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+# Objects must stay readable after commit, since the response is serialized outside the session's greenlet
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+# Sessions that may write begin immediately on SQLite: one that read first and then wrote could otherwise fail
+# with "database is locked" instead of waiting, when another writer got the lock in between
+WRITE_OPTIONS = {"sqlite_begin": "immediate"}
+
+def new_session():
+    return SessionLocal(bind=get_engine().execution_options(**WRITE_OPTIONS))
+
+def new_async_session():
+    return AsyncSessionLocal(bind=get_async_engine().execution_options(**WRITE_OPTIONS))
+
+def new_read_session():
+    """
+    Bound to the next replica, or to the primary when no replica is configured.
+    """
+    engines = get_reader_engines()
+    return SessionLocal(bind=_pick(engines) if engines else get_engine())
+
+def new_async_read_session():
+    engines = get_async_reader_engines()
+    return AsyncSessionLocal(bind=_pick(engines) if engines else get_async_engine())
 
 Base = declarative_base()
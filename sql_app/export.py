@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import zlib
+from enum import Enum
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+class ExportFormat(Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+class _Encoder:
+    """
+    Encodes one partition of rows at a time, so each chunk sent to the client carries many rows instead of one.
+    """
+
+    def __init__(self, columns: list[str], export_format: ExportFormat, compress: bool):
+        self.columns = columns
+        self.export_format = export_format
+        self.compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+        self.header = export_format == ExportFormat.csv
+
+    def _text(self, rows):
+        if self.export_format == ExportFormat.ndjson:
+            return "".join(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in rows)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self.header:
+            writer.writerow(self.columns)
+            self.header = False
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+    def encode(self, rows):
+        data = self._text(rows).encode()
+        return self.compressor.compress(data) if self.compressor else data
+
+    def finish(self):
+        data = self._text([]).encode() if self.header else b""
+        if self.compressor:
+            data = self.compressor.compress(data) + self.compressor.flush()
+        return data
+
+
+def stream_rows(columns: list[str], partitions, export_format: ExportFormat, compress: bool = False):
+    """
+    Encodes partitions of rows lazily, so memory use does not depend on how many rows are exported.
+    """
+    encoder = _Encoder(columns, export_format, compress)
+    for rows in partitions:
+        data = encoder.encode(rows)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def astream_rows(columns: list[str], partitions, export_format: ExportFormat, compress: bool = False):
+    """
+    Same as stream_rows for partitions read from an async result.
+    """
+    encoder = _Encoder(columns, export_format, compress)
+    async for rows in partitions:
+        data = encoder.encode(rows)
+        if data:
+            yield data
+    yield encoder.finish()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import admission, async_crud, changes, crud, schemas
+
+# When on, member creates and updates from concurrent requests are committed together
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+# A batch is committed when it holds GROUP_COMMIT_MAX_BATCH writes, or GROUP_COMMIT_MAX_DELAY_MS after its first one
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get("GROUP_COMMIT_MAX_DELAY_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "100"))
+
+
+class GroupCommitter:
+    """
+    Queues member writes and commits them in batches from a single writer task, one transaction per batch.
+
+    Under a burst of writes the cost of a commit (one fsync on the database server) is shared by the whole
+    batch, in exchange for up to max_delay of added latency. Each caller still gets its own result or error.
+    """
+
+    def __init__(self, max_delay: float, max_batch: int):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._queue = None
+        self._full = None
+        self._writer = None
+
+    async def create_member(self, db: Session | AsyncSession, member: schemas.MemberCreate):
+        return await self._submit(db, schemas.ChangeOperation.created, (member,))
+
+    async def update_member(self, db: Session | AsyncSession, member: schemas.MemberUpdate, member_id: int):
+        return await self._submit(db, schemas.ChangeOperation.updated, (member, member_id))
+
+    async def _submit(self, db: Session | AsyncSession, operation: schemas.ChangeOperation, args: tuple):
+        # The caller's connection is not needed while it waits, and a burst of waiting callers
+        # holding theirs would leave the writer without one. Nor is its write slot: held, it would
+        # cap every batch at ADMISSION_WRITE_LIMIT writes.
+        await async_crud.release(db)
+        admission.release_slot()
+        if self._writer is None:
+            # Started on first use, in the loop serving the requests
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._writer = asyncio.create_task(self._write_batches())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, args, future))
+        if self._queue.qsize() + 1 >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _write_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Waits on an event rather than on queue.get(), so a timeout can never drop a dequeued write
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._commit(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _commit(self, batch: list):
+        try:
+            results = await async_crud.run_on_session(crud.write_members, [(operation, args) for operation, args, _ in batch])
+        except Exception as exc:
+            # The commit itself failed, so did every write in the batch
+            results = [exc] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.cancelled():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        changes.feed.notify()
+
+    async def close(self):
+        """
+        Commits what is still queued and stops the writer.
+        """
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        self._queue = self._full = self._writer = None
+
+
+committer = GroupCommitter(GROUP_COMMIT_MAX_DELAY_MS / 1000, GROUP_COMMIT_MAX_BATCH)
@@ -1,30 +1,181 @@
+import functools
+import math
+import operator
+import os
+import time
 from enum import Enum
-from fastapi import Body, FastAPI, HTTPException, Path, status
+from fastapi import Body, FastAPI, Header, HTTPException, Path, Query, Request, Response, status
 from sql_app.models import Member, Plan
 from typing import Annotated
 
+import anyio.to_thread
 from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import EmailStr
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncResult, AsyncSession
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas
-from .database import SessionLocal, engine
-
-models.Base.metadata.create_all(bind=engine)
+from . import admission, async_crud, batch, billing, bulk, caching, changes, crud, database, export, group_commit, metrics, models, pagination, plan_cache, profiling, schemas, serialization, warmup
+from .database import DATABASE_MODE
+from .profiling import run_in_threadpool
 
 app = FastAPI(title="Trembolona Gym API",
               description="This API is used to manage gym's members and plans. Maciel e Márcio, para ficar grande tem um segredinho: trembolona.")
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+database.on_engine_created(metrics.instrument_engine)
+app.add_middleware(metrics.MetricsMiddleware)
+# Outermost, so a profile is saved after the response and its metrics are done
+app.add_middleware(profiling.ProfilingMiddleware)
+
+@app.on_event("startup")
+async def start_worker():
+    # Shared by the sync handlers, the sync dependencies and the sync-mode queries
+    anyio.to_thread.current_default_thread_limiter().total_tokens = admission.THREADPOOL_SIZE
+    # Runs in each worker after the fork, so the parent never opens a connection. The schema is left
+    # to python -m sql_app.migrate.
+    warmup.start(app)
+
+@app.on_event("shutdown")
+async def stop_worker():
+    await warmup.stop()
+    await group_commit.committer.close()
+
+# Dependency, each session waits for an admission slot of its group first
+def get_sync_db(_admitted=Depends(admission.admit_write)):
+    db = database.new_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db(_admitted=Depends(admission.admit_write)):
+    async with database.new_async_session() as db:
+        yield db
+
+get_db = get_async_db if DATABASE_MODE == "async" else get_sync_db
+
+# Set by writes when replicas are configured, holds the time until which the client reads from the primary
+PRIMARY_UNTIL_COOKIE = "db_primary_until"
+# Upper bound for the window a client may ask for with the X-Stick-To-Primary header
+MAX_STICKY_SECONDS = 60.0
+
+def stick_to_primary(request: Request, response: Response):
+    """
+    Dependency of the write endpoints. Clients may pick their own window, in seconds, with X-Stick-To-Primary.
+    """
+    if not database.DATABASE_READER_URLS:
+        return
+    try:
+        window = float(request.headers.get("x-stick-to-primary", database.DATABASE_STICKY_SECONDS))
+    except ValueError:
+        window = database.DATABASE_STICKY_SECONDS
+    window = min(max(window, 0.0), MAX_STICKY_SECONDS)
+    if window:
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, f"{time.time() + window:.3f}", max_age=math.ceil(window),
+                            httponly=True, samesite="lax")
+
+def reads_from_primary(request: Request):
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_sync_read_db(request: Request, _admitted=Depends(admission.admit_read)):
+    db = database.new_session() if reads_from_primary(request) else database.new_read_session()
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_read_db(request: Request, _admitted=Depends(admission.admit_read)):
+    new_async_session = database.new_async_session if reads_from_primary(request) else database.new_async_read_session
+    async with new_async_session() as db:
+        yield db
+
+# Read-only endpoints use a replica when there is one, unless the client wrote recently
+get_read_db = get_async_read_db if DATABASE_MODE == "async" else get_sync_read_db
+
+async def get_after_id(
+    cursor: Annotated[str | None, Query(description="Opaque cursor returned as `next_cursor` by the previous page")] = None,
+):
+    try:
+        return pagination.decode_cursor(cursor)
+    except pagination.InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+async def get_ids(
+    ids: Annotated[str | None, Query(description="Comma separated IDs to fetch at once, in place of paging. Cursor and limit are then ignored.",
+                                     examples=["1,2,3"])] = None,
+):
+    if ids is None:
+        return None
+    try:
+        return batch.parse_ids(ids)
+    except batch.InvalidIds as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        )
+
+PageLimit = Annotated[int, Query(description="Maximum number of items in the page", ge=1, le=pagination.MAX_PAGE_SIZE)]
+
+MemberExpand = Annotated[schemas.MemberExpand | None, Query(description="Pass `plan` to embed each member's plan, loaded in the same query")]
+
+def to_members(members, expand: schemas.MemberExpand | None):
+    """
+    Validated up front, since these endpoints answer either shape and the plain one must not touch member.plan.
+    """
+    schema = schemas.MemberWithPlan if expand is schemas.MemberExpand.plan else schemas.Member
+    return [schema.model_validate(member) for member in members]
+
+def export_response(rows, export_format: export.ExportFormat, compress: bool):
+    stream_rows = export.astream_rows if isinstance(rows, AsyncResult) else export.stream_rows
+    return StreamingResponse(
+        stream_rows(list(rows.keys()), rows.partitions(), export_format, compress),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={"Content-Encoding": "gzip"} if compress else None,
+    )
+
+def member_conflict(exc: IntegrityError, plan_detail: str):
+    """
+    Member writes rely on the email unique key and the plan foreign key instead of checking them first.
+    """
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=plan_detail if crud.is_foreign_key_violation(exc) else "Member already exists",
+    )
+
+async def expanded_versions(db: Session | AsyncSession, expand: schemas.MemberExpand | None):
+    """
+    ETag parts for embedded plans, so renaming a plan changes the tag of the members embedding it.
+    """
+    if expand is None:
+        return ()
+    return ("plans", (await async_crud.get_plan_catalog(db)).version)
+
+async def check_members_etag(request: Request, response: Response, db: Session | AsyncSession,
+                             expand: schemas.MemberExpand | None = None):
+    """
+    Member lists change only when the members version does, so a matching client gets a 304 before the page is read.
+    """
+    version = await async_crud.get_table_version(db, models.Member.__tablename__)
+    etag = caching.make_etag("members", version, *await expanded_versions(db, expand))
+    caching.check_etag(request, response, etag, caching.CACHE_MAX_AGE_MEMBERS)
+
+def check_plans_etag(request: Request, response: Response, catalog):
+    caching.check_etag(request, response, caching.make_etag("plans", catalog.version), caching.CACHE_MAX_AGE_PLANS,
+                       caching.CACHE_SHARED_MAX_AGE_PLANS)
+
 class Tags(Enum):
     members = "Members"
     plans = "Plans"
+    changes = "Changes"
+    billing = "Billing"
+    monitoring = "Monitoring"
 
 ############################################################
 #=====================view for members=====================#
@@ -32,49 +183,158 @@ class Tags(Enum):
 
 @app.get("/members",
          tags=[Tags.members.value],
-         response_model=list[schemas.Member],
+         response_model=schemas.MemberWithPlanBatch | schemas.MemberBatch | schemas.MemberWithPlanPage | schemas.MemberPage,
          response_model_exclude_unset=True,
          summary="Get all members",
-         description="Returns a list with all members in dict format",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No members found in dict"}},
+         description="Returns a page of members ordered by ID in dict format, or the members whose IDs are listed in ids",
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No members found in dict"},
+                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: invalid cursor or ids"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
+         )
+async def get_members(
+    request: Request,
+    response: Response,
+    after_id: int | None = Depends(get_after_id),
+    limit: PageLimit = pagination.DEFAULT_PAGE_SIZE,
+    ids: list[int] | None = Depends(get_ids),
+    expand: MemberExpand = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    This endpoint returns members page by page. To get the next page pass the returned
+    **next_cursor** as **cursor**; the last page has no **next_cursor**.
+    Send the returned **ETag** as **If-None-Match** to get a 304 while no member has changed.
+
+    With **ids** it returns those members instead, in the requested order, and lists the IDs not found in **missing**.
+    With **expand=plan** each member carries its **plan**.
+    """
+    expand_plan = expand is schemas.MemberExpand.plan
+    await check_members_etag(request, response, db, expand)
+    if ids is not None:
+        members = await async_crud.get_members_by_ids(db, batch.unique(ids), batch.BATCH_CHUNK_SIZE, expand_plan)
+        return batch.in_request_order(ids, to_members(members, expand))
+    if expand_plan:
+        members = await async_crud.get_members(db, after_id, limit + 1, expand_plan)
+    else:
+        # Plain pages are the hot path: column tuples encoded straight to JSON
+        members = await async_crud.get_member_rows(db, after_id, limit + 1)
+
+
+    if members == []:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No members found in dict",
+        )
+    members, next_cursor = pagination.paginate(members, limit)
+    if expand_plan:
+        return {"items": to_members(members, expand), "next_cursor": next_cursor}
+    return serialization.page_response(serialization.to_dicts(crud.MEMBER_FIELDS, members), next_cursor, response)
+
+@app.get("/members/export",
+         tags=[Tags.members.value],
+         response_class=StreamingResponse,
+         summary="Export all members",
+         description="Streams all members ordered by ID as NDJSON or CSV, optionally gzip compressed",
+         responses={status.HTTP_200_OK: {"content": {"application/x-ndjson": {}, "text/csv": {}}}},
          )
-def get_members(db: Session = Depends(get_db)):
+async def export_members(
+    export_format: Annotated[export.ExportFormat, Query(alias="format", description="Output format")] = export.ExportFormat.ndjson,
+    compress: Annotated[bool, Query(alias="gzip", description="Compress the output with gzip")] = False,
+    db: Session = Depends(get_read_db)
+):
     """
-    This endpoint returns all members, it does not receive parameters.
+    This endpoint streams every member without loading the whole table in memory,
+    it is meant for bulk syncs. Rows are sent as they are read from the database.
     """
-    members = crud.get_members(db)
+    rows = await async_crud.stream_members(db, export.EXPORT_CHUNK_SIZE)
+    return export_response(rows, export_format, compress)
 
+@app.post("/members/batch-get",
+          tags=[Tags.members.value],
+          response_model=schemas.MemberBatch,
+          summary="Get many members",
+          description="Returns the members whose IDs are listed in the body, in the requested order, and the IDs not found",
+          )
+async def batch_get_members(
+    body: Annotated[schemas.BatchGet, Body(description="IDs to fetch")],
+    db: Session = Depends(get_read_db)
+):
+    """
+    Meant for callers holding many IDs at once, it replaces one **GET /members/{member_id}** per ID.
+    Repeated IDs are returned once. Nothing is written, so it reads from a replica when there is one.
+    """
+    return batch.in_request_order(body.ids, await async_crud.get_members_by_ids(db, batch.unique(body.ids), batch.BATCH_CHUNK_SIZE))
 
+@app.get("/members/search",
+         tags=[Tags.members.value],
+         response_model=schemas.MemberPage,
+         response_model_exclude_unset=True,
+         summary="Search members",
+         description="Returns a page of members whose first name, last name or email starts with the searched text",
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No members found in dict"},
+                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: invalid cursor"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
+         )
+async def search_members(
+    request: Request,
+    response: Response,
+    q: Annotated[str, Query(description="Beginning of the member's first name, last name or email", min_length=2, max_length=50)],
+    after_id: int | None = Depends(get_after_id),
+    limit: PageLimit = 10,
+    db: Session = Depends(get_read_db)
+):
+    """
+    This endpoint is meant for type-ahead searches. Members are ordered by ID and returned page by page,
+    pass the returned **next_cursor** as **cursor** to get the next page.
+    """
+    await check_members_etag(request, response, db)
+    members = await async_crud.search_members(db, q, after_id, limit + 1)
     if members == []:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="No members found in dict",
         )
-    return members
+    members, next_cursor = pagination.paginate(members, limit)
+    return {"items": members, "next_cursor": next_cursor}
 
 
 @app.get("/members/{member_id}",
          tags=[Tags.members.value],
-         response_model=schemas.Member,
+         response_model=schemas.MemberWithPlan | schemas.Member,
          response_model_exclude_unset=True,
          summary="Get a member",
-         description="Returns a specific member in dict format based on its ID",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Member not found in dict"}},
+         description="Returns a specific member in dict format based on its ID, optionally with its plan",
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Member not found in dict"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
          )
-def get_member(
+async def get_member(
+    request: Request,
+    response: Response,
     member_id: Annotated[int, Path(description="Member's ID", ge=0)],
-    db: Session = Depends(get_db)
+    expand: MemberExpand = None,
+    db: Session = Depends(get_read_db)
 ):
     """
     To retrieve information about a member it is necessary to pass the member's ID.
+    Send the returned **ETag** as **If-None-Match** to get a 304 while the member is unchanged.
+    With **expand=plan** the member carries its **plan**.
     """
-    member = crud.get_member(db, member_id)
+    plan_versions = await expanded_versions(db, expand)
+    if request.headers.get("if-none-match"):
+        # Revalidation only reads the member's version
+        version = await async_crud.get_member_version(db, member_id)
+        if version is not None:
+            caching.check_etag(request, response, caching.make_etag("member", member_id, version, *plan_versions),
+                               caching.CACHE_MAX_AGE_MEMBERS)
+    member = await async_crud.get_member(db, member_id, expand is schemas.MemberExpand.plan)
     if member is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Member not found in dict",
         )
-    return member
+    response.headers.update(caching.cache_headers(caching.make_etag("member", member.ID, member.version, *plan_versions),
+                                                  caching.CACHE_MAX_AGE_MEMBERS))
+    return to_members([member], expand)[0]
 
 @app.get("/membersByName/{first_name}/{last_name}",
          tags=[Tags.members.value],
@@ -82,26 +342,126 @@ def get_member(
          response_model_exclude_unset=True,
          summary="Get a member",
          description="Returns a specific member in dict format based on its name",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Member not found in dict"}},
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Member not found in dict"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
          )
-def get_member(
+async def get_member(
+    request: Request,
+    response: Response,
     first_name: Annotated[str, Path(description="Member's first name")],
     last_name: Annotated[str, Path(description="Member's last name")],
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     To retrieve information about a member it is necessary to pass the member's first and last name.
     """
-    member = crud.get_member_by_name(db, first_name, last_name)
+    member = await async_crud.get_member_by_name(db, first_name, last_name)
     if member is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Member not found in dict",
         )
+    caching.check_etag(request, response, caching.make_etag("member", member.ID, member.version),
+                       caching.CACHE_MAX_AGE_MEMBERS)
     return member
 
 
+async def get_bulk_items(request: Request):
+    try:
+        items = bulk.parse_body(await request.body(), request.headers.get("content-type"))
+    except bulk.InvalidBulkBody as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        )
+    if items == []:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Missing required fields",
+        )
+    if len(items) > bulk.MAX_BULK_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {bulk.MAX_BULK_ROWS} members per request",
+        )
+    return items
+
+
+@app.put("/members/by-email/{email}",
+         dependencies=[Depends(stick_to_primary)],
+         tags=[Tags.members.value],
+         response_model=schemas.UpsertedMember,
+         response_model_exclude_unset=True,
+         summary="Create or update a member by email",
+         description="Creates the member, or updates the one with this email, in one statement. The member is returned with whether it was created or updated.",
+         responses={status.HTTP_201_CREATED: {"description": "Created: no member had this email", "model": schemas.UpsertedMember},
+                    status.HTTP_409_CONFLICT: {"description": "Conflict Error: Member's plan does not exist"}},
+         )
+async def upsert_member(
+    response: Response,
+    email: Annotated[EmailStr, Path(description="Member's e-mail, the key the member is found by", max_length=50)],
+    member: Annotated[schemas.MemberUpsert, Body(description="Member's other fields",
+                                                 examples=[{"first_name": "joao", "last_name": "trembo", "plan_id": 1}])],
+    db: Session = Depends(get_db)
+):
+    """
+    For syncing members from another system without knowing whether they exist: one request, no read first.
+
+    - **email**: a member with this email is updated, with all the fields sent; otherwise one is created
+    - **plan_id**: must be an existing plan
+
+    Answers **201** when the member was created and **200** when it was updated, with **status** saying the same.
+    """
+    getPlan = await async_crud.get_plan(db, member.plan_id)
+    if getPlan is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Member's plan does not exist",
+        )
+    try:
+        member, created = await async_crud.upsert_member(db, schemas.MemberCreate(email=email, **member.model_dump()))
+    except IntegrityError as exc:
+        raise member_conflict(exc, "Member's plan does not exist")
+    if created:
+        response.status_code = status.HTTP_201_CREATED
+    return schemas.UpsertedMember(**member.model_dump(),
+                                  status=schemas.BulkStatus.created if created else schemas.BulkStatus.updated)
+
+
+@app.put("/members/by-email",
+         dependencies=[Depends(stick_to_primary)],
+         tags=[Tags.members.value],
+         response_model=schemas.MemberUpsertReport,
+         summary="Create or update many members by email",
+         description="Creates or updates many members in one transaction, with one statement per chunk. A report with one result per row is returned.",
+         responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: empty or malformed body"},
+                    status.HTTP_409_CONFLICT: {"description": "Conflict Error: a member's plan was deleted during the request"},
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "Payload Too Large: too many members"}},
+         openapi_extra={"requestBody": {"required": True, "content": {
+             "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/MemberCreate"}}},
+             bulk.NDJSON_MEDIA_TYPE: {"schema": {"type": "string", "description": "One member object per line"}},
+         }}},
+         )
+async def upsert_members(
+    items: list = Depends(get_bulk_items),
+    db: Session = Depends(get_db)
+):
+    """
+    The body is the same as **POST /members/bulk**'s. Each member is created, or updated if its email exists:
+
+    - **plan_id**: must be an existing plan
+    - **email**: must not be repeated in the body
+
+    Invalid rows are rejected and reported, the others are written and reported as **created** or **updated**.
+    """
+    try:
+        return await async_crud.upsert_members(db, items)
+    except IntegrityError as exc:
+        raise member_conflict(exc, "A member's plan does not exist")
+
+
 @app.put("/members/{member_id}",
+         dependencies=[Depends(stick_to_primary)],
          tags=[Tags.members.value],
          response_model=schemas.Member,
          response_model_exclude_unset=True,
@@ -111,7 +471,7 @@ def get_member(
                     status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: empty body"},
                     status.HTTP_409_CONFLICT: {"description": "Conflict Error: Member's new plan does not exist"}},
          )
-def update_member(
+async def update_member(
     member_id: Annotated[int, Path(description="Member's ID", ge=0)],
     member: Annotated[schemas.MemberUpdate, Body(description="Updated member's data",
             )] = ...,
@@ -131,19 +491,19 @@ def update_member(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Missing required fields",
         )
-    getMember = crud.get_member(db, member_id)
-    if getMember is None:
-        raise HTTPException(
-            status_code=status.HTTP_204_NO_CONTENT,
-            detail="Member not found in dict",
-        )
-    member = crud.update_member(db, member,member_id)
-    getPlan = crud.get_plan(db, member.plan_id)
+    getPlan = await async_crud.get_plan(db, member.plan_id)
     if getPlan is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Member's new plan does not exist",
         )
+    try:
+        if group_commit.GROUP_COMMIT:
+            member = await group_commit.committer.update_member(db, member, member_id)
+        else:
+            member = await async_crud.update_member(db, member,member_id)
+    except IntegrityError as exc:
+        raise member_conflict(exc, "Member's new plan does not exist")
     
     if member is None:
         raise HTTPException(
@@ -155,7 +515,58 @@ def update_member(
 
 
 
+@app.patch("/members/{member_id}",
+           dependencies=[Depends(stick_to_primary)],
+           tags=[Tags.members.value],
+           response_model=schemas.PatchedMember,
+           response_model_exclude_unset=True,
+           summary="Patch a member",
+           description="Updates only the member's fields present in the body. The ID and the fields written are returned.",
+           responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Member not found in dict"},
+                      status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: no fields to update"},
+                      status.HTTP_409_CONFLICT: {"description": "Conflict Error: Member already exists, or its new plan does not exist"},
+                      status.HTTP_412_PRECONDITION_FAILED: {"description": "Precondition Failed: the member changed since the ETag in If-Match"}},
+           )
+async def patch_member(
+    response: Response,
+    member_id: Annotated[int, Path(description="Member's ID", ge=0)],
+    member: Annotated[schemas.MemberPatch, Body(description="Fields to update", examples=[{"email": "joao@testoAquosa.com"}])],
+    if_match: Annotated[str | None, Header(description="ETag of the member as last read, the update fails with 412 if it changed since")] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Send only the fields to change; the others are left as they are, and nothing is read before the update.
+    Send the **ETag** of **GET /members/{member_id}** as **If-Match** so a concurrent change is not overwritten.
+    The response's **ETag** is the member's new one.
+    """
+    if not member.model_fields_set:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update",
+        )
+    try:
+        patched = await async_crud.patch_member(db, member, member_id,
+                                                caching.if_match_versions(if_match, "member", member_id))
+    except crud.VersionMismatch as exc:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=str(exc),
+        )
+    except IntegrityError as exc:
+        raise member_conflict(exc, "Member's new plan does not exist")
+    if patched is None:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="Member not found in dict",
+        )
+    member, version = patched
+    response.headers["ETag"] = caching.make_etag("member", member_id, version)
+    return member
+
+
+
 @app.delete("/members/{member_id}",
+            dependencies=[Depends(stick_to_primary)],
             tags=[Tags.members.value],
             response_model=schemas.Member,
             response_model_exclude_unset=True,
@@ -163,20 +574,14 @@ def update_member(
             summary="Delete a member",
             description="Deletes a specific member in dict format based on its ID. The deleted member is returned.",
             )
-def delete_member(
+async def delete_member(
     member_id: Annotated[int, Path(description="Member's ID", ge=0)],
     db: Session = Depends(get_db)
 ):
     """
     To delete a member it is necessary to pass the member's ID.
     """
-    getMember = crud.get_member(db, member_id)
-    if getMember is None:
-        raise HTTPException(
-            status_code=status.HTTP_204_NO_CONTENT,
-            detail="Member not found in dict",
-        )
-    member = crud.delete_member(db, member_id)
+    member = await async_crud.delete_member(db, member_id)
     if member is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
@@ -187,6 +592,7 @@ def delete_member(
 
 
 @app.post("/members",
+          dependencies=[Depends(stick_to_primary)],
           tags=[Tags.members.value],
           response_model=schemas.Member,
           response_model_exclude_unset=True,
@@ -199,7 +605,7 @@ def delete_member(
           }
           )
 
-def create_member(
+async def create_member(
     member: Annotated[
         schemas.MemberCreate,
         Body(
@@ -234,22 +640,53 @@ def create_member(
         )
 
     
-    getPlan = crud.get_plan(db, member.plan_id)
+    getPlan = await async_crud.get_plan(db, member.plan_id)
     if getPlan is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Member's plan does not exist",
         )
-    getMember = crud.get_member_by_name(db, member.first_name,member.last_name)
+    try:
+        if group_commit.GROUP_COMMIT:
+            member = await group_commit.committer.create_member(db, member)
+        else:
+            member = await async_crud.create_member(db, member)
+    except IntegrityError as exc:
+        raise member_conflict(exc, "Member's plan does not exist")
+    return member
 
-    if getMember != None:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Member already exists",
-        )
 
-    member = crud.create_member(db, member)
-    return member
+@app.post("/members/bulk",
+          dependencies=[Depends(stick_to_primary)],
+          tags=[Tags.members.value],
+          response_model=schemas.MemberBulkReport,
+          summary="Create many members",
+          description="Creates many members in one transaction. A report with one result per row is returned.",
+          responses={status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: empty or malformed body"},
+                     status.HTTP_409_CONFLICT: {"description": "Conflict Error: a member was created, or its plan deleted, during the request"},
+                     status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "Payload Too Large: too many members"}},
+          openapi_extra={"requestBody": {"required": True, "content": {
+              "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/MemberCreate"}}},
+              bulk.NDJSON_MEDIA_TYPE: {"schema": {"type": "string", "description": "One member object per line"}},
+          }}},
+          )
+async def create_members(
+    items: list = Depends(get_bulk_items),
+    db: Session = Depends(get_db)
+):
+    """
+    Send a JSON array of members, or one member per line with the `application/x-ndjson` content type.
+    Every member follows the same rules as **POST /members**:
+
+    - **plan_id**: must be an existing plan
+    - **email**: must not belong to another member nor be repeated in the body
+
+    Invalid rows are rejected and reported, the valid ones are still created.
+    """
+    try:
+        return await async_crud.import_members(db, items)
+    except IntegrityError as exc:
+        raise member_conflict(exc, "A member's plan does not exist")
 
 ############################################################
 ##=====================view for plans=====================##
@@ -257,25 +694,97 @@ def create_member(
 
 @app.get("/plans",
          tags=[Tags.plans.value],
-         response_model=list[schemas.Plan],
+         response_model=schemas.PlanBatch | schemas.PlanPage,
          response_model_exclude_unset=True,
          summary="Get all plans",
-         description="Returns a list with all plans in dict format",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No plans found in dict"}},
+         description="Returns a page of plans ordered by ID in dict format, or the plans whose IDs are listed in ids",
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No plans found in dict"},
+                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: invalid cursor or ids"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
          )
-def get_plans(db: Session = Depends(get_db)):
+async def get_plans(
+    request: Request,
+    response: Response,
+    after_id: int | None = Depends(get_after_id),
+    limit: PageLimit = pagination.DEFAULT_PAGE_SIZE,
+    ids: list[int] | None = Depends(get_ids),
+    db: Session = Depends(get_read_db)
+):
     """
-    This endpoint returns all plans, it does not receive parameters.
+    This endpoint returns plans page by page. To get the next page pass the returned
+    **next_cursor** as **cursor**; the last page has no **next_cursor**.
+    Send the returned **ETag** as **If-None-Match** to get a 304 while no plan has changed.
+
+    With **ids** it returns those plans instead, in the requested order, and lists the IDs not found in **missing**.
     """
-    plans = crud.get_plans(db)
+    if ids is not None:
+        plans = await async_crud.get_plans_by_ids(db, batch.unique(ids))
+        check_plans_etag(request, response, plan_cache.catalog)
+        return batch.in_request_order(ids, plans)
+    catalog = await async_crud.get_plan_catalog(db)
+    check_plans_etag(request, response, catalog)
+    plans = catalog.page_dicts(after_id, limit + 1)
     if plans == []:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="No plans found in dict",
         )
     
-    return plans
+    plans, next_cursor = pagination.paginate(plans, limit, operator.itemgetter("ID"))
+    return serialization.page_response(plans, next_cursor, response)
+
+@app.get("/plans/export",
+         tags=[Tags.plans.value],
+         response_class=StreamingResponse,
+         summary="Export all plans",
+         description="Streams all plans ordered by ID as NDJSON or CSV, optionally gzip compressed",
+         responses={status.HTTP_200_OK: {"content": {"application/x-ndjson": {}, "text/csv": {}}}},
+         )
+async def export_plans(
+    export_format: Annotated[export.ExportFormat, Query(alias="format", description="Output format")] = export.ExportFormat.ndjson,
+    compress: Annotated[bool, Query(alias="gzip", description="Compress the output with gzip")] = False,
+    db: Session = Depends(get_read_db)
+):
+    """
+    This endpoint streams every plan without loading the whole table in memory.
+    """
+    rows = await async_crud.stream_plans(db, export.EXPORT_CHUNK_SIZE)
+    return export_response(rows, export_format, compress)
+
 
+@app.post("/plans/batch-get",
+          tags=[Tags.plans.value],
+          response_model=schemas.PlanBatch,
+          summary="Get many plans",
+          description="Returns the plans whose IDs are listed in the body, in the requested order, and the IDs not found",
+          )
+async def batch_get_plans(
+    body: Annotated[schemas.BatchGet, Body(description="IDs to fetch")],
+    db: Session = Depends(get_read_db)
+):
+    """
+    Plans are served from memory, so this does not query the database unless an ID is not known yet.
+    Repeated IDs are returned once.
+    """
+    return batch.in_request_order(body.ids, await async_crud.get_plans_by_ids(db, batch.unique(body.ids)))
+
+@app.get("/plans/stats",
+         tags=[Tags.plans.value],
+         response_model=schemas.PlanStatsList,
+         summary="Get plan statistics",
+         description="Returns each plan's member count and monthly revenue, and their totals",
+         )
+async def get_plan_stats(db: Session = Depends(get_read_db)):
+    """
+    Reads one counter row per plan, kept up to date by every member write, instead of counting members.
+    Revenue is the member count times the plan's current value.
+    """
+    items = [schemas.PlanStats.model_validate(row) for row in await async_crud.get_plan_stats(db)]
+    return {
+        "items": items,
+        "member_count": sum(item.member_count for item in items),
+        "revenue": round(sum(item.revenue for item in items), 2),
+    }
 
 @app.get("/plans/{plan_id}",
          tags=[Tags.plans.value],
@@ -283,21 +792,25 @@ def get_plans(db: Session = Depends(get_db)):
          response_model_exclude_unset=True,
          description="Returns a specific plan in dict format based on its ID",
          summary="Get a plan",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"}},
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
          )
-def get_plan(
+async def get_plan(
+    request: Request,
+    response: Response,
     plan_id: Annotated[int, Path(description="Plan's ID", ge=0)],
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     To retrieve information about a plan it is necessary to pass the plan's ID.
     """
-    plan = crud.get_plan(db, plan_id)
+    plan = await async_crud.get_plan(db, plan_id)
     if plan is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Plan not found in dict",
         )
+    check_plans_etag(request, response, await async_crud.get_plan_catalog(db))
     return plan
 
 @app.get("/plansByName/{plan_name}",
@@ -306,41 +819,59 @@ def get_plan(
          response_model_exclude_unset=True,
          description="Returns a specific plan in dict format based on its name",
          summary="Get a plan by its name",
-         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"}},
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
          )
-def get_plan_by_name(
+async def get_plan_by_name(
+    request: Request,
+    response: Response,
     plan_name: Annotated[str, Path(description="Plan's name")],
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     To retrieve information about a plan it is necessary to pass the plan's name.
     """
-    plan = crud.get_plan_by_name(db, plan_name)
+    plan = await async_crud.get_plan_by_name(db, plan_name)
     if plan is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Plan not found in dict",
         )
+    check_plans_etag(request, response, await async_crud.get_plan_catalog(db))
     return plan
 
 @app.get("/plans/{plan_id}/members",
          tags=[Tags.plans.value],
-         response_model=list[schemas.Member],
+         response_model=schemas.MemberWithPlanPage | schemas.MemberPage,
          response_model_exclude_unset=True,
-         description="Returns a list with all members subscribed to a specific plan in dict format based on its ID",
+         description="Returns a page of members subscribed to a specific plan, ordered by ID, in dict format based on its ID",
          summary="Get a plan's members",
          responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"},
-                    status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan has no members"}},
+                    status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan has no members"},
+                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: invalid cursor"},
+                    status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified: the client's copy, named in If-None-Match, is current"},},
 )
-def get_plan_members(
+async def get_plan_members(
+    request: Request,
+    response: Response,
     plan_id: Annotated[int, Path(description="Plan's ID", ge=0)],
-    db: Session = Depends(get_db)
+    after_id: int | None = Depends(get_after_id),
+    limit: PageLimit = pagination.DEFAULT_PAGE_SIZE,
+    expand: MemberExpand = None,
+    db: Session = Depends(get_read_db)
 ):
     """
     To get all members enrolled in a plan it is necessary to pass the plan's ID.
     Plans with no members enrolled will not return users.
+    Members are returned page by page, pass the returned **next_cursor** as **cursor** to get the next page.
+    With **expand=plan** each member carries the **plan**.
     """
-    plan_members = crud.get_plan_members(db, plan_id)
+    expand_plan = expand is schemas.MemberExpand.plan
+    await check_members_etag(request, response, db, expand)
+    if expand_plan:
+        plan_members = await async_crud.get_plan_members(db, plan_id, after_id, limit + 1, expand_plan)
+    else:
+        plan_members = await async_crud.get_plan_member_rows(db, plan_id, after_id, limit + 1)
     if plan_members == []:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
@@ -348,19 +879,24 @@ def get_plan_members(
         )
 
 
-    return plan_members
+    plan_members, next_cursor = pagination.paginate(plan_members, limit)
+    if expand_plan:
+        return {"items": to_members(plan_members, expand), "next_cursor": next_cursor}
+    return serialization.page_response(serialization.to_dicts(crud.MEMBER_FIELDS, plan_members), next_cursor, response)
     
 
 @app.put("/plans/{plan_id}",
+         dependencies=[Depends(stick_to_primary)],
          tags=[Tags.plans.value],
          response_model=schemas.Plan,
          response_model_exclude_unset=True,
          description="Updates a specific plan in dict format based on its ID. All of the plan's fields are updated.",
          summary="Update a plan",
          responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"},
-                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: empty body"}},
+                    status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: empty body"},
+                    status.HTTP_409_CONFLICT: {"description": "Conflict Error: Plan already exists"}},
          )
-def update_plan(
+async def update_plan(
     plan_id: Annotated[int, Path(description="Plan's ID", ge=0)],
     plan: Annotated[schemas.PlanUpdate, Body(description="Updated plan's data",examples=[
                         {
@@ -386,19 +922,76 @@ def update_plan(
             detail="Missing required fields",
         )
     
-    getPlan = crud.get_plan(db, plan_id)
+    try:
+        plan = await async_crud.update_plan(db, plan, plan_id)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Plan already exists",
+        )
 
-    if getPlan is None:
+    if plan is None:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="Plan not found in dict",
+        )
+    return plan
+
+
+@app.patch("/plans/{plan_id}",
+           dependencies=[Depends(stick_to_primary)],
+           tags=[Tags.plans.value],
+           response_model=schemas.PatchedPlan,
+           response_model_exclude_unset=True,
+           summary="Patch a plan",
+           description="Updates only the plan's fields present in the body. The ID and the fields written are returned.",
+           responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"},
+                      status.HTTP_400_BAD_REQUEST: {"description": "Bad Request Error: no fields to update"},
+                      status.HTTP_409_CONFLICT: {"description": "Conflict Error: Plan already exists"},
+                      status.HTTP_412_PRECONDITION_FAILED: {"description": "Precondition Failed: the plans changed since the ETag in If-Match"}},
+           )
+async def patch_plan(
+    response: Response,
+    plan_id: Annotated[int, Path(description="Plan's ID", ge=0)],
+    plan: Annotated[schemas.PlanPatch, Body(description="Fields to update", examples=[{"value": 39.9}])],
+    if_match: Annotated[str | None, Header(description="ETag of the plans as last read, the update fails with 412 if they changed since")] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Send only the fields to change; the others are left as they are.
+    Plans share one version, so the **ETag** sent as **If-Match** is the one of any plan read, and any
+    plan change since then fails the update. The response's **ETag** is the plans' new one.
+    """
+    if not plan.model_fields_set:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update",
+        )
+    try:
+        patched = await async_crud.patch_plan(db, plan, plan_id, caching.if_match_versions(if_match, "plans"))
+    except crud.VersionMismatch as exc:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=str(exc),
+        )
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Plan already exists",
+        )
+    if patched is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Plan not found in dict",
         )
-    plan = crud.update_plan(db, plan, plan_id)
+    plan, version = patched
+    response.headers["ETag"] = caching.make_etag("plans", version)
     return plan
 
 
 
 @app.delete("/plans/{plan_id}",
+            dependencies=[Depends(stick_to_primary)],
             tags=[Tags.plans.value],
             response_model=schemas.Plan,
             response_model_exclude_unset=True,
@@ -407,29 +1000,26 @@ def update_plan(
             responses={status.HTTP_409_CONFLICT: {"description": "Conflict Error: Plan has members. First update members' plan"},
                        status.HTTP_204_NO_CONTENT: {"description": "No Content: Plan not found in dict"}},
             )
-def delete_plan(
+async def delete_plan(
     plan_id: Annotated[int, Path(description="Plan's ID", ge=0)],
     db: Session = Depends(get_db)
 ):
     """
     To delete a plan, first it is necessary to update or delete members whose plan is being deleted.
     """
-    
-    plan_members = crud.get_plan_members(db, plan_id)
-    
-    if plan_members != []:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Plan has members. First update members' plan",
-        )
-    getPlan = crud.get_plan(db, plan_id)
-    if getPlan is None:
+    plan = await async_crud.get_plan(db, plan_id)
+    if plan is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Plan not found in dict",
         )
-    plan = crud.delete_plan(db, plan_id)
-    if plan is None:
+    deleted = await async_crud.delete_plan(db, plan_id)
+    if not deleted and await async_crud.has_members(db, plan_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Plan has members. First update members' plan",
+        )
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="Plan not found in dict",
@@ -438,6 +1028,7 @@ def delete_plan(
 
 
 @app.post("/plans",
+          dependencies=[Depends(stick_to_primary)],
           tags=[Tags.plans.value],
           response_model=schemas.Plan,
           response_model_exclude_unset=True,
@@ -447,7 +1038,7 @@ def delete_plan(
           description="Creates a new plan. The new plan is returned.",
           summary="Create a plan",
           )
-def create_plan(
+async def create_plan(
     plan: Annotated[
         schemas.PlanCreate, 
         Body(description="Updated plan's data",
@@ -473,11 +1064,226 @@ def create_plan(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Missing required fields",
         )
-    getPlan = crud.get_plan_by_name(db, plan.name)
+    getPlan = await async_crud.get_plan_by_name(db, plan.name)
     if getPlan != None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Plan already exists",
         )
-    plan = crud.create_plan(db, plan)
-    return plan
\ No newline at end of file
+    try:
+        plan = await async_crud.create_plan(db, plan)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Plan already exists",
+        )
+    return plan
+
+############################################################
+##====================view for changes====================##
+############################################################
+
+@app.get("/changes",
+         tags=[Tags.changes.value],
+         response_model=schemas.ChangePage,
+         summary="Get changes",
+         description="Returns the member and plan changes written after a sequence number, oldest first",
+         responses={status.HTTP_204_NO_CONTENT: {"description": "No Content: No changes after since"}},
+         )
+async def get_changes(
+    since: Annotated[int, Query(description="Return changes after this seq, usually the last_seq of the previous page", ge=0)] = 0,
+    limit: PageLimit = pagination.DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Replaces polling the member and plan lists to detect changes. Each change names the table, the row's ID
+    and whether it was created, updated or deleted; fetch the current rows with **batch-get**.
+    Pass the returned **last_seq** as **since** to get the following changes.
+    """
+    items = await async_crud.get_changes(db, since, limit)
+    if items == []:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No changes after since",
+        )
+    return {"items": items, "last_seq": items[-1].seq}
+
+
+@app.get("/changes/stream",
+         tags=[Tags.changes.value],
+         response_class=StreamingResponse,
+         summary="Stream changes",
+         description="Streams member and plan changes as Server-Sent Events, starting after a sequence number",
+         responses={status.HTTP_200_OK: {"content": {changes.SSE_MEDIA_TYPE: {}}}},
+         )
+async def stream_changes(
+    since: Annotated[int | None, Query(description="Stream changes after this seq. Defaults to Last-Event-ID, then to the latest change.", ge=0)] = None,
+    last_event_id: Annotated[int | None, Header(description="Sent by EventSource clients when they reconnect", ge=0)] = None,
+):
+    """
+    Each event's **id** is the change's seq, so EventSource clients resume where they stopped on their own.
+    Other clients reconnect with the last seq they processed as **since**.
+    Without either, only changes written from now on are sent.
+    """
+    # No session dependency: it would stay open as long as the stream
+    if since is None:
+        since = last_event_id
+    if since is None:
+        since = await async_crud.run_on_read_session(crud.get_last_change_seq)
+    return StreamingResponse(
+        changes.stream(functools.partial(async_crud.run_on_read_session, crud.get_changes), since),
+        media_type=changes.SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+############################################################
+##====================view for billing====================##
+############################################################
+
+@app.post("/billing/runs",
+          tags=[Tags.billing.value],
+          response_model=schemas.BillingRun,
+          status_code=status.HTTP_202_ACCEPTED,
+          summary="Start a billing run",
+          description="Bills every member at their plan's value for a month, in the background",
+          responses={status.HTTP_409_CONFLICT: {"description": "Conflict: this worker is already billing the period"}},
+          dependencies=[Depends(stick_to_primary)],
+          )
+async def start_billing_run(run: schemas.BillingRunCreate):
+    """
+    Returns at once; follow the run with **GET /billing/runs/{period}**. Posting a failed or interrupted
+    period again resumes it from its last committed chunk, posting a completed one changes nothing.
+    The same run is available from the command line: `python -m sql_app.billing 2026-10`.
+    """
+    try:
+        await run_in_threadpool(billing.start_in_background, run.period, run.chunk_size, run.workers)
+    except billing.AlreadyRunning as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(exc),
+        )
+    return await run_in_threadpool(billing.get_status, run.period)
+
+
+@app.get("/billing/runs/{period}",
+         tags=[Tags.billing.value],
+         response_model=schemas.BillingRun,
+         summary="Get a billing run",
+         description="Returns a billing run's progress and throughput",
+         responses={status.HTTP_404_NOT_FOUND: {"description": "Not Found Error: the period was never billed"}},
+         )
+async def get_billing_run(period: Annotated[str, Path(description="Billed month, YYYY-MM", examples=["2026-10"])]):
+    run = await run_in_threadpool(billing.get_status, period)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Billing run not found",
+        )
+    return run
+
+############################################################
+##===================view for monitoring==================##
+############################################################
+
+@app.get("/metrics",
+         tags=[Tags.monitoring.value],
+         response_class=PlainTextResponse,
+         summary="Get metrics",
+         description="Returns request and SQL metrics per route in Prometheus text format",
+         )
+async def get_metrics():
+    """
+    This endpoint is meant to be scraped by Prometheus, it does not receive parameters.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.PROMETHEUS_MEDIA_TYPE)
+
+
+@app.get("/health/db",
+         tags=[Tags.monitoring.value],
+         response_model=schemas.DatabaseHealth,
+         response_model_exclude_none=True,
+         summary="Get connection pool health",
+         description="Returns this worker's connection pool usage and how long requests waited for a connection",
+         )
+async def get_db_health():
+    """
+    Pools are per worker process, so each call reports the worker that served it.
+    It does not query the database.
+    """
+    return {
+        "mode": DATABASE_MODE,
+        "pid": os.getpid(),
+        "pools": [metrics.pool_status(engine) for engine in database.get_engines()],
+    }
+
+
+@app.get("/health/ready",
+         tags=[Tags.monitoring.value],
+         response_model=schemas.Readiness,
+         response_model_exclude_none=True,
+         summary="Get readiness",
+         description="Returns 200 once this worker has warmed up, 503 before",
+         responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"model": schemas.Readiness,
+                                                          "description": "Service Unavailable: still warming up"}},
+         )
+async def get_readiness(response: Response):
+    """
+    Point the load balancer's readiness check here: a new worker first opens its connection pools,
+    runs every query once and builds the response schemas, then reports how long it took from import.
+    It does not query the database.
+    """
+    if not warmup.state.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "ready": warmup.state.ready,
+        "pid": os.getpid(),
+        "attempts": warmup.state.attempts,
+        "error": warmup.state.error,
+        "phases": warmup.state.phases,
+        "import_to_ready_seconds": warmup.state.import_to_ready,
+    }
+
+
+async def require_profile_token(x_profile: Annotated[str | None, Header(description="The PROFILE_TOKEN")] = None):
+    """
+    Profiles hold the stacks of every profiled request, so they are served only to callers sending the PROFILE_TOKEN,
+    and not at all with the token empty.
+    """
+    if not profiling.has_token(x_profile):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Missing or wrong X-Profile token",
+        )
+
+
+@app.get("/profiles",
+         tags=[Tags.monitoring.value],
+         dependencies=[Depends(require_profile_token)],
+         response_model=schemas.ProfileList,
+         summary="List recent profiles",
+         description="Returns the request profiles this worker wrote, newest first",
+         )
+async def get_profiles():
+    """
+    Requests are profiled when PROFILE_SAMPLE_RATE picks them, or when they send the PROFILE_TOKEN in the X-Profile header.
+    Listing and downloading profiles needs the same header, and answers 403 while PROFILE_TOKEN is empty.
+    Each item's **path** downloads the profile from **/profiles/{path}**; open it in speedscope or flamegraph.pl.
+    """
+    return {"pid": os.getpid(), "items": list(profiling.store.recent)}
+
+
+@app.get("/profiles/{path:path}",
+         tags=[Tags.monitoring.value],
+         dependencies=[Depends(require_profile_token)],
+         response_class=FileResponse,
+         summary="Download a profile",
+         description="Returns one of the profiles listed by this worker",
+         )
+async def get_profile(path: str):
+    file_path = profiling.store.find(path)
+    if file_path is None or not os.path.exists(file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found",
+        )
+    return FileResponse(file_path)
@@ -0,0 +1,275 @@
+import functools
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """
+    Database work done while serving one request. It is shared by reference with the
+    threadpool and the async session greenlets, so the hooks only ever add to it.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.failed_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.checkout_wait_seconds = 0.0
+
+
+class PoolWait:
+    """
+    Time spent waiting for a pooled connection since the process started, across all requests.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float):
+        self.checkouts += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+pool_waits: dict[Engine, PoolWait] = {}
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: tuple, value: float = 1.0):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def observe(self, name: str, labels: tuple, value: float, buckets: tuple = LATENCY_BUCKETS):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * len(buckets), 0, 0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][i] += 1
+            histogram[2] += 1
+            histogram[3] += value
+
+    def render(self):
+        """
+        Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items())
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters + gauges:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            header(name)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value: float):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = Registry()
+registry.describe("http_requests_total", "counter", "HTTP requests served, by route and status.")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency, by route.")
+registry.describe("db_statements_total", "counter", "SQL statements executed, by route.")
+registry.describe("db_statement_errors_total", "counter", "SQL statements that raised, such as constraint violations, by route.")
+registry.describe("db_statement_seconds_total", "counter", "Time spent executing SQL statements, by route.")
+registry.describe("db_rows_total", "counter", "Rows returned or written as reported by the driver, by route.")
+registry.describe("db_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for a pooled connection, by route.")
+
+
+def instrument_engine(engine: Engine):
+    """
+    Adds the SQL hooks that feed the RequestStats of the request being served.
+    Statements run outside a request (startup, scripts) are not recorded.
+    """
+
+    # The start time lives on the statement's execution context: after_cursor_execute is not fired for a
+    # statement that raises, so a stack on the connection would be left with its entry
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_started_at = time.perf_counter()
+
+    def record(context, cursor, failed: bool):
+        started_at = getattr(context, "metrics_started_at", None)
+        stats = current_request.get()
+        if started_at is None or stats is None:
+            return
+        stats.statements += 1
+        stats.failed_statements += failed
+        stats.sql_seconds += time.perf_counter() - started_at
+        if not failed:
+            # SELECT row counts are reported by the MySQL drivers, SQLite only reports rows written
+            stats.rows += max(cursor.rowcount, 0)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record(context, cursor, False)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        record(exception_context.execution_context, None, True)
+
+    # There is no pool event fired before a checkout starts waiting, so the wait is timed around the engine's checkout
+    raw_connection = engine.raw_connection
+    pool_wait = pool_waits[engine] = PoolWait()
+
+    @functools.wraps(raw_connection)
+    def timed_raw_connection(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            waited = time.perf_counter() - started_at
+            pool_wait.add(waited)
+            stats = current_request.get()
+            if stats is not None:
+                stats.checkout_wait_seconds += waited
+
+    engine.raw_connection = timed_raw_connection
+
+
+def pool_status(engine: Engine):
+    pool = engine.pool
+    status = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(),
+                      overflow=max(pool.overflow(), 0))
+    pool_wait = pool_waits.get(engine)
+    if pool_wait is not None:
+        status.update(checkouts=pool_wait.checkouts,
+                      checkout_wait_total_ms=round(pool_wait.total_seconds * 1000, 3),
+                      checkout_wait_mean_ms=round(pool_wait.total_seconds / pool_wait.checkouts * 1000, 3) if pool_wait.checkouts else 0.0,
+                      checkout_wait_max_ms=round(pool_wait.max_seconds * 1000, 3))
+    return status
+
+
+_route_paths = {}
+
+
+def route_path(scope):
+    """
+    Path template of the route that served the request, like /members/{member_id}, known once the router matched it.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in _route_paths:
+        app = scope.get("app")
+        for route in getattr(app, "routes", []):
+            if getattr(route, "endpoint", None) is endpoint:
+                _route_paths[endpoint] = route.path
+                break
+        else:
+            _route_paths[endpoint] = endpoint.__name__
+    return _route_paths[endpoint]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the request metrics per route and adds the
+    X-DB-Queries and Server-Timing headers to every response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - started_at) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.statements).encode()))
+                headers.append((b"server-timing",
+                                (f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.statements} queries", '
+                                 f'pool;dur={stats.checkout_wait_seconds * 1000:.2f}, '
+                                 f'app;dur={elapsed_ms:.2f}').encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            route = route_path(scope)
+            method = scope["method"]
+            registry.inc("http_requests_total", (("method", method), ("route", route), ("status", status_code)))
+            registry.observe("http_request_duration_seconds", (("method", method), ("route", route)),
+                             time.perf_counter() - started_at)
+            labels = (("method", method), ("route", route))
+            registry.inc("db_statements_total", labels, stats.statements)
+            registry.inc("db_statement_errors_total", labels, stats.failed_statements)
+            registry.inc("db_statement_seconds_total", labels, stats.sql_seconds)
+            registry.inc("db_rows_total", labels, stats.rows)
+            registry.inc("db_pool_checkout_wait_seconds_total", labels, stats.checkout_wait_seconds)
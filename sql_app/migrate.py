@@ -0,0 +1,100 @@
+"""
+Brings the database up to the schema declared in models.py: creates missing tables, indexes and columns.
+
+    python -m sql_app.migrate
+    python -m sql_app.migrate --check
+
+Run it once per deploy, before the workers start; they never touch the schema. It only adds: a changed or
+dropped column needs a migration written by hand. --check lists what is missing and exits 1 if anything is.
+"""
+import argparse
+import sys
+
+from sqlalchemy import inspect, literal
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from . import crud, database, models
+
+
+class UnsupportedMigration(Exception):
+    pass
+
+
+def _add_column(engine: Engine, column):
+    """
+    ALTER TABLE ... ADD COLUMN, with the model's scalar default as the server default so existing rows get it.
+    """
+    ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+    if column.server_default is None and column.default is not None and column.default.is_scalar:
+        ddl += " DEFAULT " + str(literal(column.default.arg).compile(dialect=engine.dialect,
+                                                                   compile_kwargs={"literal_binds": True}))
+    elif not column.nullable and column.server_default is None:
+        raise UnsupportedMigration(f"{column.table.name}.{column.name} is NOT NULL without a default")
+    return f"ALTER TABLE {engine.dialect.identifier_preparer.format_table(column.table)} ADD COLUMN {ddl}"
+
+
+def pending(engine: Engine):
+    """
+    (description, DDL or table) for each table, column and index models.py declares and the database lacks.
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    steps = []
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing:
+            steps.append((f"create table {table.name}", table))
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                steps.append((f"add column {table.name}.{column.name}", _add_column(engine, column)))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in indexes:
+                steps.append((f"create index {index.name}", CreateIndex(index)))
+    return steps
+
+
+def upgrade(engine: Engine):
+    """
+    Applies the pending steps in one go and returns their descriptions. A new plan_stats table is filled from members.
+    """
+    steps = pending(engine)
+    with engine.begin() as connection:
+        for description, step in steps:
+            if isinstance(step, str):
+                connection.exec_driver_sql(step)
+            elif isinstance(step, CreateIndex):
+                connection.execute(step)
+            else:
+                step.create(connection)
+    if any(step is models.PlanStats.__table__ for _, step in steps):
+        with Session(engine) as db:
+            crud.reconcile_plan_stats(db)
+    return [description for description, _ in steps]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sql_app.migrate", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only list the missing steps, exit 1 if there are any")
+    args = parser.parse_args(argv)
+    engine = database.get_engine()
+    try:
+        steps = [description for description, _ in pending(engine)] if args.check else upgrade(engine)
+    except UnsupportedMigration as exc:
+        print(f"Cannot migrate: {exc}", file=sys.stderr)
+        return 2
+    for description in steps:
+        print(description)
+    if args.check:
+        print(f"{len(steps)} pending migration steps", file=sys.stderr)
+        return 1 if steps else 0
+    print(f"Applied {len(steps)} migration steps", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Float, Column, ForeignKey, Integer, String
+from sqlalchemy import DateTime, Float, Column, ForeignKey, Index, Integer, String, func
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -13,9 +13,95 @@ class Plan(Base):
 
 class Member(Base):
     __tablename__ = "members"
+    # One index per access path in crud: by name and search prefixes, and a plan's members in ID order
+    __table_args__ = (
+        Index("ix_members_last_name_first_name", "last_name", "first_name"),
+        Index("ix_members_plan_id_ID", "plan_id", "ID"),
+    )
 
     ID = Column(Integer, primary_key=True, index=True, autoincrement=True, nullable=False)
-    first_name = Column(String(20))
+    first_name = Column(String(20), index=True)
     last_name = Column(String(20))
     email = Column(String(50), unique=True, nullable=False)
-    plan_id = Column(Integer, ForeignKey("plans.ID"), nullable=False)
\ No newline at end of file
+    plan_id = Column(Integer, ForeignKey("plans.ID"), nullable=False)
+    # Incremented by every update, the member's ETag is built from it
+    version = Column(Integer, nullable=False, default=1)
+
+    # Only loaded when asked for, with joinedload; touching it otherwise raises instead of issuing one query per member
+    plan = relationship(Plan, lazy="raise_on_sql")
+
+class PlanStats(Base):
+    """
+    Members per plan, kept by the member writes in their own transaction so the dashboard reads one row per plan.
+    Revenue is member_count times the plan's value, computed on read so a price change touches no counter.
+    """
+    __tablename__ = "plan_stats"
+
+    # No foreign key, the row is deleted with its plan
+    plan_id = Column(Integer, primary_key=True)
+    member_count = Column(Integer, nullable=False, default=0)
+
+class TableVersion(Base):
+    """
+    Counter bumped in the same transaction as every write to a table, so caches can detect stale copies with one cheap read.
+    """
+    __tablename__ = "table_versions"
+
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class Change(Base):
+    """
+    Append-only log of member and plan writes, served in seq order by the change feed.
+    """
+    __tablename__ = "changes"
+    # Without AUTOINCREMENT SQLite may reuse the highest seq once its row is deleted
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)
+    changed_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class BillingRun(Base):
+    """
+    One monthly billing run. Members first_id..last_id, as of its start, are billed in chunks of chunk_size IDs.
+    """
+    __tablename__ = "billing_runs"
+
+    period = Column(String(7), primary_key=True)
+    status = Column(String(10), nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False, default=0)
+    # Wall time of the finished attempts, the current one is timed from started_at
+    seconds = Column(Float, nullable=False, default=0.0)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+class BillingChunk(Base):
+    """
+    Written in the transaction that inserts the chunk's invoices, so a resumed run skips exactly the chunks that committed.
+    """
+    __tablename__ = "billing_chunks"
+
+    period = Column(String(7), ForeignKey("billing_runs.period"), primary_key=True)
+    first_id = Column(Integer, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    seconds = Column(Float, nullable=False)
+
+class Invoice(Base):
+    __tablename__ = "invoices"
+    # One invoice per member and period, even if a chunk were billed twice
+    __table_args__ = (
+        Index("ix_invoices_period_member_id", "period", "member_id", unique=True),
+    )
+
+    ID = Column(Integer, primary_key=True, autoincrement=True)
+    period = Column(String(7), nullable=False)
+    # No foreign keys: invoices outlive deleted members and plans
+    member_id = Column(Integer, nullable=False)
+    plan_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False)
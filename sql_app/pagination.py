@@ -0,0 +1,39 @@
+import base64
+import binascii
+import operator
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: int):
+    """
+    Cursors are opaque to clients: they only carry the last ID of the page that was served.
+    """
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, last_id = raw.split(":", 1)
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def paginate(rows: list, limit: int, get_id=operator.attrgetter("ID")):
+    """
+    Rows must be fetched with limit + 1 so the extra row tells whether there is a next page.
+    """
+    items = rows[:limit]
+    next_cursor = encode_cursor(get_id(items[-1])) if len(rows) > limit else None
+    return items, next_cursor
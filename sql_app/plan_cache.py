@@ -0,0 +1,80 @@
+import bisect
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+
+# How long a worker trusts its copy before reading the plans version again, in seconds
+PLAN_CACHE_CHECK_INTERVAL = float(os.environ.get("PLAN_CACHE_CHECK_INTERVAL", "1.0"))
+
+
+class PlanCatalog:
+    """
+    In-process copy of the plans table indexed by ID and by name.
+
+    The plans table is tiny and rarely written, so reads are served from memory. Writes from this
+    worker invalidate the copy right away; writes from other workers are detected through the plans
+    version in table_versions, read at most once every check_interval seconds.
+
+    Versions only grow, so a lagging replica reporting an older version never rolls the copy back.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = None
+        self._index = ([], {}, {}, {})
+
+    def is_fresh(self):
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    def invalidate(self):
+        self.checked_at = None
+
+    def refresh(self, db: Session):
+        """
+        Reads the plans version and reloads the plans only if it is newer than the copy.
+        """
+        checked_at = time.monotonic()
+        version = crud.get_table_version(db, models.Plan.__tablename__)
+        if self.version is None or version > self.version:
+            plans = [schemas.Plan.model_validate(plan) for plan in crud.get_all_plans(db)]
+            self._index = ([plan.ID for plan in plans],
+                           {plan.ID: plan for plan in plans},
+                           {plan.name: plan for plan in plans},
+                           {plan.ID: plan.model_dump() for plan in plans})
+            self.version = version
+        self.checked_at = checked_at
+        return self
+
+    def ensure_fresh(self, db: Session):
+        if not self.is_fresh():
+            self.refresh(db)
+        return self
+
+    def get(self, plan_id: int):
+        return self._index[1].get(plan_id)
+
+    def get_by_name(self, name: str):
+        return self._index[2].get(name)
+
+    def _page_ids(self, after_id: int | None, limit: int):
+        ids = self._index[0]
+        start = 0 if after_id is None else bisect.bisect_right(ids, after_id)
+        return ids[start:start + limit]
+
+    def page(self, after_id: int | None = None, limit: int = 100):
+        by_id = self._index[1]
+        return [by_id[_id] for _id in self._page_ids(after_id, limit)]
+
+    def page_dicts(self, after_id: int | None = None, limit: int = 100):
+        """
+        Like page, as the plans' dumped dicts, ready to be encoded.
+        """
+        dumped = self._index[3]
+        return [dumped[_id] for _id in self._page_ids(after_id, limit)]
+
+
+catalog = PlanCatalog(PLAN_CACHE_CHECK_INTERVAL)
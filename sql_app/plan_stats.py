@@ -0,0 +1,28 @@
+"""
+Rebuilds the per-plan member counters served by GET /plans/stats from the members table.
+
+    python -m sql_app.plan_stats
+
+The member writes keep the counters up to date; run this after loading members behind the API's back,
+or to check for drift. It exits with code 1 when a counter was wrong.
+"""
+import argparse
+import sys
+
+from . import crud, database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sql_app.plan_stats", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args(argv)
+    with database.new_session() as db:
+        drift = crud.reconcile_plan_stats(db)
+    for plan_id, (counted, actual) in sorted(drift.items()):
+        print(f"plan {plan_id}: counted {counted if counted is not None else 'nothing'}, has {actual} members")
+    print(f"Rebuilt plan counters, {len(drift)} were wrong", file=sys.stderr)
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import asyncio
+import collections
+import datetime
+import functools
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+import orjson
+from starlette import concurrency
+
+from . import metrics
+
+# Fraction of requests profiled, 0 turns sampling off
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Requests sending this token in the X-Profile header are always profiled. Empty disables the header.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_HEADER = "x-profile"
+# Milliseconds between stack samples while a profiled request runs
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "1"))
+# "speedscope" writes speedscope JSON, "collapsed" the folded stacks read by flamegraph.pl (and speedscope)
+PROFILE_FORMAT = os.environ.get("PROFILE_FORMAT", "speedscope")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "trembolona-profiles"))
+# Profiles kept per route on disk, and listed by each worker
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+
+# Name anyio gives its threadpool threads
+WORKER_THREAD_NAME = "AnyIO worker thread"
+
+EXTENSIONS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+
+current_profile: ContextVar["Profile | None"] = ContextVar("current_profile", default=None)
+
+
+class Profile:
+    """
+    Stacks sampled while one request ran, root first, each weighted by the seconds since the previous sample.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread_id = threading.get_ident()
+        # Pool threads running a call made from this request right now
+        self.threads = set()
+        self.samples = []
+        self.started_at = time.perf_counter()
+
+    def owns(self, thread_id: int):
+        """
+        Handlers run on the event loop thread, shared with every other request, and sync work on the threadpool.
+        The loop thread counts while this request's task is the one running, a pool thread while it runs a call
+        this request made through run_in_threadpool below.
+        """
+        if thread_id == self.loop_thread_id:
+            return asyncio.current_task(self.loop) is self.task
+        return thread_id in self.threads
+
+
+def _attributed(fn):
+    # Runs in the pool thread, whose copied context still holds the caller's profile
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profile.threads.add(thread_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.threads.discard(thread_id)
+    return wrapper
+
+
+async def run_in_threadpool(fn, *args, **kwargs):
+    """
+    starlette's run_in_threadpool, with the pool thread's samples counted for the request being profiled, if any.
+    """
+    return await concurrency.run_in_threadpool(_attributed(fn), *args, **kwargs)
+
+
+_labels = {}
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for path in sorted(sys.path, key=len, reverse=True):
+            if path and filename.startswith(path + os.sep):
+                filename = filename[len(path) + 1:]
+                break
+        label = _labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class Sampler:
+    """
+    One daemon thread per worker, reading the event loop and threadpool stacks each interval while at least one
+    profiled request runs, and asleep otherwise. Unprofiled requests pay nothing.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, profile: Profile):
+        with self._lock:
+            self._profiles.discard(profile)
+        # A sample taken just before may still be appended, the copy is final
+        profile.samples = list(profile.samples)
+
+    def _run(self):
+        sampled_at = time.perf_counter()
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+            if not profiles:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                sampled_at = time.perf_counter()
+                continue
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            weight, sampled_at = now - sampled_at, now
+            thread_ids = {profile.loop_thread_id for profile in profiles}
+            thread_ids.update(thread.ident for thread in threading.enumerate() if thread.name == WORKER_THREAD_NAME)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                for profile in profiles:
+                    if profile.owns(thread_id):
+                        profile.samples.append((_stack(frame), weight))
+
+
+def to_collapsed(profile: Profile):
+    """
+    One "root;...;leaf microseconds" line per distinct stack.
+    """
+    totals = collections.Counter()
+    for stack, weight in profile.samples:
+        totals[";".join(stack)] += weight
+    return "".join(f"{stack} {round(seconds * 1_000_000)}\n" for stack, seconds in totals.items()).encode()
+
+
+def to_speedscope(profile: Profile, name: str):
+    """
+    A sampled profile in the speedscope file format, samples kept in time order.
+    """
+    frames = {}
+    samples = [[frames.setdefault(label, len(frames)) for label in stack] for stack, _ in profile.samples]
+    weights = [round(weight * 1000, 3) for _, weight in profile.samples]
+    return orjson.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": label} for label in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": round(sum(weights), 3),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "trembolona",
+    })
+
+
+def _route_directory(method: str, route: str):
+    return re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+
+
+class ProfileStore:
+    """
+    Writes profiles to PROFILE_DIR/<method_route>/, pruning each route to its newest files,
+    and remembers the ones this worker wrote for the listing endpoint.
+    """
+
+    def __init__(self, directory: str, profile_format: str, keep: int):
+        self.directory = directory
+        self.profile_format = profile_format
+        self.keep = keep
+        self.recent = collections.deque(maxlen=keep)
+
+    def save(self, profile: Profile, method: str, route: str, status_code: int, duration: float):
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        name = f"{method} {route} {status_code} {duration * 1000:.1f} ms"
+        body = to_speedscope(profile, name) if self.profile_format == "speedscope" else to_collapsed(profile)
+        directory = os.path.join(self.directory, _route_directory(method, route))
+        os.makedirs(directory, exist_ok=True)
+        file_name = f"{created_at:%Y%m%dT%H%M%S%f}-{os.getpid()}{EXTENSIONS[self.profile_format]}"
+        with open(os.path.join(directory, file_name), "wb") as file:
+            file.write(body)
+        self._prune(directory)
+        self.recent.appendleft({
+            "path": os.path.join(os.path.basename(directory), file_name),
+            "method": method,
+            "route": route,
+            "status_code": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "samples": len(profile.samples),
+            "format": self.profile_format,
+            "created_at": created_at,
+        })
+
+    def _prune(self, directory: str):
+        # Names start with the time, so they sort oldest first
+        files = sorted(os.listdir(directory))
+        for file_name in files[:-self.keep]:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except FileNotFoundError:
+                pass
+
+    def find(self, path: str):
+        """
+        Only files this worker listed are served, so a path from the request never escapes the directory.
+        """
+        for entry in self.recent:
+            if entry["path"] == path:
+                return os.path.join(self.directory, path)
+        return None
+
+
+sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+store = ProfileStore(PROFILE_DIR, PROFILE_FORMAT, PROFILE_KEEP)
+
+
+def has_token(value: str | bytes | None):
+    """
+    Whether an X-Profile value matches PROFILE_TOKEN, never with the token empty.
+    """
+    if not PROFILE_TOKEN or value is None:
+        return False
+    if isinstance(value, str):
+        value = value.encode()
+    return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+
+
+def wants_profile(scope):
+    if scope["path"] == "/profiles" or scope["path"].startswith("/profiles/"):
+        return False
+    for key, value in scope["headers"]:
+        if key == PROFILE_HEADER.encode() and has_token(value):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a sample of requests, or those asking for it with the X-Profile token,
+    and saves one profile per request once the response is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(asyncio.current_task())
+        token = current_profile.set(profile)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampler.stop(profile)
+            current_profile.reset(token)
+            duration = time.perf_counter() - profile.started_at
+            await concurrency.run_in_threadpool(store.save, profile, scope["method"], metrics.route_path(scope), status_code, duration)
@@ -1,3 +1,6 @@
+import datetime
+from enum import Enum
+
 from pydantic import BaseModel, EmailStr, Field
 
 class PlanBase(BaseModel):
@@ -19,7 +22,7 @@ class PlanBase(BaseModel):
                          title="Plan's value", 
                          description="Gym's monthly subscription plan value in reais.")
     
-    description: str = Field(default=None,
+    description: str | None = Field(default=None,
                              examples=["plano para usuários de trembolona"],
                              title="Plan's description", 
                              description="Gym's monthly subscription plan description. Explain here plan's conditions, service level agreement and benefits.",
@@ -34,6 +37,28 @@ class PlanUpdate(PlanBase):
     pass
 
 
+class PlanPatch(BaseModel):
+    """
+    Only the fields sent are written. Name and value may be left out but not set to null.
+    """
+
+    name: str = Field(default=None,
+                      examples=["PlanoHard"],
+                      title="Plan's name",
+                      max_length=20)
+    value: float = Field(default=None,
+                         examples=[35.4],
+                         title="Plan's value")
+    description: str | None = Field(default=None,
+                                    title="Plan's description",
+                                    max_length=200)
+
+
+class PatchedPlan(PlanPatch):
+    ID : int = Field(default=...,
+                     title="Plan's ID")
+
+
 class Plan(PlanBase):
     ID : int = Field(default=..., 
                      examples=[1],
@@ -56,11 +81,11 @@ class MemberBase(BaseModel):
     Every member must be subscribed to some plan.
     """
 
-    first_name: str = Field(default=None,
+    first_name: str | None = Field(default=None,
                             examples=["João"],
                             title="Member's first name",
                             max_length=20)
-    last_name: str = Field(default=None, 
+    last_name: str | None = Field(default=None, 
                            examples=["Dos Venenos"],
                            title="Member's last name",
                            max_length=20)
@@ -82,6 +107,31 @@ class MemberCreate(MemberBase):
 class MemberUpdate(MemberBase):
     pass
 
+class MemberPatch(BaseModel):
+    """
+    Only the fields sent are written. Email and plan may be left out but not set to null.
+    """
+
+    first_name: str | None = Field(default=None,
+                                   title="Member's first name",
+                                   max_length=20)
+    last_name: str | None = Field(default=None,
+                                  title="Member's last name",
+                                  max_length=20)
+    email: EmailStr = Field(default=None,
+                            examples=["joao@testoAquosa.com"],
+                            title="Member's e-mail",
+                            max_length=50)
+    plan_id: int = Field(default=None,
+                         title="Member's plan",
+                         ge=0)
+
+
+class PatchedMember(MemberPatch):
+    ID : int = Field(default=...,
+                     title="Member's ID")
+
+
 class Member(MemberBase):
     ID : int = Field(default=..., 
                      title="Member's ID",
@@ -90,3 +140,327 @@ class Member(MemberBase):
     
     class Config:
         from_attributes = True
+
+
+class MemberExpand(Enum):
+    plan = "plan"
+
+
+class MemberWithPlan(Member):
+    plan: Plan = Field(default=...,
+                       title="Member's plan")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class PlanPage(BaseModel):
+    items: list[Plan] = Field(default=...,
+                              title="Page of plans ordered by ID")
+    next_cursor: str | None = Field(default=None,
+                                    title="Next page cursor",
+                                    description="Opaque cursor to pass as `cursor` to get the next page. It is null on the last page.")
+
+
+class MemberPage(BaseModel):
+    items: list[Member] = Field(default=...,
+                                title="Page of members ordered by ID")
+    next_cursor: str | None = Field(default=None,
+                                    title="Next page cursor",
+                                    description="Opaque cursor to pass as `cursor` to get the next page. It is null on the last page.")
+
+
+class MemberWithPlanPage(BaseModel):
+    items: list[MemberWithPlan] = Field(default=...,
+                                        title="Page of members ordered by ID, with their plans")
+    next_cursor: str | None = Field(default=None,
+                                    title="Next page cursor",
+                                    description="Opaque cursor to pass as `cursor` to get the next page. It is null on the last page.")
+
+
+class BulkStatus(Enum):
+    created = "created"
+    updated = "updated"
+    rejected = "rejected"
+
+
+class MemberUpsert(BaseModel):
+    """
+    A member's data without the email, which is taken from the path.
+    """
+
+    first_name: str | None = Field(default=None,
+                                   examples=["João"],
+                                   title="Member's first name",
+                                   max_length=20)
+    last_name: str | None = Field(default=None,
+                                  examples=["Dos Venenos"],
+                                  title="Member's last name",
+                                  max_length=20)
+    plan_id: int = Field(default=...,
+                         title="Member's plan",
+                         examples=[0],
+                         ge=0)
+
+
+class UpsertedMember(Member):
+    status: BulkStatus = Field(default=...,
+                               title="Whether the member was created or updated")
+
+
+class MemberBulkResult(BaseModel):
+    index: int = Field(default=...,
+                       title="Row position in the request body",
+                       ge=0)
+    status: BulkStatus = Field(default=...,
+                               title="Row outcome")
+    ID: int | None = Field(default=None,
+                           title="ID of the member created or updated")
+    detail: str | None = Field(default=None,
+                               title="Why the row was rejected")
+
+
+class MemberBulkReport(BaseModel):
+    created: int = Field(default=...,
+                         title="Number of members created")
+    rejected: int = Field(default=...,
+                          title="Number of rows rejected")
+    results: list[MemberBulkResult] = Field(default=...,
+                                            title="One result per row, in request order")
+
+
+class MemberUpsertReport(BaseModel):
+    created: int = Field(default=...,
+                         title="Number of members created")
+    updated: int = Field(default=...,
+                         title="Number of members updated")
+    rejected: int = Field(default=...,
+                          title="Number of rows rejected")
+    results: list[MemberBulkResult] = Field(default=...,
+                                            title="One result per row, in request order")
+
+class BatchGet(BaseModel):
+    ids: list[int] = Field(default=...,
+                           title="IDs to fetch",
+                           min_length=1,
+                           max_length=10000,
+                           examples=[[1, 2, 3]])
+
+
+class MemberBatch(BaseModel):
+    items: list[Member] = Field(default=...,
+                                title="Members found, in the order their IDs were requested")
+    missing: list[int] = Field(default=...,
+                               title="Requested IDs that match no member")
+
+
+class MemberWithPlanBatch(BaseModel):
+    items: list[MemberWithPlan] = Field(default=...,
+                                        title="Members found, with their plans, in the order their IDs were requested")
+    missing: list[int] = Field(default=...,
+                               title="Requested IDs that match no member")
+
+
+class PlanBatch(BaseModel):
+    items: list[Plan] = Field(default=...,
+                              title="Plans found, in the order their IDs were requested")
+    missing: list[int] = Field(default=...,
+                               title="Requested IDs that match no plan")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class ChangeOperation(Enum):
+    created = "created"
+    updated = "updated"
+    deleted = "deleted"
+
+
+class Change(BaseModel):
+    seq: int = Field(default=...,
+                     title="Sequence number",
+                     description="Increases with every change, in commit order. Pass the last one seen as `since` to resume.")
+    table_name: str = Field(default=...,
+                            title="Changed table",
+                            examples=["members"])
+    row_id: int = Field(default=...,
+                        title="ID of the changed member or plan")
+    operation: ChangeOperation = Field(default=...,
+                                       title="What happened to the row")
+    changed_at: datetime.datetime = Field(default=...,
+                                          title="When the change was written")
+
+    class Config:
+        from_attributes = True
+
+
+class ChangePage(BaseModel):
+    items: list[Change] = Field(default=...,
+                                title="Changes ordered by seq")
+    last_seq: int = Field(default=...,
+                          title="Seq of the last change in the page, to pass as `since` to get the following ones")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class PlanStats(BaseModel):
+    plan_id: int = Field(default=...,
+                         title="Plan's ID")
+    name: str = Field(default=...,
+                      title="Plan's name")
+    value: float = Field(default=...,
+                         title="Plan's value")
+    member_count: int = Field(default=...,
+                              title="Members subscribed to the plan")
+    revenue: float = Field(default=...,
+                           title="Monthly revenue",
+                           description="member_count times the plan's current value, in reais")
+
+    class Config:
+        from_attributes = True
+
+
+class PlanStatsList(BaseModel):
+    items: list[PlanStats] = Field(default=...,
+                                   title="Statistics of every plan, ordered by ID")
+    member_count: int = Field(default=...,
+                              title="Members of every plan")
+    revenue: float = Field(default=...,
+                           title="Monthly revenue of every plan")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class BillingStatus(Enum):
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class BillingRunCreate(BaseModel):
+    period: str = Field(default=...,
+                        title="Billed month",
+                        pattern=r"^\d{4}-(0[1-9]|1[0-2])$",
+                        examples=["2026-10"])
+    chunk_size: int | None = Field(default=None,
+                                   title="Member IDs per chunk",
+                                   description="Defaults to BILLING_CHUNK_SIZE. Ignored when resuming, the run keeps its chunks.",
+                                   ge=100,
+                                   le=1000000)
+    workers: int | None = Field(default=None,
+                                title="Processes billing chunks in parallel",
+                                description="Defaults to BILLING_WORKERS",
+                                ge=1,
+                                le=64)
+
+
+class BillingRun(BaseModel):
+    period: str = Field(default=...,
+                        title="Billed month")
+    status: BillingStatus = Field(default=...,
+                                  title="running, completed, or failed and waiting to be resumed")
+    chunk_size: int = Field(default=...,
+                            title="Member IDs per chunk")
+    first_id: int = Field(default=...,
+                          title="First member ID billed")
+    last_id: int = Field(default=...,
+                         title="Last member ID billed, the highest one when the run started")
+    chunks: int = Field(default=...,
+                        title="Chunks in the run")
+    chunks_completed: int = Field(default=...,
+                                  title="Chunks whose invoices are committed")
+    rows: int = Field(default=...,
+                      title="Invoices written")
+    seconds: float = Field(default=...,
+                           title="Wall time spent billing, over every attempt")
+    rows_per_second: float = Field(default=...,
+                                   title="Invoices written per second of wall time")
+    started_at: datetime.datetime = Field(default=...,
+                                          title="When the last attempt started, UTC")
+    finished_at: datetime.datetime | None = Field(default=None,
+                                                  title="When the last attempt ended, UTC")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class Readiness(BaseModel):
+    ready: bool = Field(default=...,
+                        title="Whether this worker finished warming up")
+    pid: int = Field(default=...,
+                     title="Worker process ID")
+    attempts: int = Field(default=...,
+                          title="Warm-up attempts so far, more than one when the database was unreachable")
+    error: str | None = Field(default=None,
+                              title="Why the last attempt failed, while not ready")
+    phases: dict[str, float] = Field(default=...,
+                                     title="Seconds spent in each startup phase: import, pools, queries, validators")
+    import_to_ready_seconds: float | None = Field(default=None,
+                                                  title="Seconds from importing the app to ready")
+
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+#############################################################################################################################################################################
+
+class PoolStatus(BaseModel):
+    url: str = Field(default=...,
+                     title="Database URL, without password")
+    pool_class: str = Field(default=...,
+                            title="Connection pool implementation")
+    size: int | None = Field(default=None,
+                             title="Configured pool size")
+    checked_out: int | None = Field(default=None,
+                                    title="Connections in use")
+    idle: int | None = Field(default=None,
+                             title="Connections open and waiting in the pool")
+    overflow: int | None = Field(default=None,
+                                 title="Connections open beyond the pool size")
+    checkouts: int | None = Field(default=None,
+                                  title="Checkouts since the worker started")
+    checkout_wait_total_ms: float | None = Field(default=None,
+                                                 title="Total time spent waiting for a connection")
+    checkout_wait_mean_ms: float | None = Field(default=None,
+                                                title="Mean time spent waiting for a connection")
+    checkout_wait_max_ms: float | None = Field(default=None,
+                                               title="Longest time spent waiting for a connection")
+
+
+class DatabaseHealth(BaseModel):
+    mode: str = Field(default=...,
+                      title="Database mode",
+                      description="sync or async")
+    pid: int = Field(default=...,
+                     title="Worker process ID")
+    pools: list[PoolStatus] = Field(default=...,
+                                    title="One entry per engine created by this worker")
+
+
+class ProfileInfo(BaseModel):
+    path: str = Field(default=...,
+                      title="File path under PROFILE_DIR, also used to download it",
+                      examples=["GET_members_member_id/20261017T120000123456-4242.speedscope.json"])
+    method: str = Field(default=...,
+                        title="HTTP method of the profiled request")
+    route: str = Field(default=...,
+                       title="Route of the profiled request",
+                       examples=["/members/{member_id}"])
+    status_code: int = Field(default=...,
+                             title="Response status")
+    duration_ms: float = Field(default=...,
+                               title="Time from the request to its last response byte")
+    samples: int = Field(default=...,
+                         title="Stack samples taken")
+    format: str = Field(default=...,
+                        title="speedscope or collapsed")
+    created_at: datetime.datetime = Field(default=...,
+                                          title="When the profile was written")
+
+
+class ProfileList(BaseModel):
+    pid: int = Field(default=...,
+                     title="Worker process ID")
+    items: list[ProfileInfo] = Field(default=...,
+                                     title="Profiles written by this worker, newest first")
\ No newline at end of file
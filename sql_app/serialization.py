@@ -0,0 +1,21 @@
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+
+
+def to_dicts(fields: tuple[str, ...], rows):
+    """
+    Row tuples to plain dicts, keyed like the response schema. The rows were validated when written.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def page_response(items: list[dict], next_cursor: str | None, response: Response):
+    """
+    Encodes a page straight to JSON bytes with orjson, skipping the response_model validation.
+
+    The endpoint's response_model still documents the shape, so the OpenAPI schema does not change.
+    Headers set on the injected response (ETag, cookies) are carried over, like FastAPI does for its own responses.
+    """
+    encoded = ORJSONResponse({"items": items, "next_cursor": next_cursor})
+    encoded.headers.raw.extend(response.headers.raw)
+    return encoded
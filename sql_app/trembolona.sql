@@ -2,22 +2,88 @@ CREATE DATABASE IF NOT EXISTS trembolona;
 
 USE trembolona;
 
-DROP TABLE IF EXISTS `trembolona`.`plan`;
+-- Same schema as models.py, which creates it on startup; keep both in sync
 
-CREATE TABLE `trembolona`.`plan` (
-  `plan_id` INT NOT NULL AUTO_INCREMENT,
+DROP TABLE IF EXISTS `trembolona`.`members`;
+DROP TABLE IF EXISTS `trembolona`.`plans`;
+DROP TABLE IF EXISTS `trembolona`.`plan_stats`;
+DROP TABLE IF EXISTS `trembolona`.`table_versions`;
+DROP TABLE IF EXISTS `trembolona`.`changes`;
+DROP TABLE IF EXISTS `trembolona`.`invoices`;
+DROP TABLE IF EXISTS `trembolona`.`billing_chunks`;
+DROP TABLE IF EXISTS `trembolona`.`billing_runs`;
+
+CREATE TABLE `trembolona`.`plans` (
+  `ID` INT NOT NULL AUTO_INCREMENT,
   `name` VARCHAR(20) NOT NULL,
   `value` FLOAT NOT NULL,
   `description` VARCHAR(200) NULL,
-  PRIMARY KEY (`plan_id`));
-
-DROP TABLE IF EXISTS `trembolona`.`member`;
+  PRIMARY KEY (`ID`),
+  UNIQUE (`name`),
+  INDEX `ix_plans_ID` (`ID`));
 
-CREATE TABLE `trembolona`.`member` (
-  `member_id` INT NOT NULL AUTO_INCREMENT,
+CREATE TABLE `trembolona`.`members` (
+  `ID` INT NOT NULL AUTO_INCREMENT,
   `first_name` VARCHAR(20) NULL,
   `last_name` VARCHAR(20) NULL,
   `email` VARCHAR(50) NOT NULL,
   `plan_id` INT NOT NULL,
-  PRIMARY KEY (`member_id`),
-  FOREIGN KEY (`plan_id`) REFERENCES plan(plan_id));
\ No newline at end of file
+  `version` INT NOT NULL DEFAULT 1,
+  PRIMARY KEY (`ID`),
+  UNIQUE (`email`),
+  INDEX `ix_members_ID` (`ID`),
+  -- get_member_by_name, and search by last name prefix
+  INDEX `ix_members_last_name_first_name` (`last_name`, `first_name`),
+  -- search by first name prefix
+  INDEX `ix_members_first_name` (`first_name`),
+  -- a plan's members in ID order, has_members, and the foreign key
+  INDEX `ix_members_plan_id_ID` (`plan_id`, `ID`),
+  FOREIGN KEY (`plan_id`) REFERENCES plans(`ID`));
+
+CREATE TABLE `trembolona`.`plan_stats` (
+  `plan_id` INT NOT NULL,
+  `member_count` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`plan_id`));
+
+CREATE TABLE `trembolona`.`table_versions` (
+  `table_name` VARCHAR(50) NOT NULL,
+  `version` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`table_name`));
+
+CREATE TABLE `trembolona`.`changes` (
+  `seq` INT NOT NULL AUTO_INCREMENT,
+  `table_name` VARCHAR(50) NOT NULL,
+  `row_id` INT NOT NULL,
+  `operation` VARCHAR(10) NOT NULL,
+  `changed_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`seq`));
+
+CREATE TABLE `trembolona`.`billing_runs` (
+  `period` VARCHAR(7) NOT NULL,
+  `status` VARCHAR(10) NOT NULL,
+  `chunk_size` INT NOT NULL,
+  `first_id` INT NOT NULL,
+  `last_id` INT NOT NULL,
+  `rows` INT NOT NULL,
+  `seconds` FLOAT NOT NULL,
+  `started_at` DATETIME NOT NULL,
+  `finished_at` DATETIME NULL,
+  PRIMARY KEY (`period`));
+
+CREATE TABLE `trembolona`.`billing_chunks` (
+  `period` VARCHAR(7) NOT NULL,
+  `first_id` INT NOT NULL,
+  `rows` INT NOT NULL,
+  `seconds` FLOAT NOT NULL,
+  PRIMARY KEY (`period`, `first_id`),
+  FOREIGN KEY (`period`) REFERENCES billing_runs(`period`));
+
+CREATE TABLE `trembolona`.`invoices` (
+  `ID` INT NOT NULL AUTO_INCREMENT,
+  `period` VARCHAR(7) NOT NULL,
+  `member_id` INT NOT NULL,
+  `plan_id` INT NOT NULL,
+  `amount` FLOAT NOT NULL,
+  PRIMARY KEY (`ID`),
+  -- one invoice per member and period
+  UNIQUE INDEX `ix_invoices_period_member_id` (`period`, `member_id`));
\ No newline at end of file
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import sys
+import time
+import traceback
+
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from . import IMPORTED_AT, async_crud, crud, database, metrics, models, plan_cache, schemas
+
+# Seconds from importing sql_app to ready a worker may take, beyond that startup warns
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", "10"))
+# Seconds between warm-up attempts while the database is unreachable
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "2"))
+
+metrics.registry.describe("startup_seconds", "gauge", "Seconds this worker spent in each startup phase, and from import to ready.")
+
+
+class Readiness:
+    """
+    Warm-up progress of this worker, served by /health/ready.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.attempts = 0
+        self.error = None
+        self.phases = {}
+        self.import_to_ready = None
+
+
+state = Readiness()
+_task = None
+
+
+def _pool_size(engine):
+    size = getattr(engine.pool, "size", None)
+    return size() if callable(size) else 1
+
+
+def _open_sync(engine, count: int):
+    connections = [engine.connect() for _ in range(count)]
+    for connection in connections:
+        connection.close()
+
+
+async def _open_async(engine, count: int):
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(count)))
+    await asyncio.gather(*(connection.close() for connection in connections))
+
+
+async def open_pools():
+    """
+    Opens pool_size connections on every engine the handlers use, so no request pays for a connect.
+    """
+    if database.DATABASE_MODE == "async":
+        for engine in [database.get_async_engine(), *database.get_async_reader_engines()]:
+            await _open_async(engine, _pool_size(engine.sync_engine))
+    else:
+        for engine in [database.get_engine(), *database.get_reader_engines()]:
+            await run_in_threadpool(_open_sync, engine, _pool_size(engine))
+
+
+def _run_queries(db):
+    """
+    Every crud read once, with arguments that match nothing, so each statement is compiled and cached.
+    Writes are left out, they would change data; streams too, they would read whole tables.
+    """
+    crud.get_table_version(db, models.Member.__tablename__)
+    crud.get_last_change_seq(db)
+    crud.get_changes(db, 0, 1)
+    crud.get_member_version(db, 0)
+    crud.get_member(db, 0)
+    crud.get_member(db, 0, expand_plan=True)
+    crud.get_member_by_name(db, "", "")
+    crud.search_members(db, "~", None, 1)
+    crud.search_members(db, "~", 0, 1)
+    crud.get_members(db, None, 1)
+    crud.get_members(db, 0, 1)
+    crud.get_members(db, 0, 1, expand_plan=True)
+    crud.get_member_rows(db, None, 1)
+    crud.get_member_rows(db, 0, 1)
+    crud.get_members_by_ids(db, [0])
+    crud.get_members_by_ids(db, [0], expand_plan=True)
+    crud.get_existing_emails(db, [""])
+    crud.get_plans(db, None, 1)
+    crud.get_plans(db, 0, 1)
+    crud.get_all_plans(db)
+    crud.get_plan(db, 0)
+    crud.get_plan_by_name(db, "")
+    crud.get_plan_members(db, 0, None, 1)
+    crud.get_plan_members(db, 0, 0, 1, expand_plan=True)
+    crud.get_plan_member_rows(db, 0, None, 1)
+    crud.get_plan_member_rows(db, 0, 0, 1)
+    crud.has_members(db, 0)
+    crud.get_plan_stats(db)
+
+
+async def run_queries():
+    await async_crud.run_on_session(_run_queries)
+    if database.DATABASE_READER_URLS:
+        await async_crud.run_on_read_session(_run_queries)
+    # Plan reads are then served from memory
+    await async_crud.run_on_session(plan_cache.catalog.refresh)
+
+
+def build_validators(app):
+    """
+    Completes any schema whose validator was deferred, validates a member so the email checks load
+    their own dependencies, and builds the OpenAPI document /docs serves.
+    """
+    for schema in vars(schemas).values():
+        if isinstance(schema, type) and issubclass(schema, BaseModel) and schema is not BaseModel:
+            schema.model_rebuild()
+    schemas.Member.model_validate({"ID": 0, "email": "warmup@example.com", "plan_id": 0})
+    app.openapi()
+
+
+async def _phase(name: str, fn, *args):
+    started_at = time.perf_counter()
+    result = fn(*args)
+    if asyncio.iscoroutine(result):
+        await result
+    state.phases[name] = round(time.perf_counter() - started_at, 4)
+    metrics.registry.set("startup_seconds", (("phase", name),), state.phases[name])
+
+
+async def warm_up(app):
+    """
+    Retries until the database answers, then marks the worker ready and reports the import-to-ready time.
+    """
+    while True:
+        state.attempts += 1
+        try:
+            await _phase("pools", open_pools)
+            await _phase("queries", run_queries)
+            await _phase("validators", build_validators, app)
+            break
+        except Exception as exc:
+            state.error = "".join(traceback.format_exception_only(exc)).strip()
+            print(f"Warm-up attempt {state.attempts} failed, retrying in {WARMUP_RETRY_SECONDS} s: {state.error}",
+                  file=sys.stderr)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    state.error = None
+    state.import_to_ready = round(time.perf_counter() - IMPORTED_AT, 4)
+    metrics.registry.set("startup_seconds", (("phase", "import_to_ready"),), state.import_to_ready)
+    state.ready = True
+    phases = ", ".join(f"{name} {seconds} s" for name, seconds in state.phases.items())
+    print(f"Worker {os.getpid()} ready {state.import_to_ready} s after import ({phases})", file=sys.stderr)
+    if state.import_to_ready > STARTUP_BUDGET_SECONDS:
+        print(f"Worker {os.getpid()} took longer than STARTUP_BUDGET_SECONDS={STARTUP_BUDGET_SECONDS} to get ready",
+              file=sys.stderr)
+
+
+def start(app):
+    """
+    Warms up in the background, so the worker answers /health/ready with 503 meanwhile instead of refusing connections.
+    """
+    global _task
+    state.phases["import"] = round(time.perf_counter() - IMPORTED_AT, 4)
+    _task = asyncio.get_running_loop().create_task(warm_up(app))
+
+
+async def stop():
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,89 @@
+import contextlib
+import itertools
+import os
+import tempfile
+import time
+
+# Read by sql_app.database at import time, so set before the app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='trembolona-tests-'), 'test.db')}"
+os.environ["DATABASE_MODE"] = "sync"
+# Plan reads come from the plan catalog; it must not expire in the middle of a test and add its own queries
+os.environ["PLAN_CACHE_CHECK_INTERVAL"] = "3600"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from sql_app import database, main, migrate
+from sql_app.main import app
+
+_names = itertools.count(1)
+
+
+@pytest.fixture(scope="session", params=["sync", "async"])
+def client(request):
+    """
+    The suite runs once per DATABASE_MODE. The mode is read at import time, so the async one is switched on
+    by overriding the session dependencies the routes were declared with.
+    """
+    migrate.upgrade(database.get_engine())
+    patch = pytest.MonkeyPatch()
+    if request.param == "async":
+        patch.setattr(database, "DATABASE_MODE", "async")
+        patch.setitem(app.dependency_overrides, main.get_sync_db, main.get_async_db)
+        patch.setitem(app.dependency_overrides, main.get_sync_read_db, main.get_async_read_db)
+    try:
+        with TestClient(app) as client:
+            # Warm-up runs its own queries in the background, counting starts once it is done
+            deadline = time.monotonic() + 10
+            while client.get("/health/ready").status_code != 200:
+                assert time.monotonic() < deadline, "worker never got ready"
+                time.sleep(0.01)
+            yield client
+    finally:
+        patch.undo()
+
+
+@pytest.fixture
+def statements():
+    """
+    count() is a context manager collecting the SQL statements sent to the database while it is open.
+    The BEGIN sent on SQLite is left out: MySQL opens its transactions implicitly, and budgets hold for both.
+    """
+
+    @contextlib.contextmanager
+    def count():
+        sent = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith("BEGIN"):
+                sent.append(statement)
+
+        # The async engine sends through a sync engine of its own
+        engines = database.get_engines()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield sent
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return count
+
+
+@pytest.fixture
+def plan(client):
+    response = client.post("/plans", json={"name": f"Plan {next(_names)}", "value": 35.4})
+    assert response.status_code == 201
+    # The plan write invalidated the catalog, reload it so the test only counts its own statements
+    assert client.get(f"/plans/{response.json()['ID']}").status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def member(client, plan):
+    response = client.post("/members", json={"first_name": "Joao", "last_name": "Trembo",
+                                             "email": f"member{next(_names)}@trembo.com", "plan_id": plan["ID"]})
+    assert response.status_code == 201
+    return response.json()
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+
+from sql_app import admission, crud, group_commit
+from sql_app.main import app
+
+
+def test_group_commit_batch_is_not_capped_by_the_write_limit(client, plan, monkeypatch):
+    monkeypatch.setattr(admission, "writes", admission.Gate("write", 2, 100, 5.0))
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT", True)
+    committer = group_commit.GroupCommitter(max_delay=0.2, max_batch=100)
+    monkeypatch.setattr(group_commit, "committer", committer)
+    batches = []
+    write_members = crud.write_members
+
+    def recorded_write_members(db, writes):
+        batches.append(len(writes))
+        return write_members(db, writes)
+
+    monkeypatch.setattr(crud, "write_members", recorded_write_members)
+
+    async def create_members():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            responses = await asyncio.gather(*(
+                http.post("/members", json={"email": f"batched{i}.{plan['ID']}@trembo.com", "plan_id": plan["ID"]})
+                for i in range(20)))
+        await committer.close()
+        return responses
+
+    responses = asyncio.run(create_members())
+    assert [response.status_code for response in responses] == [201] * 20
+    # Waiting in the queue holds no write slot, so one batch gathers more writes than the gate lets through
+    assert max(batches) > 2
+    assert admission.writes.in_flight == 0
+
+
+def test_waiter_giving_up_never_keeps_a_permit():
+    timeout = 0.005
+
+    async def wait_as_the_holder_leaves(offset):
+        gate = admission.Gate("write", 1, 10, timeout)
+        await gate.acquire()
+        # The holder leaves around the moment the waiter's timeout fires, sometimes in the same loop pass
+        asyncio.get_running_loop().call_later(timeout + offset, gate.release)
+        try:
+            await gate.acquire()
+        except admission.Overloaded:
+            pass
+        else:
+            gate.release()
+        await asyncio.sleep(timeout)
+        # Nobody holds the gate, so its one permit must be free
+        await asyncio.wait_for(gate.acquire(), timeout)
+        assert gate.in_flight == 1
+
+    async def main():
+        for step in range(-10, 10):
+            await wait_as_the_holder_leaves(step * timeout / 50)
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import pytest
+
+from sql_app import batch
+
+MISSING = 999_999
+
+
+@pytest.fixture
+def members(client, plan):
+    ids = []
+    for i in range(3):
+        response = client.post("/members", json={"email": f"batch{i}.{plan['ID']}@trembo.com", "plan_id": plan["ID"]})
+        assert response.status_code == 201
+        ids.append(response.json()["ID"])
+    return ids
+
+
+def test_members_come_in_request_order(client, members, monkeypatch):
+    # IDs are read in several chunks, the order must not follow them
+    monkeypatch.setattr(batch, "BATCH_CHUNK_SIZE", 2)
+    requested = [members[2], MISSING, members[0], members[2], members[1]]
+    response = client.post("/members/batch-get", json={"ids": requested})
+
+    assert response.status_code == 200
+    assert [item["ID"] for item in response.json()["items"]] == [members[2], members[0], members[1]]
+    assert response.json()["missing"] == [MISSING]
+
+
+def test_ids_query_matches_batch_get(client, members):
+    ids = [members[1], MISSING, members[0]]
+    listed = client.get("/members", params={"ids": ",".join(map(str, ids))})
+    fetched = client.post("/members/batch-get", json={"ids": ids})
+
+    assert listed.status_code == 200
+    assert listed.json()["items"] == fetched.json()["items"]
+    assert listed.json()["missing"] == [MISSING]
+
+
+def test_plans_come_in_request_order(client, plan):
+    other = client.post("/plans", json={"name": f"Batch {plan['name']}", "value": 10.0}).json()
+    response = client.post("/plans/batch-get", json={"ids": [other["ID"], MISSING, plan["ID"]]})
+
+    assert response.status_code == 200
+    assert response.json() == {"items": [other, plan], "missing": [MISSING]}
+
+
+@pytest.mark.parametrize("ids", ["1,a", ",", ",".join(["1"] * (batch.MAX_QUERY_IDS + 1))])
+def test_malformed_ids_are_refused(client, ids):
+    assert client.get("/members", params={"ids": ids}).status_code == 400
@@ -0,0 +1,86 @@
+import itertools
+
+import pytest
+from sqlalchemy import func, select
+
+from sql_app import billing, database, models
+
+_years = itertools.count(2000)
+
+
+@pytest.fixture
+def period(client, member):
+    # Each run bills every member, so the periods never repeat across the sync and async runs
+    period = f"{next(_years)}-01"
+    for i in range(4):
+        response = client.post("/members", json={"email": f"billed{i}.{period}@trembo.com", "plan_id": member["plan_id"]})
+        assert response.status_code == 201
+    try:
+        yield period
+    finally:
+        billing._running.discard(period)
+
+
+def _billed(period):
+    with database.new_session() as db:
+        members = db.scalars(select(models.Invoice.member_id).where(models.Invoice.period == period)).all()
+        expected = db.scalars(select(models.Member.ID).order_by(models.Member.ID)).all()
+    return members, expected
+
+
+def test_resumed_run_bills_each_member_once(period, monkeypatch):
+    bill_chunk = billing.bill_chunk
+    calls = []
+    crashes = [RuntimeError("worker killed")]
+
+    def failing_bill_chunk(period, first_id, end_id):
+        calls.append(first_id)
+        # The second chunk fails, once
+        if len(calls) == 2 and crashes:
+            raise crashes.pop()
+        return bill_chunk(period, first_id, end_id)
+
+    monkeypatch.setattr(billing, "bill_chunk", failing_bill_chunk)
+    run = billing.start(period, chunk_size=2)
+    with pytest.raises(RuntimeError):
+        billing.execute(period, workers=1)
+
+    failed = billing.get_status(period)
+    assert (failed["status"], failed["chunks_completed"]) == ("failed", 1)
+    assert failed["chunks"] == len(billing.chunk_ranges(run)) > 1
+
+    calls.clear()
+    billing._running.discard(period)
+    billing.start(period)
+    billing.execute(period, workers=1)
+
+    completed = billing.get_status(period)
+    assert completed["status"] == "completed"
+    assert completed["chunks_completed"] == completed["chunks"]
+    # The committed chunk is not billed again
+    assert run.first_id not in calls and len(calls) == completed["chunks"] - 1
+    members, expected = _billed(period)
+    assert sorted(members) == expected
+    assert completed["rows"] == len(expected)
+
+
+def test_chunk_committed_elsewhere_is_skipped(period):
+    run = billing.start(period, chunk_size=1000)
+    first_id, end_id = billing.chunk_ranges(run)[0]
+
+    assert billing.bill_chunk(period, first_id, end_id)[1] > 0
+    assert billing.bill_chunk(period, first_id, end_id) == (first_id, 0)
+    members, _ = _billed(period)
+    assert len(members) == len(set(members))
+
+
+def test_completed_run_is_not_restarted(client, period):
+    billing.start(period)
+    billing.execute(period, workers=1)
+    billing._running.discard(period)
+
+    response = client.post("/billing/runs", json={"period": period, "workers": 1})
+    assert response.status_code == 202
+    assert response.json()["status"] == "completed"
+    with database.new_session() as db:
+        assert db.scalar(select(func.count()).select_from(models.BillingRun).where(models.BillingRun.period == period)) == 1
@@ -0,0 +1,65 @@
+import itertools
+
+from sql_app import plan_cache
+
+_names = itertools.count(1)
+MISSING_PLAN = 999_999
+
+
+def _email():
+    return f"imported{next(_names)}@trembo.com"
+
+
+def test_report_has_one_result_per_row(client, plan, member):
+    first, second = _email(), _email()
+    rows = [
+        {"email": first, "plan_id": plan["ID"]},
+        {"email": member["email"], "plan_id": plan["ID"]},
+        {"email": _email(), "plan_id": MISSING_PLAN},
+        {"plan_id": plan["ID"]},
+        {"email": first, "plan_id": plan["ID"]},
+        {"email": second, "plan_id": plan["ID"]},
+    ]
+    response = client.post("/members/bulk", json=rows)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["created"], report["rejected"]) == (2, 4)
+    results = report["results"]
+    assert [result["index"] for result in results] == list(range(len(rows)))
+    assert [result["status"] for result in results] == ["created", "rejected", "rejected",
+                                                        "rejected", "rejected", "created"]
+    assert results[1]["detail"] == results[4]["detail"] == "Member already exists"
+    assert results[2]["detail"] == "Member's plan does not exist"
+    assert results[3]["detail"].startswith("email:")
+    for index, email in ((0, first), (5, second)):
+        assert client.get(f"/members/{results[index]['ID']}").json()["email"] == email
+
+
+def test_ndjson_lines_are_reported_like_array_items(client, plan):
+    email = _email()
+    body = f'{{"email": "{email}", "plan_id": {plan["ID"]}}}\nnot json\n'
+    response = client.post("/members/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == "created"
+    assert results[1]["status"] == "rejected" and results[1]["detail"].startswith("Invalid JSON")
+
+
+def test_plan_deleted_during_the_import_is_a_conflict(client, plan, monkeypatch):
+    # The plan catalog still has the plan, only the foreign key catches it
+    monkeypatch.setattr(plan_cache.catalog, "get", lambda plan_id: object())
+    email = _email()
+    response = client.post("/members/bulk", json=[{"email": email, "plan_id": plan["ID"]},
+                                                   {"email": _email(), "plan_id": MISSING_PLAN}])
+
+    assert (response.status_code, response.json()["detail"]) == (409, "A member's plan does not exist")
+    # Nothing from the batch was kept
+    monkeypatch.undo()
+    assert client.get("/members/search", params={"q": email}).status_code == 204
+
+
+def test_empty_body_is_refused(client):
+    response = client.post("/members/bulk", json=[])
+    assert (response.status_code, response.json()["detail"]) == (400, "Missing required fields")
@@ -0,0 +1,59 @@
+from sql_app import caching
+
+
+def test_plan_responses_are_public(client, plan):
+    for path in ("/plans", f"/plans/{plan['ID']}", f"/plansByName/{plan['name']}"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == (f"public, max-age={caching.CACHE_MAX_AGE_PLANS}, "
+                                                     f"s-maxage={caching.CACHE_SHARED_MAX_AGE_PLANS}")
+
+
+def test_revalidated_plan_response_stays_public(client, plan):
+    etag = client.get(f"/plans/{plan['ID']}").headers["etag"]
+    response = client.get(f"/plans/{plan['ID']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["cache-control"].startswith("public, ")
+
+
+def test_member_responses_are_private(client, member):
+    for path in ("/members", f"/members/{member['ID']}", f"/plans/{member['plan_id']}/members"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == f"private, max-age={caching.CACHE_MAX_AGE_MEMBERS}"
+
+
+def test_member_write_changes_its_etag(client, member):
+    path = f"/members/{member['ID']}"
+    etag = client.get(path).headers["etag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    patched = client.patch(path, json={"first_name": "Maria"}, headers={"If-Match": etag})
+    assert patched.status_code == 200
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == patched.headers["etag"] != etag
+    assert response.json()["first_name"] == "Maria"
+    # The write the stale tag was read before is refused
+    assert client.patch(path, json={"first_name": "Ana"}, headers={"If-Match": etag}).status_code == 412
+
+
+def test_member_list_etag_follows_any_member_write(client, member, plan):
+    etag = client.get("/members").headers["etag"]
+    assert client.get("/members", headers={"If-None-Match": etag}).status_code == 304
+
+    created = client.post("/members", json={"email": f"etag.{member['email']}", "plan_id": plan["ID"]})
+    assert created.status_code == 201
+    response = client.get("/members", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_embedded_plan_rename_changes_the_member_etag(client, member, plan):
+    path = f"/members/{member['ID']}"
+    etag = client.get(path, params={"expand": "plan"}).headers["etag"]
+    assert client.get(path, params={"expand": "plan"}, headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.patch(f"/plans/{plan['ID']}", json={"name": f"Renamed {plan['name']}"}).status_code == 200
+    response = client.get(path, params={"expand": "plan"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["plan"]["name"] == f"Renamed {plan['name']}"
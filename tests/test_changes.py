@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from sql_app import changes, crud, database
+
+
+def _last_seq():
+    with database.new_session() as db:
+        return crud.get_last_change_seq(db)
+
+
+def test_pages_resume_after_last_seq(client, plan, member):
+    since = _last_seq()
+    assert client.get("/changes", params={"since": since}).status_code == 204
+
+    updated = client.patch(f"/members/{member['ID']}", json={"first_name": "Maria"})
+    deleted = client.delete(f"/members/{member['ID']}")
+    assert (updated.status_code, deleted.status_code) == (200, 200)
+
+    first = client.get("/changes", params={"since": since, "limit": 1}).json()
+    second = client.get("/changes", params={"since": first["last_seq"], "limit": 1}).json()
+    seen = [(change["table_name"], change["row_id"], change["operation"])
+            for change in first["items"] + second["items"]]
+    assert seen == [("members", member["ID"], "updated"), ("members", member["ID"], "deleted")]
+    assert second["last_seq"] > first["last_seq"] > since
+    assert client.get("/changes", params={"since": second["last_seq"]}).status_code == 204
+
+
+async def _read_changes(since, limit):
+    with database.new_session() as db:
+        return crud.get_changes(db, since, limit)
+
+
+def _parse(event: bytes):
+    fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\n"))
+    return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+def test_stream_sends_each_change_once(client, plan):
+    since = _last_seq()
+
+    async def next_events():
+        events = changes.stream(_read_changes, since, poll_interval=0.01)
+        try:
+            first = await anext(events)
+            # A write made while the stream waits is picked up by its polling
+            response = await asyncio.to_thread(client.patch, f"/plans/{plan['ID']}", json={"value": 50.0})
+            assert response.status_code == 200
+            return first, await anext(events)
+        finally:
+            await events.aclose()
+
+    created = client.post("/members", json={"email": f"streamed.{plan['ID']}@trembo.com", "plan_id": plan["ID"]})
+    first, second = asyncio.run(next_events())
+
+    seq, event, data = _parse(first)
+    assert (event, data["table_name"], data["row_id"], data["operation"]) == (
+        "change", "members", created.json()["ID"], "created")
+    assert seq == data["seq"] > since
+    seq2, _, data = _parse(second)
+    assert (data["table_name"], data["row_id"], data["operation"]) == ("plans", plan["ID"], "updated")
+    assert seq2 > seq
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+
+import pytest
+
+from sql_app import crud, export
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Several partitions per export even on a small table
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+
+
+def test_ndjson_has_one_member_per_line(client, member, small_chunks):
+    response = client.get("/members/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    ids = [row["ID"] for row in rows]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert next(row for row in rows if row["ID"] == member["ID"]) == member
+
+
+def test_csv_has_a_header_and_every_member(client, member, small_chunks):
+    ndjson = client.get("/members/export").text.splitlines()
+    response = client.get("/members/export", params={"format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert sorted(header) == sorted(crud.MEMBER_FIELDS)
+    assert len(rows) == len(ndjson)
+    assert [str(member[field]) for field in header] in rows
+
+
+def test_gzip_sends_the_same_rows_compressed(client, plan, small_chunks):
+    plain = client.get("/plans/export")
+    compressed = client.get("/plans/export", params={"gzip": True})
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    # The test client inflates the body as any HTTP client would
+    assert compressed.text == plain.text
+    assert json.loads(plain.text.splitlines()[-1]) == plan
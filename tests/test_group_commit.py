@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from sql_app import admission, crud, database, group_commit, models, schemas
+from sql_app.main import app
+
+_names = itertools.count(1)
+_emails = (f"grouped{i}@trembo.com" for i in _names)
+MISSING_PLAN = 999_999
+
+
+def _snapshot(*plan_ids):
+    with database.new_session() as db:
+        return {
+            "version": crud.get_table_version(db, models.Member.__tablename__),
+            "counts": {plan_id: db.scalar(select(models.PlanStats.member_count)
+                                          .where(models.PlanStats.plan_id == plan_id)) for plan_id in plan_ids},
+            "members": db.scalar(select(func.count()).select_from(models.Member)),
+            "last_seq": db.scalar(select(func.max(models.Change.seq))) or 0,
+        }
+
+
+def _changes_after(seq: int):
+    with database.new_session() as db:
+        return [(change.operation, change.row_id) for change in crud.get_changes(db, seq)
+                if change.table_name == models.Member.__tablename__]
+
+
+@pytest.fixture
+def other_plan(client):
+    response = client.post("/plans", json={"name": f"Grouped {next(_names)}", "value": 20.0})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_failed_writes_are_undone_alone(client, plan, other_plan, member):
+    before = _snapshot(plan["ID"], other_plan["ID"])
+    new_email, missing_plan_email = next(_emails), next(_emails)
+    writes = [
+        (schemas.ChangeOperation.created, (schemas.MemberCreate(email=new_email, plan_id=plan["ID"]),)),
+        (schemas.ChangeOperation.created, (schemas.MemberCreate(email=member["email"], plan_id=plan["ID"]),)),
+        (schemas.ChangeOperation.updated, (schemas.MemberUpdate(email=member["email"], plan_id=other_plan["ID"]),
+                                           member["ID"])),
+        (schemas.ChangeOperation.created, (schemas.MemberCreate(email=missing_plan_email, plan_id=MISSING_PLAN),)),
+        (schemas.ChangeOperation.created, (schemas.MemberCreate(email=new_email, plan_id=other_plan["ID"]),)),
+    ]
+    with database.new_session() as db:
+        results = crud.write_members(db, writes)
+
+    # One result per write, in order, each write's error its own
+    assert results[0].email == new_email
+    assert isinstance(results[1], IntegrityError) and not crud.is_foreign_key_violation(results[1])
+    assert results[2].ID == member["ID"] and results[2].plan_id == other_plan["ID"]
+    assert isinstance(results[3], IntegrityError) and crud.is_foreign_key_violation(results[3])
+    # The first write with an email wins within a batch too
+    assert isinstance(results[4], IntegrityError) and not crud.is_foreign_key_violation(results[4])
+
+    after = _snapshot(plan["ID"], other_plan["ID"])
+    assert after["members"] == before["members"] + 1
+    assert after["version"] == before["version"] + 1
+    # The new member joined plan, the updated one moved from plan to other_plan
+    assert after["counts"][plan["ID"]] == before["counts"][plan["ID"]]
+    assert after["counts"][other_plan["ID"]] == (before["counts"][other_plan["ID"]] or 0) + 1
+    assert _changes_after(before["last_seq"]) == [("created", results[0].ID), ("updated", member["ID"])]
+
+
+def test_interrupted_batch_leaves_nothing(client, plan, member, monkeypatch):
+    before = _snapshot(plan["ID"])
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("worker killed")
+
+    # Fails after every write and the counters ran, before the commit
+    monkeypatch.setattr(crud, "log_changes", crash)
+    writes = [
+        (schemas.ChangeOperation.created, (schemas.MemberCreate(email=next(_emails), plan_id=plan["ID"]),)),
+        (schemas.ChangeOperation.updated, (schemas.MemberUpdate(email=next(_emails), plan_id=plan["ID"]),
+                                           member["ID"])),
+    ]
+    with pytest.raises(RuntimeError):
+        with database.new_session() as db:
+            crud.write_members(db, writes)
+
+    assert _snapshot(plan["ID"]) == before
+    assert client.get(f"/members/{member['ID']}").json()["email"] == member["email"]
+
+
+def test_concurrent_callers_get_their_own_results(client, plan, member, monkeypatch):
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT", True)
+    committer = group_commit.GroupCommitter(max_delay=0.2, max_batch=100)
+    monkeypatch.setattr(group_commit, "committer", committer)
+    monkeypatch.setattr(admission, "writes", admission.Gate("write", 100, 100, 5.0))
+    batches = []
+    write_members = crud.write_members
+
+    def recorded_write_members(db, writes):
+        batches.append(len(writes))
+        return write_members(db, writes)
+
+    monkeypatch.setattr(crud, "write_members", recorded_write_members)
+    before = _snapshot(plan["ID"])
+    bodies = [{"email": next(_emails), "plan_id": plan["ID"]} for _ in range(10)]
+    bodies[3] = {"email": member["email"], "plan_id": plan["ID"]}
+
+    async def create_members():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            responses = await asyncio.gather(*(http.post("/members", json=body) for body in bodies))
+        await committer.close()
+        return responses
+
+    responses = asyncio.run(create_members())
+    # Every caller's response is its own write's, in whatever order the queue got them
+    assert batches == [10]
+    for index, (body, response) in enumerate(zip(bodies, responses)):
+        if index == 3:
+            assert (response.status_code, response.json()["detail"]) == (409, "Member already exists")
+        else:
+            assert response.status_code == 201
+            assert response.json()["email"] == body["email"]
+
+    after = _snapshot(plan["ID"])
+    assert after["counts"][plan["ID"]] == before["counts"][plan["ID"]] + 9
+    assert after["version"] == before["version"] + 1
+    created = {response.json()["ID"] for response in responses if response.status_code == 201}
+    assert _changes_after(before["last_seq"]) == [("created", member_id) for member_id in sorted(created)]
@@ -0,0 +1,16 @@
+def _counter(client, line_start: str):
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_failed_statement_is_counted(client, member):
+    errors = 'db_statement_errors_total{method="POST",route="/members"}'
+    before = _counter(client, errors)
+    response = client.post("/members", json={"email": member["email"], "plan_id": member["plan_id"]})
+    assert response.status_code == 409
+    # The INSERT that broke the unique key is the request's only statement, after SQLite's BEGIN
+    assert response.headers["x-db-queries"] == "2"
+    assert _counter(client, errors) == before + 1
+
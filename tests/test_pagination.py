@@ -0,0 +1,50 @@
+import base64
+
+import pytest
+
+from sql_app import pagination
+
+
+@pytest.fixture
+def plan_members(client, plan):
+    response = client.post("/members/bulk", json=[{"email": f"page{i}.{plan['ID']}@trembo.com", "plan_id": plan["ID"]}
+                                                  for i in range(5)])
+    assert response.json()["created"] == 5
+    return [result["ID"] for result in response.json()["results"]]
+
+
+def test_cursor_round_trip():
+    assert pagination.decode_cursor(pagination.encode_cursor(12345)) == 12345
+    assert pagination.decode_cursor(None) is None
+
+
+def test_pages_follow_the_cursor(client, plan, plan_members):
+    seen, cursor = [], None
+    while True:
+        response = client.get(f"/plans/{plan['ID']}/members", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen += [member["ID"] for member in page["items"]]
+        cursor = page.get("next_cursor")
+        if cursor is None:
+            break
+    assert seen == sorted(plan_members)
+
+
+def test_cursor_starts_after_its_id(client, plan_members):
+    response = client.get("/members", params={"limit": 2, "cursor": pagination.encode_cursor(plan_members[1])})
+    assert [member["ID"] for member in response.json()["items"]] == plan_members[2:4]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"id:abc").decode(),
+    base64.urlsafe_b64encode(b"seq:5").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_tampered_cursor_is_refused(client, cursor):
+    for path in ("/members", "/plans", "/members/search?q=Jo"):
+        response = client.get(path, params={"cursor": cursor})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import delete, event, update
+from sqlalchemy.engine import make_url
+
+from sql_app import crud, database, models, plan_stats
+
+
+def test_reconcile_holds_off_writers_on_sqlite(client):
+    engine = database.get_engine()
+    attempts = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Between the count and the fix-up, another connection must not be able to write
+        if statement.startswith("DELETE FROM plan_stats"):
+            other = sqlite3.connect(make_url(database.SQLALCHEMY_DATABASE_URL).database, timeout=0.05,
+                                    isolation_level=None)
+            try:
+                with pytest.raises(sqlite3.OperationalError, match="locked"):
+                    other.execute("BEGIN IMMEDIATE")
+                attempts.append(statement)
+            finally:
+                other.close()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with database.new_read_session() as db:
+            crud.reconcile_plan_stats(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert attempts
+
+
+def test_reconcile_repairs_drifted_counters(client, member, capsys):
+    other = client.post("/plans", json={"name": f"Uncounted {member['ID']}", "value": 12.0}).json()
+    with database.new_session() as db:
+        db.execute(update(models.PlanStats).where(models.PlanStats.plan_id == member["plan_id"])
+                   .values(member_count=models.PlanStats.member_count + 5))
+        db.execute(delete(models.PlanStats).where(models.PlanStats.plan_id == other["ID"]))
+        db.commit()
+    assert _count(client, member["plan_id"]) == 6
+
+    assert plan_stats.main([]) == 1
+    assert set(capsys.readouterr().out.splitlines()) == {
+        f"plan {member['plan_id']}: counted 6, has 1 members",
+        f"plan {other['ID']}: counted nothing, has 0 members",
+    }
+    assert _count(client, member["plan_id"]) == 1
+    assert _count(client, other["ID"]) == 0
+    # Nothing is left to repair
+    assert plan_stats.main([]) == 0
+
+
+def _count(client, plan_id):
+    items = client.get("/plans/stats").json()["items"]
+    return next(item["member_count"] for item in items if item["plan_id"] == plan_id)
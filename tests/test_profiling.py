@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+import pytest
+
+from sql_app import profiling
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    return "s3cret"
+
+
+def test_profiles_are_refused_with_the_token_empty(client):
+    assert client.get("/profiles").status_code == 403
+    assert client.get("/profiles", headers={"X-Profile": ""}).status_code == 403
+
+
+def test_profiles_need_the_token(client, token, member):
+    assert client.get("/profiles").status_code == 403
+    assert client.get("/profiles", headers={"X-Profile": "wrong"}).status_code == 403
+
+    assert client.get(f"/members/{member['ID']}", headers={"X-Profile": token}).status_code == 200
+    response = client.get("/profiles", headers={"X-Profile": token})
+    assert response.status_code == 200
+    path = response.json()["items"][0]["path"]
+    assert path.startswith("GET_members_member_id/")
+    assert client.get(f"/profiles/{path}").status_code == 403
+    assert client.get(f"/profiles/{path}", headers={"X-Profile": token}).status_code == 200
+
+
+def test_profile_requests_are_not_profiled(client, token):
+    client.get("/profiles", headers={"X-Profile": token})
+    response = client.get("/profiles", headers={"X-Profile": token})
+    assert all(not item["route"].startswith("/profiles") for item in response.json()["items"])
+
+
+def test_pool_thread_counts_only_while_running_the_profiled_call():
+    async def main():
+        profile = profiling.Profile(asyncio.current_task())
+        token = profiling.current_profile.set(profile)
+        try:
+            thread_id, owned = await profiling.run_in_threadpool(
+                lambda: (threading.get_ident(), profile.owns(threading.get_ident())))
+        finally:
+            profiling.current_profile.reset(token)
+        return profile, thread_id, owned
+
+    profile, thread_id, owned = asyncio.run(main())
+    assert owned
+    assert not profile.owns(thread_id)
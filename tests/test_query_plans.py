@@ -0,0 +1,24 @@
+import functools
+
+from sqlalchemy import create_engine
+
+from benchmarks import explain, seed
+from sql_app import database
+
+PLANS = 20
+MEMBERS = 2000
+
+
+def test_no_unexpected_full_scans(tmp_path):
+    # Seeding needs empty tables, so the check gets a database of its own
+    engine = create_engine(f"sqlite:///{tmp_path / 'explain.db'}")
+    database.configure_sqlite(engine)
+    try:
+        seed.seed(engine, PLANS, MEMBERS)
+        report = explain.run(engine, functools.partial(database.SessionLocal, bind=engine), PLANS, MEMBERS)
+    finally:
+        engine.dispose()
+
+    assert all(check["statements"] for check in report.values())
+    regressions = {name: check for name, check in report.items() if check["regression"]}
+    assert not regressions, explain.format_report(regressions)
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import create_engine
+
+from sql_app import database, main, migrate
+
+
+@pytest.fixture
+def replica(client, tmp_path, monkeypatch):
+    """
+    An empty replica: whatever the primary wrote is missing from it, as if replication lagged forever.
+    """
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    migrate.upgrade(engine)
+    engine.dispose()
+    monkeypatch.setattr(database, "DATABASE_READER_URLS", [url])
+    monkeypatch.setattr(database, "_reader_engines", None)
+    monkeypatch.setattr(database, "_async_reader_engines", None)
+    try:
+        yield
+    finally:
+        for engine in database._reader_engines or []:
+            engine.dispose()
+        for engine in database._async_reader_engines or []:
+            client.portal.call(engine.dispose)
+        client.cookies.delete(main.PRIMARY_UNTIL_COOKIE)
+
+
+def test_writer_reads_its_own_writes(client, plan, replica):
+    created = client.post("/members", json={"email": f"sticky.{plan['ID']}@trembo.com", "plan_id": plan["ID"]})
+
+    assert created.status_code == 201
+    assert main.PRIMARY_UNTIL_COOKIE in created.cookies
+    assert client.get(f"/members/{created.json()['ID']}").status_code == 200
+    # Without the cookie the read goes to the replica, which has not seen the write
+    client.cookies.delete(main.PRIMARY_UNTIL_COOKIE)
+    assert client.get(f"/members/{created.json()['ID']}").status_code == 204
+
+
+def test_client_can_opt_out_of_sticking(client, plan, replica):
+    created = client.post("/members", json={"email": f"unsticky.{plan['ID']}@trembo.com", "plan_id": plan["ID"]},
+                          headers={"X-Stick-To-Primary": "0"})
+
+    assert created.status_code == 201
+    assert main.PRIMARY_UNTIL_COOKIE not in created.cookies
+    assert client.get(f"/members/{created.json()['ID']}").status_code == 204
+
+
+def test_expired_cookie_reads_from_the_replica(client, member, replica):
+    client.cookies.set(main.PRIMARY_UNTIL_COOKIE, "1")
+    assert client.get(f"/members/{member['ID']}").status_code == 204
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Session
+
+from sql_app import crud, models
+
+
+@pytest.fixture(scope="module")
+def named_members(client):
+    plan = client.post("/plans", json={"name": "Search", "value": 10.0}).json()
+    members = [{"first_name": "Luiz", "last_name": "Souza", "email": "luiz.souza9@trembo.com"},
+               {"first_name": "LUIZ", "last_name": "SOUZA", "email": "LUIZ.SOUZA9Z@trembo.com"}]
+    ids = []
+    for member in members:
+        response = client.post("/members", json={**member, "plan_id": plan["ID"]})
+        assert response.status_code == 201
+        ids.append(response.json()["ID"])
+    yield members
+    # The emails are fixed, and the suite runs once per database mode
+    for member_id in ids:
+        assert client.delete(f"/members/{member_id}").status_code == 200
+    assert client.delete(f"/plans/{plan['ID']}").status_code == 200
+
+
+@pytest.mark.parametrize("prefix, emails", [
+    ("Souz", ["luiz.souza9@trembo.com"]),
+    ("SOUZ", ["LUIZ.SOUZA9Z@trembo.com"]),
+    ("luiz.souza9", ["luiz.souza9@trembo.com"]),
+    ("LUIZ.SOUZA9Z", ["LUIZ.SOUZA9Z@trembo.com"]),
+    ("Souzb", []),
+])
+def test_prefix_ending_in_z_or_9(client, named_members, prefix, emails):
+    # SQLite compares binary, so the case must match
+    response = client.get("/members/search", params={"q": prefix})
+    found = [] if response.status_code == 204 else [member["email"] for member in response.json()["items"]]
+    assert found == emails
+
+
+def test_mysql_prefix_is_an_escaped_like():
+    # A range bound from the next code point breaks under case-insensitive collations, where '{' does not follow 'z'
+    db = Session(create_engine("mysql+pymysql://user@localhost/db"))
+    condition = crud._starts_with(db, models.Member.last_name, "50%_/z")
+    compiled = select(models.Member.ID).where(condition).compile(dialect=mysql.dialect())
+    assert "members.last_name LIKE %s ESCAPE '/'" in str(compiled)
+    assert list(compiled.params.values()) == ["50/%/_//z%"]
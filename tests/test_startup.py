@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, String, Table, create_engine, inspect, select
+
+from sql_app import database, migrate, models, warmup
+
+# The schema before the migrate command existed: members and plans only
+baseline = MetaData()
+Table("plans", baseline,
+      Column("ID", Integer, primary_key=True, index=True, autoincrement=True, nullable=False),
+      Column("name", String(20), unique=True, nullable=False),
+      Column("value", Float, nullable=False),
+      Column("description", String(200)))
+Table("members", baseline,
+      Column("ID", Integer, primary_key=True, index=True, autoincrement=True, nullable=False),
+      Column("first_name", String(20)),
+      Column("last_name", String(20)),
+      Column("email", String(50), unique=True, nullable=False),
+      Column("plan_id", Integer, ForeignKey("plans.ID"), nullable=False))
+
+
+@pytest.fixture
+def old_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    database.configure_sqlite(engine)
+    baseline.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(baseline.tables["plans"].insert(), [{"ID": 1, "name": "Gold", "value": 40.0},
+                                                               {"ID": 2, "name": "Silver", "value": 20.0}])
+        connection.execute(baseline.tables["members"].insert(),
+                           [{"email": f"old{i}@trembo.com", "plan_id": 1} for i in range(3)])
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def test_upgrade_brings_an_existing_database_up_to_date(old_engine):
+    steps = migrate.upgrade(old_engine)
+
+    assert "add column members.version" in steps
+    assert "create table plan_stats" in steps
+    assert "create index ix_members_plan_id_ID" in steps
+    assert migrate.pending(old_engine) == []
+    assert set(inspect(old_engine).get_table_names()) == set(models.Base.metadata.tables)
+    with database.SessionLocal(bind=old_engine) as db:
+        # Existing rows get the new column's default, and the new counters count them
+        assert set(db.scalars(select(models.Member.version))) == {1}
+        assert dict(db.execute(select(models.PlanStats.plan_id, models.PlanStats.member_count)).all()) == {1: 3, 2: 0}
+    # Running it again changes nothing
+    assert migrate.upgrade(old_engine) == []
+
+
+def test_check_lists_the_pending_steps(old_engine, monkeypatch, capsys):
+    monkeypatch.setattr(database, "get_engine", lambda: old_engine)
+
+    assert migrate.main(["--check"]) == 1
+    assert "create table plan_stats" in capsys.readouterr().out.splitlines()
+    assert migrate.main([]) == 0
+    assert migrate.main(["--check"]) == 0
+
+
+def test_not_ready_until_warmed_up(client, monkeypatch):
+    monkeypatch.setattr(warmup.state, "ready", False)
+    response = client.get("/health/ready")
+    assert response.status_code == 503 and response.json()["ready"] is False
+
+    monkeypatch.undo()
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True and response.json()["import_to_ready_seconds"] > 0
@@ -0,0 +1,128 @@
+"""
+Statements each endpoint sends, pinned so a change that adds a query per row, or a read before a write, fails here.
+
+Every write also sends BOOKKEEPING statements in its transaction: the table's version bump, the change log's
+version bump and the change log row. Plan reads are served by the plan catalog and send nothing.
+"""
+import pytest
+
+BOOKKEEPING = 3
+
+
+def test_get_member(client, statements, member):
+    with statements() as sent:
+        response = client.get(f"/members/{member['ID']}")
+    assert response.status_code == 200
+    assert len(sent) == 1
+
+
+def test_get_member_with_plan(client, statements, member):
+    with statements() as sent:
+        response = client.get(f"/members/{member['ID']}", params={"expand": "plan"})
+    assert response.status_code == 200
+    assert response.json()["plan"]["ID"] == member["plan_id"]
+    # The plan is joined, not loaded by a second query
+    assert len(sent) == 1
+
+
+def test_get_member_by_name(client, statements, member):
+    with statements() as sent:
+        response = client.get(f"/membersByName/{member['first_name']}/{member['last_name']}")
+    assert response.status_code == 200
+    assert len(sent) == 1
+
+
+@pytest.mark.parametrize("expand", [None, "plan"])
+def test_list_members(client, statements, member, expand):
+    params = {"limit": 50} if expand is None else {"limit": 50, "expand": expand}
+    with statements() as sent:
+        response = client.get("/members", params=params)
+    assert response.status_code == 200
+    # The members version for the ETag, then one query for the page whatever its size
+    assert len(sent) == 2
+
+
+def test_batch_get_members(client, statements, member):
+    with statements() as sent:
+        response = client.get("/members", params={"ids": f"{member['ID']},0"})
+    assert response.status_code == 200
+    assert len(sent) == 2
+
+
+def test_search_members(client, statements, member):
+    with statements() as sent:
+        response = client.get("/members/search", params={"q": "Trem"})
+    assert response.status_code == 200
+    assert len(sent) == 2
+
+
+def test_get_plan(client, statements, plan):
+    with statements() as sent:
+        response = client.get(f"/plans/{plan['ID']}")
+    assert response.status_code == 200
+    assert len(sent) == 0
+
+
+@pytest.mark.parametrize("expand", [None, "plan"])
+def test_plan_members(client, statements, member, expand):
+    params = {"limit": 50} if expand is None else {"limit": 50, "expand": expand}
+    with statements() as sent:
+        response = client.get(f"/plans/{member['plan_id']}/members", params=params)
+    assert response.status_code == 200
+    assert len(sent) == 2
+
+
+def test_create_member(client, statements, plan):
+    with statements() as sent:
+        response = client.post("/members", json={"email": f"create{plan['ID']}@trembo.com", "plan_id": plan["ID"]})
+    assert response.status_code == 201
+    # The INSERT, checked by the unique key and the foreign key, and the plan's member counter
+    assert len(sent) == 2 + BOOKKEEPING
+
+
+def test_update_member(client, statements, member, plan):
+    body = {"first_name": "Maria", "last_name": "Trembo", "email": member["email"], "plan_id": plan["ID"]}
+    with statements() as sent:
+        response = client.put(f"/members/{member['ID']}", json=body)
+    assert response.status_code == 200
+    # The counter move, which reads the old plan itself, and one UPDATE checked by its rowcount
+    assert len(sent) == 2 + BOOKKEEPING
+
+
+def test_patch_member(client, statements, member):
+    with statements() as sent:
+        response = client.patch(f"/members/{member['ID']}", json={"first_name": "Maria"})
+    assert response.status_code == 200
+    # The UPDATE and the new version for the ETag
+    assert len(sent) == 2 + BOOKKEEPING
+
+
+def test_delete_member(client, statements, member):
+    with statements() as sent:
+        response = client.delete(f"/members/{member['ID']}")
+    assert response.status_code == 200
+    # The member returned, the counter and the DELETE
+    assert len(sent) == 3 + BOOKKEEPING
+
+
+def test_update_plan(client, statements, plan):
+    with statements() as sent:
+        response = client.put(f"/plans/{plan['ID']}", json={"name": plan["name"], "value": 40.0})
+    assert response.status_code == 200
+    assert len(sent) == 1 + BOOKKEEPING
+
+
+def test_delete_plan(client, statements, plan):
+    with statements() as sent:
+        response = client.delete(f"/plans/{plan['ID']}")
+    assert response.status_code == 200
+    # One DELETE guarded by NOT EXISTS on members, and the plan's counter row
+    assert len(sent) == 2 + BOOKKEEPING
+
+
+def test_delete_plan_with_members(client, statements, member):
+    with statements() as sent:
+        response = client.delete(f"/plans/{member['plan_id']}")
+    assert response.status_code == 409
+    # The guarded DELETE matched nothing, one EXISTS probe tells a plan in use from a missing one
+    assert len(sent) == 2
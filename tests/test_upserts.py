@@ -0,0 +1,71 @@
+import itertools
+
+import pytest
+
+_names = itertools.count(1)
+MISSING_PLAN = 999_999
+
+
+def _email():
+    return f"upserted{next(_names)}@trembo.com"
+
+
+def _counts(client, *plan_ids):
+    items = {item["plan_id"]: item["member_count"] for item in client.get("/plans/stats").json()["items"]}
+    return [items[plan_id] for plan_id in plan_ids]
+
+
+@pytest.fixture
+def other_plan(client):
+    response = client.post("/plans", json={"name": f"Upsert {next(_names)}", "value": 20.0})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_upsert_creates_then_updates(client, plan, other_plan):
+    email = _email()
+    before = _counts(client, plan["ID"], other_plan["ID"])
+
+    created = client.put(f"/members/by-email/{email}", json={"first_name": "Joao", "plan_id": plan["ID"]})
+    assert created.status_code == 201
+    assert (created.json()["status"], created.json()["email"]) == ("created", email)
+    assert _counts(client, plan["ID"], other_plan["ID"]) == [before[0] + 1, before[1]]
+
+    updated = client.put(f"/members/by-email/{email}", json={"first_name": "Maria", "plan_id": other_plan["ID"]})
+    assert updated.status_code == 200
+    assert updated.json()["status"] == "updated"
+    assert updated.json()["ID"] == created.json()["ID"]
+    # The member moved plans, the counters follow it
+    assert _counts(client, plan["ID"], other_plan["ID"]) == [before[0], before[1] + 1]
+    member = client.get(f"/members/{created.json()['ID']}").json()
+    assert (member["first_name"], member["plan_id"]) == ("Maria", other_plan["ID"])
+
+
+def test_upsert_to_a_missing_plan_is_a_conflict(client):
+    response = client.put(f"/members/by-email/{_email()}", json={"plan_id": MISSING_PLAN})
+    assert (response.status_code, response.json()["detail"]) == (409, "Member's plan does not exist")
+
+
+def test_bulk_upsert_reports_each_row(client, plan, other_plan, member):
+    new, repeated = _email(), _email()
+    before = _counts(client, plan["ID"], other_plan["ID"])
+    rows = [
+        {"email": member["email"], "first_name": "Maria", "plan_id": other_plan["ID"]},
+        {"email": new, "plan_id": plan["ID"]},
+        {"email": repeated, "plan_id": plan["ID"]},
+        {"email": repeated, "plan_id": other_plan["ID"]},
+        {"email": _email(), "plan_id": MISSING_PLAN},
+    ]
+    response = client.put("/members/by-email", json=rows)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["created"], report["updated"], report["rejected"]) == (2, 1, 2)
+    results = report["results"]
+    assert [result["status"] for result in results] == ["updated", "created", "created", "rejected", "rejected"]
+    assert results[0]["ID"] == member["ID"]
+    assert results[3]["detail"] == "Email repeated in the body"
+    assert results[4]["detail"] == "Member's plan does not exist"
+    # Two members joined plan and one left it for other_plan
+    assert _counts(client, plan["ID"], other_plan["ID"]) == [before[0] + 1, before[1] + 1]
+    assert client.get(f"/members/{member['ID']}").json()["first_name"] == "Maria"